@@ -0,0 +1,179 @@
+import argparse
+import itertools
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from Chess import MoveFinder
+from Chess.ChessEngine import GameState
+from Chess.Pgn import moveToSAN, parseSAN
+from Chess.SelfPlay import parseEngine, selectEngine
+
+# Positions handed to the pool ahead of the results written, per worker; bounds memory on big suites
+QUEUED_PER_WORKER = 2
+# One EPD operation: opcode, then operands up to the ';' (quoted strings may contain ';')
+OPERATION_PATTERN = re.compile(r'\s*([A-Za-z][A-Za-z0-9_]*)((?:\s+(?:"[^"]*"|[^\s;"]+))*)\s*;?')
+
+
+def parseEPD(line):
+    # (FEN, operations) of an EPD line or a plain FEN line. operations maps each opcode
+    # to its list of operands, quotes removed: 'bm Qxf7+ Nd5; id "WAC.001";' ->
+    # {'bm': ['Qxf7+', 'Nd5'], 'id': ['WAC.001']}. hmvc/fmvn become the FEN move counters.
+    fields = line.split(None, 4)
+    rest = fields[4] if len(fields) > 4 else ''
+    counters = rest.split(None, 2)
+    if len(counters) >= 2 and counters[0].isdigit() and counters[1].isdigit():
+        # A full FEN, maybe followed by operations anyway
+        halfmove, fullmove = counters[0], counters[1]
+        rest = counters[2] if len(counters) > 2 else ''
+    else:
+        halfmove, fullmove = '0', '1'
+    operations = {}
+    position = 0
+    while position < len(rest):
+        match = OPERATION_PATTERN.match(rest, position)
+        if match is None or match.end() == position:
+            break
+        operations[match.group(1)] = [operand.strip('"') for operand in
+                                      re.findall(r'"[^"]*"|[^\s;"]+', match.group(2))]
+        position = match.end()
+    halfmove = operations.get('hmvc', [halfmove])[0]
+    fullmove = operations.get('fmvn', [fullmove])[0]
+    return ' '.join(fields[:4] + [halfmove, fullmove]), operations
+
+
+def readPositions(path):
+    # Yield (index, line) for every position in an EPD/FEN file, without reading it all in
+    with open(path) as f:
+        index = 0
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield index, line
+                index += 1
+
+
+def analyzePosition(index, line, engine):
+    # Search one position with the engine's limits and return its result record. Positions
+    # with bm/am operations are checked: the move must be one of bm and none of am. solvedTime
+    # and solvedDepth are when the search settled on a correct move for good.
+    startTime = time.time()
+    fen, operations = parseEPD(line)
+    gameState = GameState.fromFEN(fen)
+    validMoves = gameState.getValidMoves()
+    record = {'index': index, 'id': operations.get('id', [None])[0], 'fen': fen}
+    expected = {}
+    for opcode in ('bm', 'am'):
+        if opcode in operations:
+            moves = [parseSAN(gameState, san, validMoves) for san in operations[opcode]]
+            record[opcode] = operations[opcode]
+            expected[opcode] = {move.moveID for move in moves if move is not None}
+            if None in moves:
+                record['error'] = 'unparsable %s move in %s' % (opcode, ' '.join(operations[opcode]))
+    if len(validMoves) == 0:
+        record.update({'bestMove': None, 'error': 'no legal moves'})
+        return record
+
+    def correct(move):
+        if 'bm' in expected and move.moveID not in expected['bm']:
+            return False
+        return 'am' not in expected or move.moveID not in expected['am']
+
+    solvedAt = None
+
+    def onIteration(depth, score, bestMove):
+        nonlocal solvedAt
+        if not correct(bestMove):
+            solvedAt = None
+        elif solvedAt is None:
+            solvedAt = (time.time() - startTime, depth)
+
+    selectEngine(engine, gameState)
+    # Every position starts from empty tables, so results don't depend on the order positions ran in
+    MoveFinder.transpositionTable.clear()
+    MoveFinder.historyScores.clear()
+    maxDepth = engine['depth'] if engine['depth'] is not None else MoveFinder.MAX_PLY
+    bestMove = MoveFinder.findBestMove(gameState, validMoves, maxDepth=maxDepth, timeLimit=engine['time'],
+                                       nodeLimit=engine['nodes'], onIteration=onIteration)
+    record.update({'bestMove': moveToSAN(gameState, bestMove, validMoves), 'uci': bestMove.getChessNotation(),
+                   'score': MoveFinder.searchScore, 'depth': MoveFinder.depthReached,
+                   'nodes': MoveFinder.nodesSearched + MoveFinder.quiescenceNodes, 'time': time.time() - startTime})
+    if expected:
+        record['solved'] = correct(bestMove)
+        if record['solved'] and solvedAt is not None:
+            record['solvedTime'], record['solvedDepth'] = solvedAt
+    return record
+
+
+def runSuite(path, engine, workers=None, jsonlPath=None, limit=None):
+    # Analyze every position of an EPD/FEN file across worker processes, writing each result to
+    # the JSONL file as it finishes (in finishing order; 'index' gives the file order). Only a few
+    # positions per worker are queued at a time. Returns the summary dict printed at the end.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    jsonlFile = open(jsonlPath, 'w') if jsonlPath else None
+    summary = {'positions': 0, 'checked': 0, 'solved': 0, 'nodes': 0, 'time': 0.0, 'solvedTime': 0.0}
+    startTime = time.time()
+    positions = readPositions(path)
+    if limit is not None:
+        positions = itertools.islice(positions, limit)
+
+    def record(result):
+        if jsonlFile is not None:
+            jsonlFile.write(json.dumps(result) + '\n')
+            jsonlFile.flush()
+        summary['positions'] += 1
+        summary['nodes'] += result.get('nodes', 0)
+        summary['time'] += result.get('time', 0.0)
+        if 'solved' in result:
+            summary['checked'] += 1
+            if result['solved']:
+                summary['solved'] += 1
+                summary['solvedTime'] += result.get('solvedTime', 0.0)
+        line = '%d: %s %s' % (result['index'], result['id'] or result['fen'], result.get('bestMove'))
+        if 'solved' in result:
+            line += '  %s  solved %d/%d' % ('ok' if result['solved'] else 'FAIL', summary['solved'], summary['checked'])
+        if 'error' in result:
+            line += '  (%s)' % result['error']
+        print(line)
+
+    try:
+        if workers <= 1:
+            for index, line in positions:
+                record(analyzePosition(index, line, engine))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = set()
+                for index, line in positions:
+                    pending.add(pool.submit(analyzePosition, index, line, engine))
+                    if len(pending) >= workers * QUEUED_PER_WORKER:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            record(future.result())
+                for future in as_completed(pending):
+                    record(future.result())
+    finally:
+        if jsonlFile is not None:
+            jsonlFile.close()
+    summary['wallTime'] = time.time() - startTime
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search every position of an EPD/FEN file')
+    parser.add_argument('positions', help='EPD or FEN file, one position per line')
+    parser.add_argument('--engine', default='', help='search limits and options, e.g. depth=6 or time=1,hash=64')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--jsonl', help='write one JSON result per position to this file')
+    parser.add_argument('--limit', type=int, help='only the first LIMIT positions')
+    args = parser.parse_args()
+    summary = runSuite(args.positions, parseEngine(args.engine, 'engine'), args.workers, args.jsonl, args.limit)
+    line = '%d positions in %.1fs, %d nodes' % (summary['positions'], summary['wallTime'], summary['nodes'])
+    if summary['checked']:
+        line += ', solved %d/%d (%.1f%%)' % (summary['solved'], summary['checked'],
+                                             100.0 * summary['solved'] / summary['checked'])
+        if summary['solved']:
+            line += ', mean time to solution %.2fs' % (summary['solvedTime'] / summary['solved'])
+    print(line)
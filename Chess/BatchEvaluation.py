@@ -0,0 +1,91 @@
+import random
+import time
+
+import numpy as np
+
+from Chess import Evaluation
+
+# Plane order of the (N, 12, 64) piece arrays; squares are row * 8 + col as in GameState.board
+PLANE_PIECES = ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')
+PLANE_INDEX = {piece: i for i, piece in enumerate(PLANE_PIECES)}
+
+
+def _planeLookup():
+    # Plane index by the two bytes of a piece code ('wp' -> 0); empty squares map past the last plane
+    lookup = np.full((256, 256), len(PLANE_PIECES), dtype=np.uint8)
+    for piece, index in PLANE_INDEX.items():
+        lookup[ord(piece[0]), ord(piece[1])] = index
+    return lookup
+
+
+PLANE_LOOKUP = _planeLookup()
+PLANE_NUMBERS = np.arange(len(PLANE_PIECES), dtype=np.uint8).reshape(1, len(PLANE_PIECES), 1)
+CHECKMATE = 1000
+STALEMATE = 0
+
+
+def weightPlanes():
+    # (12, 64) weights: material plus piece-square bonus, positive for white and
+    # negative for black, read from Evaluation's current tables
+    weights = np.zeros((len(PLANE_PIECES), 64))
+    for i, piece in enumerate(PLANE_PIECES):
+        sign = 1.0 if piece[0] == 'w' else -1.0
+        weights[i] = sign * (Evaluation.piece_score[piece[1]] + np.asarray(Evaluation.position_scores[piece]))
+    return weights
+
+
+def encodePlanes(gameStates):
+    # The boards are joined into one string of two-character piece codes, read as bytes and
+    # turned into plane indices by a lookup table, so no Python loop runs per square
+    text = ''.join([''.join(map(''.join, gameState.board)) for gameState in gameStates]).encode('ascii')
+    codes = np.frombuffer(text, dtype=np.uint8).reshape(len(gameStates), 64, 2)
+    indices = PLANE_LOOKUP[codes[:, :, 0], codes[:, :, 1]]
+    return (indices[:, np.newaxis, :] == PLANE_NUMBERS).astype(np.uint8)
+
+
+def scorePlanes(planes, weights=None):
+    # Static scores of many positions in one call; same terms as MoveFinder.scoreBoard
+    if weights is None:
+        weights = weightPlanes()
+    planes = np.asarray(planes).reshape(len(planes), len(PLANE_PIECES), 64)
+    return np.einsum('npq,pq->n', planes, weights, dtype=np.float64)
+
+
+def scoreGameStates(gameStates, weights=None):
+    # Like scorePlanes, but honours the checkmate/stalemate flags scoreBoard looks at
+    scores = scorePlanes(encodePlanes(gameStates), weights)
+    for n, gameState in enumerate(gameStates):
+        if gameState.checkMate:
+            scores[n] = -CHECKMATE if gameState.whiteToMove else CHECKMATE
+        elif gameState.staleMate:
+            scores[n] = STALEMATE
+    return scores
+
+
+if __name__ == '__main__':
+    # Parity and throughput check against scoreBoard on positions from random games
+    from Chess.ChessEngine import GameState
+    from Chess import MoveFinder
+    expected = []
+    planes = []
+    for game in range(20):
+        gs = GameState()
+        for ply in range(80):
+            validMoves = gs.getValidMoves()
+            expected.append(MoveFinder.scoreBoard(gs))
+            planes.append(encodePlanes([gs])[0])
+            if len(validMoves) == 0:
+                break
+            gs.makeMove(random.choice(validMoves))
+    planes = np.stack(planes)
+    weights = weightPlanes()
+    batchScores = scorePlanes(planes, weights)
+    expected = np.array(expected)
+    # Planes carry no checkmate/stalemate flags, so terminal positions are left out
+    mismatches = np.flatnonzero(~np.isclose(batchScores, expected) & (np.abs(expected) != CHECKMATE))
+    print('positions:', len(planes), 'mismatches:', len(mismatches))
+    batch = np.repeat(planes, max(1, 200000 // len(planes)), axis=0)
+    start = time.time()
+    scorePlanes(batch, weights)
+    elapsed = time.time() - start
+    print('batch of %d scored in %.3fs (%.0f positions/s)' % (len(batch), elapsed, len(batch) / elapsed))
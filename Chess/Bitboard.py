@@ -0,0 +1,325 @@
+from Chess.ChessEngine import GameState, Move, MOVE_SQUARES, ENPASSANT_FLAG, CASTLE_FLAG, PROMOTION_FLAG, PROMOTION_PIECES
+
+# Squares are numbered row * 8 + col, the same layout as GameState.board
+# (square 0 is a8, square 63 is h1). Every set of squares is a 64-bit int.
+PIECES = ('wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK')
+FULL_BOARD = (1 << 64) - 1
+
+KNIGHT_DIRECTIONS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_DIRECTIONS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def squareBit(row, col):
+    return 1 << (row * 8 + col)
+
+
+def iterateBits(bitboard):
+    # Yield the square index of every set bit, lowest first
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+def _stepAttacks(directions):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        for dRow, dCol in directions:
+            endRow, endCol = row + dRow, col + dCol
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                mask |= squareBit(endRow, endCol)
+        table.append(mask)
+    return table
+
+
+def _rays():
+    rays = {}
+    for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+        table = []
+        for sq in range(64):
+            row, col = divmod(sq, 8)
+            mask = 0
+            for i in range(1, 8):
+                endRow, endCol = row + direction[0] * i, col + direction[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                mask |= squareBit(endRow, endCol)
+            table.append(mask)
+        rays[direction] = table
+    return rays
+
+
+KNIGHT_ATTACKS = _stepAttacks(KNIGHT_DIRECTIONS)
+KING_ATTACKS = _stepAttacks(KING_DIRECTIONS)
+# PAWN_ATTACKS[color][sq]: squares a pawn of that color on sq attacks
+PAWN_ATTACKS = {'w': _stepAttacks(((-1, -1), (-1, 1))), 'b': _stepAttacks(((1, -1), (1, 1)))}
+RAYS = _rays()
+# Rays going towards higher square numbers stop at their lowest blocker,
+# rays going towards lower square numbers stop at their highest blocker.
+POSITIVE_DIRECTIONS = tuple(d for d in RAYS if d[0] * 8 + d[1] > 0)
+
+
+def _slidingAttacks(sq, occupied, directions):
+    attacks = 0
+    for direction in directions:
+        ray = RAYS[direction][sq]
+        blockers = ray & occupied
+        if blockers:
+            if direction in POSITIVE_DIRECTIONS:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= RAYS[direction][blocker]
+        attacks |= ray
+    return attacks
+
+
+# (ray table, whether the ray runs towards higher squares, whether rooks or bishops move along it)
+# for each of the eight lines out of a square; the check and pin scan walks these from the king
+LINES = tuple((RAYS[direction], direction in POSITIVE_DIRECTIONS, direction in ROOK_DIRECTIONS)
+              for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS)
+# Promotion flags, one move per piece a pawn can promote to
+PROMOTION_CODES = tuple((PROMOTION_FLAG + i) << 12 for i in range(len(PROMOTION_PIECES)))
+BACK_RANKS = 0xFF | 0xFF << 56
+
+
+def newMove(code, pieceMoved, pieceCaptured):
+    # A Move straight from its packed code, without Move.__init__ working it out from squares
+    move = Move.__new__(Move)
+    move.code = code
+    move.pieceMoved = pieceMoved
+    move.pieceCaptured = pieceCaptured
+    return move
+
+
+def rookAttacks(sq, occupied):
+    return _slidingAttacks(sq, occupied, ROOK_DIRECTIONS)
+
+
+def bishopAttacks(sq, occupied):
+    return _slidingAttacks(sq, occupied, BISHOP_DIRECTIONS)
+
+
+def queenAttacks(sq, occupied):
+    return _slidingAttacks(sq, occupied, ROOK_DIRECTIONS + BISHOP_DIRECTIONS)
+
+
+class BitboardGameState(GameState):
+    # Same API as GameState, but legal moves and attack tests are worked out on bitboards
+    # kept in sync with self.board by makeMove/undoMove: checks and pins come from rays out
+    # of the king, and every piece's targets are masked with them, so no move is played to
+    # test it and the 8x8 board is only read to name the pieces of a move.
+    def resetDerivedState(self):
+        super().resetDerivedState()
+        self.initBitboards()
+
+    def initBitboards(self):
+        self.pieceBitboards = {piece: 0 for piece in PIECES}
+        self.colorBitboards = {'w': 0, 'b': 0}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != '--':
+                    self.pieceBitboards[piece] |= squareBit(row, col)
+                    self.colorBitboards[piece[0]] |= squareBit(row, col)
+        self.occupied = self.colorBitboards['w'] | self.colorBitboards['b']
+
+    def togglePiece(self, piece, row, col):
+        bit = squareBit(row, col)
+        self.pieceBitboards[piece] ^= bit
+        self.colorBitboards[piece[0]] ^= bit
+        self.occupied ^= bit
+
+    def toggleMove(self, move, pieceLanded):
+        # XOR is its own inverse, so the same toggles make and unmake a move
+        code = move.code
+        startBit = 1 << (code & 63)
+        endBit = 1 << (code >> 6 & 63)
+        flags = code >> 12
+        pieces = self.pieceBitboards
+        colors = self.colorBitboards
+        color = move.pieceMoved[0]
+        pieces[move.pieceMoved] ^= startBit
+        pieces[pieceLanded] ^= endBit
+        colors[color] ^= startBit | endBit
+        if flags == ENPASSANT_FLAG:
+            # The captured pawn is beside the start square, on the end square's file
+            capturedBit = 1 << ((code & 63) - (code & 7) + (code >> 6 & 7))
+            pieces[move.pieceCaptured] ^= capturedBit
+            colors[move.pieceCaptured[0]] ^= capturedBit
+        elif move.pieceCaptured != '--':
+            pieces[move.pieceCaptured] ^= endBit
+            colors[move.pieceCaptured[0]] ^= endBit
+        elif flags == CASTLE_FLAG:
+            # Kingside the rook goes from the corner beside endBit to the square before it;
+            # queenside from two squares past endBit to the square after it
+            if endBit > startBit:
+                rookBits = endBit << 1 | endBit >> 1
+            else:
+                rookBits = endBit >> 2 | endBit << 1
+            pieces[color + 'R'] ^= rookBits
+            colors[color] ^= rookBits
+        self.occupied = colors['w'] | colors['b']
+
+    def makeMove(self, move):
+        super().makeMove(move)
+        self.toggleMove(move, self.board[move.code >> 9 & 7][move.code >> 6 & 7])
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            pieceLanded = self.board[move.code >> 9 & 7][move.code >> 6 & 7]
+            super().undoMove()
+            self.toggleMove(move, pieceLanded)
+
+    def attacked(self, sq, occupied, enemy):
+        # Whether enemy attacks sq, with occupied as the blockers
+        pieces = self.pieceBitboards
+        ally = 'b' if enemy == 'w' else 'w'
+        return bool(KNIGHT_ATTACKS[sq] & pieces[enemy + 'N'] or
+                    PAWN_ATTACKS[ally][sq] & pieces[enemy + 'p'] or
+                    KING_ATTACKS[sq] & pieces[enemy + 'K'] or
+                    bishopAttacks(sq, occupied) & (pieces[enemy + 'B'] | pieces[enemy + 'Q']) or
+                    rookAttacks(sq, occupied) & (pieces[enemy + 'R'] | pieces[enemy + 'Q']))
+
+    def squareUnderAttack(self, row, col, ignoreSquare=None):
+        # Attacked by the opponent of the side to move, treating ignoreSquare as empty
+        occupied = self.occupied
+        if ignoreSquare is not None:
+            occupied &= ~squareBit(*ignoreSquare)
+        return self.attacked(row * 8 + col, occupied, 'b' if self.whiteToMove else 'w')
+
+    def checksAndPins(self, kingSq, ally, enemy):
+        # (number of checkers, squares a non-king move must land on, {pinned square: squares it
+        # may move to}). The landing squares are everything when not in check, and the checker
+        # plus the squares between it and the king when in check once.
+        pieces = self.pieceBitboards
+        occupied = self.occupied
+        allies = self.colorBitboards[ally]
+        rookLike = pieces[enemy + 'R'] | pieces[enemy + 'Q']
+        bishopLike = pieces[enemy + 'B'] | pieces[enemy + 'Q']
+        checkers = 0
+        checkMask = 0
+        pins = {}
+        for rays, positive, rookLine in LINES:
+            ray = rays[kingSq]
+            blockers = ray & occupied
+            if not blockers:
+                continue
+            first = blockers & -blockers if positive else 1 << (blockers.bit_length() - 1)
+            sliders = rookLike if rookLine else bishopLike
+            if first & sliders:
+                checkers += 1
+                checkMask |= ray ^ rays[first.bit_length() - 1]
+            elif first & allies:
+                rest = blockers ^ first
+                if rest:
+                    second = rest & -rest if positive else 1 << (rest.bit_length() - 1)
+                    if second & sliders:
+                        pins[first.bit_length() - 1] = ray ^ rays[second.bit_length() - 1]
+        for attackers in (KNIGHT_ATTACKS[kingSq] & pieces[enemy + 'N'], PAWN_ATTACKS[ally][kingSq] & pieces[enemy + 'p']):
+            if attackers:
+                checkers += bin(attackers).count('1')
+                checkMask |= attackers
+        return checkers, checkMask if checkers else FULL_BOARD, pins
+
+    def generateValidMoves(self):
+        ally = 'w' if self.whiteToMove else 'b'
+        enemy = 'b' if self.whiteToMove else 'w'
+        board = self.board
+        pieces = self.pieceBitboards
+        occupied = self.occupied
+        allies = self.colorBitboards[ally]
+        kingBit = pieces[ally + 'K']
+        kingSq = kingBit.bit_length() - 1
+        checkers, checkMask, pins = self.checksAndPins(kingSq, ally, enemy)
+        moves = []
+
+        # The king: its own square must not block attacks along the line it leaves
+        withoutKing = occupied ^ kingBit
+        king = ally + 'K'
+        for endSq in iterateBits(KING_ATTACKS[kingSq] & ~allies):
+            if not self.attacked(endSq, withoutKing, enemy):
+                moves.append(newMove(kingSq | endSq << 6, king, board[endSq >> 3][endSq & 7]))
+        if checkers == 0:
+            self.addCastleMoves(kingSq, ally, enemy, moves)
+        if checkers > 1:
+            # Double check: only the king can move
+            self.checkMate = len(moves) == 0
+            self.staleMate = False
+            return moves
+
+        targets = ~allies & checkMask
+        for pieceType, attacks in (('N', None), ('B', bishopAttacks), ('R', rookAttacks), ('Q', queenAttacks)):
+            piece = ally + pieceType
+            for startSq in iterateBits(pieces[piece]):
+                reachable = (KNIGHT_ATTACKS[startSq] if attacks is None else attacks(startSq, occupied)) & targets
+                if startSq in pins:
+                    reachable &= pins[startSq]
+                for endSq in iterateBits(reachable):
+                    moves.append(newMove(startSq | endSq << 6, piece, board[endSq >> 3][endSq & 7]))
+        self.addPawnMoves(ally, enemy, kingSq, checkMask, pins, moves)
+
+        inCheck = checkers > 0
+        self.checkMate = len(moves) == 0 and inCheck
+        self.staleMate = len(moves) == 0 and not inCheck
+        return moves
+
+    def addPawnMoves(self, ally, enemy, kingSq, checkMask, pins, moves):
+        board = self.board
+        occupied = self.occupied
+        enemies = self.colorBitboards[enemy]
+        pawn = ally + 'p'
+        # Squares are numbered from a8, so white pawns move towards lower squares
+        step = -8 if ally == 'w' else 8
+        startRank = 0xFF << 48 if ally == 'w' else 0xFF << 8
+        enpassantSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1] if self.enpassantPossible != () else -1
+        for startSq in iterateBits(self.pieceBitboards[pawn]):
+            startBit = 1 << startSq
+            reachable = PAWN_ATTACKS[ally][startSq] & enemies
+            pushSq = startSq + step
+            if not (occupied >> pushSq) & 1:
+                reachable |= 1 << pushSq
+                if startBit & startRank and not (occupied >> (pushSq + step)) & 1:
+                    reachable |= 1 << (pushSq + step)
+            reachable &= checkMask
+            if startSq in pins:
+                reachable &= pins[startSq]
+            for endSq in iterateBits(reachable):
+                captured = board[endSq >> 3][endSq & 7]
+                if (1 << endSq) & BACK_RANKS:
+                    for flags in PROMOTION_CODES:
+                        moves.append(newMove(startSq | endSq << 6 | flags, pawn, captured))
+                else:
+                    moves.append(newMove(startSq | endSq << 6, pawn, captured))
+            if enpassantSq >= 0 and PAWN_ATTACKS[ally][startSq] >> enpassantSq & 1:
+                # The captured pawn is behind the en passant square. Taking it removes two pawns
+                # from one rank, which can uncover an attack no single pin describes, so test
+                # the sliders against the board as it would be after the capture.
+                capturedSq = enpassantSq - step
+                if not checkMask & (1 << enpassantSq | 1 << capturedSq):
+                    continue
+                after = occupied ^ startBit ^ 1 << enpassantSq ^ 1 << capturedSq
+                pieces = self.pieceBitboards
+                if bishopAttacks(kingSq, after) & (pieces[enemy + 'B'] | pieces[enemy + 'Q']) or \
+                        rookAttacks(kingSq, after) & (pieces[enemy + 'R'] | pieces[enemy + 'Q']):
+                    continue
+                moves.append(newMove(startSq | enpassantSq << 6 | ENPASSANT_FLAG << 12, pawn, enemy + 'p'))
+
+    def addCastleMoves(self, kingSq, ally, enemy, moves):
+        # Only called when not in check: the squares between king and rook must be empty
+        # and the squares the king passes over and lands on not attacked
+        rights = self.currentCastlingRight
+        kingside, queenside = (rights.wks, rights.wqs) if ally == 'w' else (rights.bks, rights.bqs)
+        occupied = self.occupied
+        king = ally + 'K'
+        if kingside and not occupied & (3 << (kingSq + 1)) and \
+                not self.attacked(kingSq + 1, occupied, enemy) and not self.attacked(kingSq + 2, occupied, enemy):
+            moves.append(newMove(kingSq | (kingSq + 2) << 6 | CASTLE_FLAG << 12, king, '--'))
+        if queenside and not occupied & (7 << (kingSq - 3)) and \
+                not self.attacked(kingSq - 1, occupied, enemy) and not self.attacked(kingSq - 2, occupied, enemy):
+            moves.append(newMove(kingSq | (kingSq - 2) << 6 | CASTLE_FLAG << 12, king, '--'))
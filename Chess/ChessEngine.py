@@ -1,4 +1,9 @@
-from Chess.ChessMain import DIMENSION
+from Chess.Zobrist import PIECE_KEYS, SIDE_KEY, CASTLE_KEYS, ENPASSANT_KEYS, computeKey
+from Chess.Evaluation import piece_score, position_scores, computeScores
+
+# The engine doesn't depend on the GUI (or pygame); ChessMain takes the board size from here
+DIMENSION = 8
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
 
 
 class GameState:
@@ -31,51 +36,215 @@ class GameState:
         self.checkMate = False
         self.staleMate = False
         self.enpassantPossible = ()
-        self.enpassantPossibleLog = [self.enpassantPossible]
         # Castling Rights:
         self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [
-            CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)
-        ]
+        # Plies since the last capture or pawn move, and the move number as FEN counts them
+        self.halfmoveClock = 0
+        self.fullmoveNumber = 1
+        # One compact record per move made, holding what undoMove can't read off the move itself:
+        # (pieceCaptured, castling bits, enpassantPossible, whiteKingLocation, blackKingLocation, zobristKey,
+        #  whiteMaterial, blackMaterial, whitePosition, blackPosition, halfmoveClock)
+        self.undoLog = []
+        # Optional MoveCache of legal move lists shared by the positions this game passes through
+        self.moveCache = None
+        # Optional Nnue.Accumulator, kept up to date by makeMove/undoMove like the running scores
+        self.nnue = None
+        self.resetDerivedState()
+
+    def resetDerivedState(self):
+        # Recompute everything makeMove/undoMove maintain incrementally from the board,
+        # side to move, castling rights and en passant square. The history is dropped.
+        self.moveLog = []
+        self.undoLog = []
+        self.checkMate = False
+        self.staleMate = False
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                if self.board[row][col] == 'wK':
+                    self.whiteKingLocation = (row, col)
+                elif self.board[row][col] == 'bK':
+                    self.blackKingLocation = (row, col)
+        # 64-bit position key, kept up to date by makeMove and restored by undoMove
+        self.zobristKey = computeKey(self)
+        # Running material and piece-square totals per side, kept up to date the same way
+        self.whiteMaterial, self.blackMaterial, self.whitePosition, self.blackPosition = computeScores(self.board)
+        if self.nnue is not None:
+            self.nnue.refresh(self)
+
+    def encode(self):
+        # Compact, picklable snapshot of the position without its history:
+        # (one character per square, whiteToMove, castling bits, en passant square)
+        squares = ''.join(PIECE_CHARS[piece] for row in self.board for piece in row)
+        return squares, self.whiteToMove, self.currentCastlingRight.getBits(), self.enpassantPossible
+
+    @classmethod
+    def fromFEN(cls, fen):
+        # Set up a position from Forsyth-Edwards Notation. A malformed FEN raises ValueError.
+        fields = fen.split()
+        if len(fields) < 2 or fields[1] not in ('w', 'b') or len(fields[0].split('/')) != DIMENSION:
+            raise ValueError('invalid FEN: %s' % fen)
+        gameState = cls()
+        gameState.board = []
+        for rankText in fields[0].split('/'):
+            row = []
+            for char in rankText:
+                if char.isdigit():
+                    row.extend(['--'] * int(char))
+                elif char in CHAR_PIECES:
+                    row.append(CHAR_PIECES[char])
+                else:
+                    raise ValueError('invalid FEN: %s' % fen)
+            if len(row) != DIMENSION:
+                raise ValueError('invalid FEN: %s' % fen)
+            gameState.board.append(row)
+        if sum(row.count('wK') for row in gameState.board) != 1 or sum(row.count('bK') for row in gameState.board) != 1:
+            raise ValueError('invalid FEN, each side needs one king: %s' % fen)
+        gameState.whiteToMove = fields[1] == 'w'
+        castling = fields[2] if len(fields) > 2 else '-'
+        gameState.currentCastlingRight = CastleRights('K' in castling, 'k' in castling, 'Q' in castling, 'q' in castling)
+        enpassant = fields[3] if len(fields) > 3 else '-'
+        if enpassant == '-':
+            gameState.enpassantPossible = ()
+        elif len(enpassant) != 2 or enpassant[0] not in Move.filesToCols or enpassant[1] not in Move.ranksToRows:
+            raise ValueError('invalid FEN: %s' % fen)
+        else:
+            gameState.enpassantPossible = (Move.ranksToRows[enpassant[1]], Move.filesToCols[enpassant[0]])
+        gameState.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        gameState.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        gameState.resetDerivedState()
+        return gameState
+
+    def toFEN(self):
+        rankTexts = []
+        for row in self.board:
+            rankText = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                else:
+                    if empty:
+                        rankText += str(empty)
+                        empty = 0
+                    rankText += PIECE_CHARS[piece]
+            if empty:
+                rankText += str(empty)
+            rankTexts.append(rankText)
+        rights = self.currentCastlingRight
+        castling = ('K' if rights.wks else '') + ('Q' if rights.wqs else '') + \
+            ('k' if rights.bks else '') + ('q' if rights.bqs else '')
+        if self.enpassantPossible == ():
+            enpassant = '-'
+        else:
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        return '%s %s %s %s %d %d' % ('/'.join(rankTexts), 'w' if self.whiteToMove else 'b', castling or '-',
+                                      enpassant, self.halfmoveClock, self.fullmoveNumber)
+
+    @classmethod
+    def decode(cls, encoded):
+        squares, whiteToMove, castleBits, enpassantPossible = encoded
+        gameState = cls()
+        gameState.board = [[CHAR_PIECES[squares[row * DIMENSION + col]] for col in range(DIMENSION)] for row in range(DIMENSION)]
+        gameState.whiteToMove = whiteToMove
+        gameState.currentCastlingRight.setBits(castleBits)
+        gameState.enpassantPossible = tuple(enpassantPossible)
+        gameState.resetDerivedState()
+        return gameState
+
     def makeMove(self, move):
-        self.board[move.startRow][move.startCol] = '--'
-        self.board[move.endRow][move.endCol] = move.pieceMoved
+        startRow, startCol, endRow, endCol = MOVE_SQUARES[move.code & 0xFFF]
+        flags = move.code >> 12
+        castleBits = self.currentCastlingRight.getBits()
+        self.undoLog.append((move.pieceCaptured, castleBits, self.enpassantPossible,
+                             self.whiteKingLocation, self.blackKingLocation, self.zobristKey,
+                             self.whiteMaterial, self.blackMaterial, self.whitePosition, self.blackPosition,
+                             self.halfmoveClock))
+        if move.pieceMoved[1] == 'p' or move.pieceCaptured != '--':
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
+        key = self.zobristKey ^ SIDE_KEY ^ CASTLE_KEYS[castleBits] ^ PIECE_KEYS[move.pieceMoved][startRow * 8 + startCol]
+        if move.pieceCaptured != '--' and flags != ENPASSANT_FLAG:
+            key ^= PIECE_KEYS[move.pieceCaptured][endRow * 8 + endCol]
+        if self.enpassantPossible != ():
+            key ^= ENPASSANT_KEYS[self.enpassantPossible[1]]
+        self.board[startRow][startCol] = '--'
+        self.board[endRow][endCol] = move.pieceMoved
         # We can undo later using moveLog
         self.moveLog.append(move)
         # Swap player turn after making move:
         self.whiteToMove = not self.whiteToMove
         # If moved, update the king's location:
         if move.pieceMoved == 'wK':
-            self.whiteKingLocation = (move.endRow, move.endCol)
+            self.whiteKingLocation = (endRow, endCol)
         elif move.pieceMoved == 'bK':
-            self.blackKingLocation = (move.endRow, move.endCol)
+            self.blackKingLocation = (endRow, endCol)
 
         # Pawn Promotion:
-        if move.isPawnPromotion:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q'
+        if flags >= PROMOTION_FLAG:
+            self.board[endRow][endCol] = move.pieceMoved[0] + PROMOTION_PIECES[flags - PROMOTION_FLAG]
         # If enpassantMove, update the board to capture the pawn:
-        if move.isEnpassantMove:
-            self.board[move.startRow][move.endCol] = '--'
-
-        if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
-            self.enpassantPossible = ((move.startRow + move.endRow) // 2, move.startCol)
+        if flags == ENPASSANT_FLAG:
+            self.board[startRow][endCol] = '--'
+            key ^= PIECE_KEYS[move.pieceCaptured][startRow * 8 + endCol]
+        pieceLanded = self.board[endRow][endCol]
+        key ^= PIECE_KEYS[pieceLanded][endRow * 8 + endCol]
+        # Material only changes for the mover on promotion
+        materialGain = piece_score[pieceLanded[1]] - piece_score[move.pieceMoved[1]]
+        positionGain = position_scores[pieceLanded][endRow * 8 + endCol] - \
+            position_scores[move.pieceMoved][startRow * 8 + startCol]
+
+        if move.pieceMoved[1] == 'p' and abs(startRow - endRow) == 2:
+            self.enpassantPossible = ((startRow + endRow) // 2, startCol)
+            key ^= ENPASSANT_KEYS[startCol]
         else:
             self.enpassantPossible = ()
 
         # Castle Moves (Nhap thanh)
-        if move.isCastleMove:
+        if flags == CASTLE_FLAG:
             # CastleRights kingSide
-            if move.endCol - move.startCol == 2:
-                self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1]
-                self.board[move.endRow][move.endCol + 1] = '--'
+            if endCol - startCol == 2:
+                self.board[endRow][endCol - 1] = self.board[endRow][endCol + 1]
+                self.board[endRow][endCol + 1] = '--'
+                rook = self.board[endRow][endCol - 1]
+                key ^= PIECE_KEYS[rook][endRow * 8 + endCol - 1] ^ PIECE_KEYS[rook][endRow * 8 + endCol + 1]
+                positionGain += position_scores[rook][endRow * 8 + endCol - 1] - \
+                    position_scores[rook][endRow * 8 + endCol + 1]
             # CastleRights queenSide:
             else:
-                self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]
-                self.board[move.endRow][move.endCol - 2] = '--'
+                self.board[endRow][endCol + 1] = self.board[endRow][endCol - 2]
+                self.board[endRow][endCol - 2] = '--'
+                rook = self.board[endRow][endCol + 1]
+                key ^= PIECE_KEYS[rook][endRow * 8 + endCol + 1] ^ PIECE_KEYS[rook][endRow * 8 + endCol - 2]
+                positionGain += position_scores[rook][endRow * 8 + endCol + 1] - \
+                    position_scores[rook][endRow * 8 + endCol - 2]
 
         self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        self.zobristKey = key ^ CASTLE_KEYS[self.currentCastlingRight.getBits()]
+
+        if move.pieceCaptured != '--':
+            capturedSquare = startRow * 8 + endCol if flags == ENPASSANT_FLAG else endRow * 8 + endCol
+            capturedMaterial = piece_score[move.pieceCaptured[1]]
+            capturedPosition = position_scores[move.pieceCaptured][capturedSquare]
+        else:
+            capturedMaterial = capturedPosition = 0
+        if move.pieceMoved[0] == 'w':
+            self.whiteMaterial += materialGain
+            self.whitePosition += positionGain
+            self.blackMaterial -= capturedMaterial
+            self.blackPosition -= capturedPosition
+        else:
+            self.blackMaterial += materialGain
+            self.blackPosition += positionGain
+            self.whiteMaterial -= capturedMaterial
+            self.whitePosition -= capturedPosition
+        if self.nnue is not None:
+            self.nnue.makeMove(self, move)
+
     def updateCastleRights(self, move):
+        startRow, startCol, endRow, endCol = MOVE_SQUARES[move.code & 0xFFF]
         # If white king move, castleRights is lost
         if move.pieceMoved == 'wK':
             self.currentCastlingRight.wks = False
@@ -84,103 +253,255 @@ class GameState:
             self.currentCastlingRight.bks = False
             self.currentCastlingRight.bqs = False
         elif move.pieceMoved == 'wR':
-            if move.startRow == 7:
-                if move.startCol == 0: # LeftRook
+            if startRow == 7:
+                if startCol == 0: # LeftRook
                     self.currentCastlingRight.wqs = False
-                elif move.startCol == 7: # RightRook
+                elif startCol == 7: # RightRook
                     self.currentCastlingRight.wks = False
         elif move.pieceMoved == 'bR':
-            if move.startRow == 0:
-                if move.startCol == 0:
+            if startRow == 0:
+                if startCol == 0:
                     self.currentCastlingRight.bqs = False
-                elif move.startCol == 7:
+                elif startCol == 7:
+                    self.currentCastlingRight.bks = False
+        # If a rook is captured on its starting square, that side can't castle with it
+        if move.pieceCaptured == 'wR':
+            if endRow == 7:
+                if endCol == 0:
+                    self.currentCastlingRight.wqs = False
+                elif endCol == 7:
+                    self.currentCastlingRight.wks = False
+        elif move.pieceCaptured == 'bR':
+            if endRow == 0:
+                if endCol == 0:
+                    self.currentCastlingRight.bqs = False
+                elif endCol == 7:
                     self.currentCastlingRight.bks = False
 
     def undoMove(self):
         if len(self.moveLog) != 0:
             move = self.moveLog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            startRow, startCol, endRow, endCol = MOVE_SQUARES[move.code & 0xFFF]
+            flags = move.code >> 12
+            (pieceCaptured, castleBits, self.enpassantPossible, self.whiteKingLocation, self.blackKingLocation, self.zobristKey,
+             self.whiteMaterial, self.blackMaterial, self.whitePosition, self.blackPosition,
+             self.halfmoveClock) = self.undoLog.pop()
+            self.board[startRow][startCol] = move.pieceMoved
+            self.board[endRow][endCol] = pieceCaptured
             self.whiteToMove = not self.whiteToMove
-
-            # Update the king's position:
-            if move.pieceMoved == 'wK':
-                self.whiteKingLocation = (move.startRow, move.startCol)
-            elif move.pieceMoved == 'bK':
-                self.blackKingLocation = (move.startRow, move.startCol)
+            if not self.whiteToMove:
+                self.fullmoveNumber -= 1
 
             # Undo an enpassant:
-            if move.isEnpassantMove:
+            if flags == ENPASSANT_FLAG:
                 # Leave landing square blank
-                self.board[move.endRow][move.endCol] = '--'
-                self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow, move.endCol)
-            # Undo a 2 square pawn advance:
-            if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
-                self.enpassantPossible = ()
+                self.board[endRow][endCol] = '--'
+                self.board[startRow][endCol] = pieceCaptured
 
             # Undo castling rights:
-            self.castleRightsLog.pop()
-            newRights = self.castleRightsLog[-1]
-            self.currentCastlingRight = CastleRights(newRights.wks, newRights.bks, newRights.wqs, newRights.bqs)
+            self.currentCastlingRight.setBits(castleBits)
 
             # Undo castling move:
-            if move.isCastleMove:
+            if flags == CASTLE_FLAG:
                 # Undo kingSide
-                if move.endCol - move.startCol == 2:
-                    self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
-                    self.board[move.endRow][move.endCol - 1] = '--'
+                if endCol - startCol == 2:
+                    self.board[endRow][endCol + 1] = self.board[endRow][endCol - 1]
+                    self.board[endRow][endCol - 1] = '--'
                 # Undo queenSide:
                 else:
-                    self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
-                    self.board[move.endRow][move.endCol + 1] = '--'
+                    self.board[endRow][endCol - 2] = self.board[endRow][endCol + 1]
+                    self.board[endRow][endCol + 1] = '--'
+            if self.nnue is not None:
+                self.nnue.undoMove()
+            self.checkMate = False
+            self.staleMate = False
+
+    def makeNullMove(self):
+        # Pass the turn without moving, for null-move pruning in the search. Null moves aren't
+        # recorded in moveLog: the returned state is handed back to undoNullMove instead.
+        state = (self.enpassantPossible, self.zobristKey, self.halfmoveClock)
+        key = self.zobristKey ^ SIDE_KEY
+        if self.enpassantPossible != ():
+            key ^= ENPASSANT_KEYS[self.enpassantPossible[1]]
+        self.zobristKey = key
+        self.enpassantPossible = ()
+        self.halfmoveClock += 1
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
+        self.whiteToMove = not self.whiteToMove
+        return state
 
-    def getValidMoves(self):
-        for log in self.castleRightsLog:
-            print(log.wks, log.bks, log.wqs, log.bqs)
-        print()
-        tempEnpassantPossible = self.enpassantPossible
-        tempCastleRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)
-        # Generate all possible moves:
-        moves = self.getAllPossibleMoves()
-        # for each move, make the move:
-        for i in range (len(moves) - 1, -1, -1):
-            self.makeMove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
-        if len(moves) == 0:
-            if self.inCheck():
-                self.checkMate = True
-            else:
-                self.checkMate = True
+    def undoNullMove(self, state):
+        self.enpassantPossible, self.zobristKey, self.halfmoveClock = state
+        self.whiteToMove = not self.whiteToMove
+        if not self.whiteToMove:
+            self.fullmoveNumber -= 1
+        self.checkMate = False
+        self.staleMate = False
 
+    def getValidMoves(self):
+        # With a moveCache, positions seen before are answered from it. Callers get their own
+        # copy of the list, since some reorder it; the checkmate/stalemate flags are set either way.
+        if self.moveCache is None:
+            return self.generateValidMoves()
+        entry = self.moveCache.get(self.zobristKey)
+        if entry is not None:
+            moves, self.checkMate, self.staleMate = entry
+            return list(moves)
+        moves = self.generateValidMoves()
+        self.moveCache.put(self.zobristKey, moves, self.checkMate, self.staleMate)
+        return list(moves)
+
+    def generateValidMoves(self):
+        # Checks and pins are found once, from the king outward, so every
+        # pseudo-legal move can be accepted or rejected without playing it.
+        inCheck, pins, checks = self.checkForPinsAndChecks()
         if self.whiteToMove:
-            print('White Location', self.whiteKingLocation[0], self.whiteKingLocation[1])
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
+            kingRow, kingCol = self.whiteKingLocation
         else:
-            print('Black Location', self.blackKingLocation[0], self.blackKingLocation[1])
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
-        self.enpassantPossible = tempEnpassantPossible
-        self.currentCastlingRight = tempCastleRights
+            kingRow, kingCol = self.blackKingLocation
+        # Squares a non-king move must land on to answer a check
+        blockSquares = None
+        if len(checks) > 1:
+            # Double check: only the king can move
+            blockSquares = set()
+        elif len(checks) == 1:
+            checkRow, checkCol, dRow, dCol = checks[0]
+            blockSquares = {(checkRow, checkCol)}
+            if self.board[checkRow][checkCol][1] != 'N':
+                for i in range(1, 8):
+                    square = (kingRow + dRow * i, kingCol + dCol * i)
+                    if square == (checkRow, checkCol):
+                        break
+                    blockSquares.add(square)
+
+        moves = []
+        for move in self.getAllPossibleMoves():
+            startRow, startCol, endRow, endCol = MOVE_SQUARES[move.code & 0xFFF]
+            isEnpassantMove = move.code >> 12 == ENPASSANT_FLAG
+            if move.pieceMoved[1] == 'K':
+                # The king's own square must not block attacks along the line it leaves
+                if not self.squareUnderAttack(endRow, endCol, ignoreSquare=(kingRow, kingCol)):
+                    moves.append(move)
+                continue
+            if blockSquares is not None and (endRow, endCol) not in blockSquares:
+                # En passant can remove a checking pawn without landing on its square
+                if not (isEnpassantMove and (startRow, endCol) in blockSquares):
+                    continue
+            pin = pins.get((startRow, startCol))
+            if pin is not None:
+                # A pinned piece may only move along the line between the king and the pinner
+                if (endRow - kingRow) * pin[1] != (endCol - kingCol) * pin[0]:
+                    continue
+            if isEnpassantMove and self.enpassantExposesKing(move):
+                continue
+            moves.append(move)
+
+        if not inCheck:
+            self.getCastleMoves(kingRow, kingCol, moves)
+
+        self.checkMate = len(moves) == 0 and inCheck
+        self.staleMate = len(moves) == 0 and not inCheck
         return moves
 
+    def checkForPinsAndChecks(self):
+        # Returns (inCheck, pins, checks) for the side to move:
+        # pins maps a pinned piece's square to the direction from the king to it,
+        # checks holds (row, col, dRow, dCol) for every checking piece.
+        pins = {}
+        checks = []
+        if self.whiteToMove:
+            allyColor, enemyColor = 'w', 'b'
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            allyColor, enemyColor = 'b', 'w'
+            kingRow, kingCol = self.blackKingLocation
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j, direction in enumerate(directions):
+            possiblePin = None
+            for i in range(1, 8):
+                endRow = kingRow + direction[0] * i
+                endCol = kingCol + direction[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                endPiece = self.board[endRow][endCol]
+                if endPiece == '--':
+                    continue
+                if endPiece[0] == allyColor:
+                    if possiblePin is not None:
+                        # Second ally piece on this line: nothing is pinned
+                        break
+                    possiblePin = (endRow, endCol)
+                    continue
+                pieceType = endPiece[1]
+                # Directions 0-3 are orthogonal, 4-7 diagonal; an enemy pawn only
+                # checks from one of the two diagonal squares in front of the king
+                if (0 <= j <= 3 and pieceType == 'R') or (4 <= j <= 7 and pieceType == 'B') or \
+                        pieceType == 'Q' or (i == 1 and pieceType == 'K') or \
+                        (i == 1 and pieceType == 'p' and
+                         ((enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))):
+                    if possiblePin is None:
+                        checks.append((endRow, endCol, direction[0], direction[1]))
+                    else:
+                        pins[possiblePin] = direction
+                break
+
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        for direction in knightMoves:
+            endRow = kingRow + direction[0]
+            endCol = kingCol + direction[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and self.board[endRow][endCol] == enemyColor + 'N':
+                checks.append((endRow, endCol, direction[0], direction[1]))
+        return len(checks) > 0, pins, checks
+
+    def enpassantExposesKing(self, move):
+        # En passant removes two pawns from the same rank, which can uncover an
+        # attack on the king that no single pin describes. It is rare, so play it out.
+        self.makeMove(move)
+        self.whiteToMove = not self.whiteToMove
+        exposed = self.inCheck()
+        self.whiteToMove = not self.whiteToMove
+        self.undoMove()
+        return exposed
+
     def inCheck(self):
         if self.whiteToMove:
             return self.squareUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1])
         else:
             return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
 
-    def squareUnderAttack(self, row, col):
-        self.whiteToMove = not self.whiteToMove
-        # Switch to opponent's turn:
-        opponentMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove
-        for move in opponentMoves:
-            if move.endRow == row and move.endCol == col:
+    def squareUnderAttack(self, row, col, ignoreSquare=None):
+        # Look outward from the square for enemy pieces that attack it,
+        # treating ignoreSquare as empty
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        for direction in knightMoves:
+            endRow = row + direction[0]
+            endCol = col + direction[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and self.board[endRow][endCol] == enemyColor + 'N':
                 return True
+        # Enemy pawns attack from the rank in front of the square (from their side)
+        pawnRow = row - 1 if enemyColor == 'b' else row + 1
+        if 0 <= pawnRow < 8:
+            for endCol in (col - 1, col + 1):
+                if 0 <= endCol < 8 and self.board[pawnRow][endCol] == enemyColor + 'p':
+                    return True
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j, direction in enumerate(directions):
+            for i in range(1, 8):
+                endRow = row + direction[0] * i
+                endCol = col + direction[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                endPiece = self.board[endRow][endCol]
+                if endPiece == '--' or (endRow, endCol) == ignoreSquare:
+                    continue
+                if endPiece[0] == enemyColor:
+                    pieceType = endPiece[1]
+                    if pieceType == 'Q' or (i == 1 and pieceType == 'K') or \
+                            (j <= 3 and pieceType == 'R') or (j >= 4 and pieceType == 'B'):
+                        return True
+                break
         return False
 
     def getAllPossibleMoves(self):
@@ -203,40 +524,48 @@ class GameState:
         if self.whiteToMove:
             if row >= 1:
                 if self.board[row - 1][col] == '--':
-                    moves.append(Move((row, col), (row - 1, col), self.board))
+                    self.addPawnMove((row, col), (row - 1, col), moves)
                     if row == 6 and self.board[row - 2][col] == '--':
-                        moves.append(Move((row, col), (row - 2, col), self.board))
+                        self.addPawnMove((row, col), (row - 2, col), moves)
 
                 # Capture another piece
                 if col >= 1:
                     if self.board[row - 1][col - 1][0] == 'b':
-                        moves.append(Move((row, col), (row - 1, col - 1), self.board))
+                        self.addPawnMove((row, col), (row - 1, col - 1), moves)
                     elif (row - 1, col - 1) == self.enpassantPossible:
-                        moves.append(Move((row, col), (row - 1, col - 1), self.board, isEnpassantMove=True))
+                        self.addPawnMove((row, col), (row - 1, col - 1), moves, isEnpassantMove=True)
                 if col <= 6:
                     if self.board[row - 1][col + 1][0] == 'b':
-                        moves.append(Move((row, col), (row - 1, col + 1), self.board))
+                        self.addPawnMove((row, col), (row - 1, col + 1), moves)
                     elif (row - 1, col + 1) == self.enpassantPossible:
-                        moves.append(Move((row, col), (row - 1, col + 1), self.board, isEnpassantMove=True))
+                        self.addPawnMove((row, col), (row - 1, col + 1), moves, isEnpassantMove=True)
 
         # Black Pawn move:
         else:
             if row <= 6:
                 if self.board[row + 1][col] == '--':
-                    moves.append(Move((row, col), (row + 1, col), self.board))
+                    self.addPawnMove((row, col), (row + 1, col), moves)
                     if row == 1 and self.board[row + 2][col] == '--':
-                        moves.append(Move((row, col), (row + 2, col), self.board))
+                        self.addPawnMove((row, col), (row + 2, col), moves)
 
                 if col >= 1:
                     if self.board[row + 1][col - 1][0] == 'w':
-                        moves.append(Move((row, col), (row + 1, col - 1), self.board))
+                        self.addPawnMove((row, col), (row + 1, col - 1), moves)
                     elif (row + 1, col - 1) == self.enpassantPossible:
-                        moves.append(Move((row, col), (row + 1, col - 1), self.board, isEnpassantMove=True))
+                        self.addPawnMove((row, col), (row + 1, col - 1), moves, isEnpassantMove=True)
                 if col <= 6:
                     if self.board[row + 1][col + 1][0] == 'w':
-                        moves.append(Move((row, col), (row + 1, col + 1), self.board))
+                        self.addPawnMove((row, col), (row + 1, col + 1), moves)
                     elif (row + 1, col + 1) == self.enpassantPossible:
-                        moves.append(Move((row, col), (row + 1, col + 1), self.board, isEnpassantMove=True))
+                        self.addPawnMove((row, col), (row + 1, col + 1), moves, isEnpassantMove=True)
+
+    def addPawnMove(self, startSq, endSq, moves, isEnpassantMove=False):
+        # A pawn reaching the last rank makes one move per piece it can promote to
+        if endSq[0] == 0 or endSq[0] == 7:
+            for piece in PROMOTION_PIECES:
+                moves.append(Move(startSq, endSq, self.board, promoteTo=piece))
+        else:
+            moves.append(Move(startSq, endSq, self.board, isEnpassantMove=isEnpassantMove))
 
 
     def getRookMoves(self, row, col, moves):
@@ -271,7 +600,7 @@ class GameState:
         for direction in directions:
             endRow = row + direction[0]
             endCol = col + direction[1]
-            if 0 < endRow < 8 and 0 < endCol < 8:
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
                 # If destination position is an empty place or enemy place
                 if endPiece[0] != allyColor:
@@ -338,6 +667,10 @@ class GameState:
                 moves.append(Move((row, col), (row, col - 2), self.board, isCastleMove=True))
 
 class Move:
+    # A move packed into one 16-bit int, code: start square in bits 0-5, end square in
+    # bits 6-11 (squares numbered row * 8 + col) and flags in bits 12-15. Besides code only
+    # the pieces moved and captured are stored, so generating moves that are never played is cheap.
+    __slots__ = ('code', 'pieceMoved', 'pieceCaptured')
     # Maps keys to values:
     ranksToRows = {
         '1': 7,
@@ -361,22 +694,67 @@ class Move:
         'h': 7,
     }
     colsToFiles = {v: k for k, v in filesToCols.items()}
-    def __init__(self, startSq, endSq, board, isEnpassantMove = False, isCastleMove = False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        # Pawn promotion
-        self.isPawnPromotion = (self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7)
+    def __init__(self, startSq, endSq, board, isEnpassantMove = False, isCastleMove = False, promoteTo = 'Q'):
+        self.pieceMoved = board[startSq[0]][startSq[1]]
         # Enpassant Move
-        self.isEnpassantMove = isEnpassantMove
         if isEnpassantMove:
             self.pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'
-        self.promoteTo = None
-        self.isCastleMove = isCastleMove
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+            flags = ENPASSANT_FLAG
+        else:
+            self.pieceCaptured = board[endSq[0]][endSq[1]]
+            if isCastleMove:
+                flags = CASTLE_FLAG
+            # Pawn promotion
+            elif (self.pieceMoved == 'wp' and endSq[0] == 0) or (self.pieceMoved == 'bp' and endSq[0] == 7):
+                flags = PROMOTION_FLAG + PROMOTION_PIECES.index(promoteTo)
+            else:
+                flags = 0
+        self.code = startSq[0] * 8 + startSq[1] | (endSq[0] * 8 + endSq[1]) << 6 | flags << 12
+
+    # Everything but the pieces is read off the packed code when asked for
+    @property
+    def startRow(self):
+        return (self.code >> 3) & 7
+
+    @property
+    def startCol(self):
+        return self.code & 7
+
+    @property
+    def endRow(self):
+        return (self.code >> 9) & 7
+
+    @property
+    def endCol(self):
+        return (self.code >> 6) & 7
+
+    @property
+    def isEnpassantMove(self):
+        return self.code >> 12 == ENPASSANT_FLAG
+
+    @property
+    def isCastleMove(self):
+        return self.code >> 12 == CASTLE_FLAG
+
+    @property
+    def isPawnPromotion(self):
+        return self.code >> 12 >= PROMOTION_FLAG
+
+    @property
+    def promoteTo(self):
+        # Piece type a promoting pawn becomes ('Q', 'R', 'B' or 'N'), None for other moves
+        flags = self.code >> 12
+        return PROMOTION_PIECES[flags - PROMOTION_FLAG] if flags >= PROMOTION_FLAG else None
+
+    @property
+    def moveID(self):
+        # Decimal start row/col, end row/col, as the GUI has always compared moves by. Under-promotions
+        # get their own IDs; a queen promotion keeps the plain ID the GUI builds from clicks.
+        flags = self.code >> 12
+        if flags > PROMOTION_FLAG:
+            return SQUARE_IDS[self.code & 0xFFF] + (flags - PROMOTION_FLAG) * 10000
+        return SQUARE_IDS[self.code & 0xFFF]
+
     # Overriding the equal method:
     def __eq__(self, other):
         if isinstance(other, Move):
@@ -384,14 +762,48 @@ class Move:
         return False
 
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        # Long algebraic / UCI form: e2e4, e7e8q
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.isPawnPromotion:
+            notation += self.promoteTo.lower()
+        return notation
     def getRankFile(self, row, col):
         # a1, b2, b5
         return self.colsToFiles[col] + self.rowsToRanks[row]
 
+# Pieces a pawn can promote to, in move ID order
+PROMOTION_PIECES = ('Q', 'R', 'B', 'N')
+
+# Move.code flags; a promotion's flag is PROMOTION_FLAG + the piece's index in PROMOTION_PIECES
+ENPASSANT_FLAG = 1
+CASTLE_FLAG = 2
+PROMOTION_FLAG = 4
+# SQUARE_IDS[code & 0xFFF]: move ID of a start/end square pair
+SQUARE_IDS = [(squares & 63) // 8 * 1000 + (squares & 63) % 8 * 100 + (squares >> 6) // 8 * 10 + (squares >> 6) % 8
+              for squares in range(4096)]
+# MOVE_SQUARES[code & 0xFFF]: (startRow, startCol, endRow, endCol), for code that unpacks all four at once
+MOVE_SQUARES = [((squares & 63) // 8, (squares & 63) % 8, (squares >> 6) // 8, (squares >> 6) % 8)
+                for squares in range(4096)]
+
+# Single-character piece codes used by GameState.encode (FEN letters, '.' for empty)
+PIECE_CHARS = {'wp': 'P', 'wR': 'R', 'wN': 'N', 'wB': 'B', 'wQ': 'Q', 'wK': 'K',
+               'bp': 'p', 'bR': 'r', 'bN': 'n', 'bB': 'b', 'bQ': 'q', 'bK': 'k', '--': '.'}
+CHAR_PIECES = {v: k for k, v in PIECE_CHARS.items()}
+
+
 class CastleRights:
     def __init__(self, wks, bks, wqs, bqs):
         self.wks = wks
         self.bks = bks
         self.wqs = wqs
-        self.bqs = bqs
\ No newline at end of file
+        self.bqs = bqs
+
+    # Packed as 4 bits (wks = 1, bks = 2, wqs = 4, bqs = 8) for the undo log
+    def getBits(self):
+        return self.wks | self.bks << 1 | self.wqs << 2 | self.bqs << 3
+
+    def setBits(self, bits):
+        self.wks = bits & 1 == 1
+        self.bks = bits & 2 == 2
+        self.wqs = bits & 4 == 4
+        self.bqs = bits & 8 == 8
\ No newline at end of file
@@ -1,36 +1,93 @@
+import os
 import pygame
 import time
+import queue
+import threading
 
 from Chess import ChessEngine
-import MoveFinder
+from Chess.MoveCache import MoveCache
+from Chess import MoveFinder
 WIDTH, HEIGHT = 512, 512
 MOVE_LOG_PANEL_WIDTH = 250
 MOVE_LOG_PANEL_HEIGHT = HEIGHT
-DIMENSION = 8
+DIMENSION = ChessEngine.DIMENSION
 SQ_SIZE = WIDTH // DIMENSION
 MAX_FPS = 15
 IMAGES = {}
+# Use the bitboard move generator instead of scanning the 8x8 board
+BITBOARD_BACKEND = False
+# Worker processes for the AI's root search; 1 searches in the GUI process
+AI_WORKERS = 1
+# Opening book the AI plays from while it lasts (see OpeningBook.py); used if the file exists.
+# Endgame tables generated with Tablebase.py are picked up from Chess/tablebases the same way.
+BOOK_FILE = 'book.bin'
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
+BOARD_COLORS = (pygame.Color('white'), pygame.Color('gray'))
+# Rendered text surfaces kept for reuse; the cache is emptied when it grows past this
+TEXT_CACHE_SIZE = 512
+# Legal move lists of positions already shown, so undo and replayed positions don't regenerate them
+MOVE_CACHE_SIZE = 1024
+moveCache = MoveCache(MOVE_CACHE_SIZE)
 
 def load_images():
     pieces = ['wp', 'wR', 'wN', 'wB', 'wK', 'wQ',
               'bp', 'bR', 'bN', 'bB', 'bK', 'bQ'
              ]
     for piece in pieces:
-        IMAGES[piece] = pygame.transform.scale(pygame.image.load('images/' + piece + '.png'), (SQ_SIZE, SQ_SIZE))
+        # The image files are named in lower case (wr.png for 'wR'). convert_alpha puts them in
+        # the display's pixel format once, instead of converting on every blit.
+        image = pygame.image.load(os.path.join(IMAGE_DIR, piece.lower() + '.png')).convert_alpha()
+        IMAGES[piece] = pygame.transform.scale(image, (SQ_SIZE, SQ_SIZE))
+
+
+def newGameState():
+    if BITBOARD_BACKEND:
+        from Chess.Bitboard import BitboardGameState
+        gs = BitboardGameState()
+    else:
+        gs = ChessEngine.GameState()
+    # Shared across resets: entries depend only on the position, not on how it was reached
+    gs.moveCache = moveCache
+    return gs
+
+
+def findAIMove(gs, validMoves, returnQueue, stopEvent):
+    # Runs on a background thread with its own copy of the game, so the GUI keeps
+    # drawing and handling events while the AI thinks
+    if AI_WORKERS > 1:
+        from Chess import ParallelSearch
+        AImove = ParallelSearch.findBestMoveParallel(gs, validMoves, workers=AI_WORKERS, stopEvent=stopEvent)
+    else:
+        AImove = MoveFinder.findBestMove(gs, validMoves, randomize=True, stopEvent=stopEvent)
+    if AImove is None and not stopEvent.is_set():
+        AImove = MoveFinder.findRandomMove(validMoves)
+    returnQueue.put(AImove)
 
 
 def main():
+    if AI_WORKERS > 1:
+        # Start the AI's worker processes here on the main thread, before pygame is up. Left to
+        # findAIMove they would be forked from the AI thread and could inherit a lock held by
+        # another thread (see ParallelSearch.getPool).
+        from Chess import ParallelSearch
+        ParallelSearch.getPool(AI_WORKERS)
     pygame.init()
     screen = pygame.display.set_mode((WIDTH + MOVE_LOG_PANEL_WIDTH, HEIGHT))
     pygame.display.set_caption('Chess')
     clock = pygame.time.Clock()
     screen.fill(pygame.Color('white'))
-    moveLogFont = pygame.font.SysFont('Helvetica', 16, True, False)
     animate = False
-    gs = ChessEngine.GameState()
+    gs = newGameState()
     validMoves = gs.getValidMoves()
     moveMade = False # Flag: variable when a move is made
     load_images()
+    renderer = Renderer(screen)
+    if os.path.exists(BOOK_FILE):
+        from Chess.OpeningBook import OpeningBook
+        MoveFinder.openingBook = OpeningBook(BOOK_FILE)
+    from Chess.Tablebase import Tablebase, TABLEBASE_DIR
+    if os.path.isdir(TABLEBASE_DIR):
+        MoveFinder.tablebase = Tablebase(TABLEBASE_DIR)
     running = True
     # No square is selected, keep track of the last click of the user
     sqSelected = ()
@@ -38,6 +95,10 @@ def main():
     gameOver = False
     playerOne = True # If a human is playing white, this will be true
     playerTwo = False # Same as above but for black
+    AIThinking = False
+    AIStopEvent = None # Cancellation token of the running AI search
+    AIQueue = None # The running AI search puts its move here
+    AIThread = None
     while running:
         # Check to make sure that human's play:
         humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
@@ -46,6 +107,9 @@ def main():
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                # The window system lost our pixels: draw the next frame in full
+                renderer.invalidate()
             # Handle mouse event:
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if not gameOver and humanTurn:
@@ -74,35 +138,55 @@ def main():
 
                 # Key handler:
             elif event.type == pygame.KEYDOWN:
+                if event.key in (pygame.K_z, pygame.K_r) and AIThinking:
+                    # Abandon the search; its result would be for a position that's gone.
+                    # It stops at its next node, so waiting for it keeps two searches
+                    # from ever sharing MoveFinder's tables.
+                    AIStopEvent.set()
+                    AIThread.join()
+                    AIThinking = False
                 if event.key == pygame.K_z:
                     gs.undoMove()
                     moveMade = True
+                    gameOver = False
                 if event.key == pygame.K_r:
                     # reset the board if type 'r':
-                    gs = ChessEngine.GameState()
+                    gs = newGameState()
                     validMoves = gs.getValidMoves()
                     sqSelected = ()
                     playerClicks = []
                     moveMade = False
                     animate = False
+                    gameOver = False
 
         # AI Move Finder:
-        if not gameOver and not humanTurn:
-            AImove = MoveFinder.findBestMove(gs, validMoves)
-            if AImove is None:
-                AImove = MoveFinder.findRandomMove(validMoves)
-            gs.makeMove(AImove)
-            moveMade = True
-            animate = True
+        humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
+        if not gameOver and not humanTurn and not moveMade:
+            if not AIThinking:
+                AIThinking = True
+                AIStopEvent = threading.Event()
+                AIQueue = queue.Queue()
+                AIThread = threading.Thread(target=findAIMove, daemon=True,
+                                            args=(type(gs).decode(gs.encode()), list(validMoves), AIQueue, AIStopEvent))
+                AIThread.start()
+            elif not AIQueue.empty():
+                AImove = AIQueue.get()
+                AIThinking = False
+                # Play the GUI's own copy of the move the AI found on its copy of the game
+                for move in validMoves:
+                    if move == AImove:
+                        gs.makeMove(move)
+                        moveMade = True
+                        animate = True
+                        break
 
         if moveMade:
             if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)
+                renderer.animateMove(gs.moveLog[-1], gs.board, clock)
             validMoves = gs.getValidMoves()
             moveMade = False
             animate = False
 
-        drawGameState(screen, gs, validMoves, sqSelected, moveLogFont)
         text = ""
         if gs.checkMate:
             gameOver = True
@@ -113,101 +197,171 @@ def main():
         elif gs.staleMate:
             gameOver = True
             text = 'Stalemate'
-        drawText(screen, text)
+        dirtyRects = renderer.drawGameState(gs, validMoves, sqSelected, AIThinking, text)
 
 
         clock.tick(MAX_FPS)
-        pygame.display.flip()
+        if dirtyRects:
+            pygame.display.update(dirtyRects)
 
 
-def highlightSquare(screen, gs, validMoves, sqSelected):
-    if sqSelected != ():
-        row, col = sqSelected
-        if gs.board[row][col][0] == ('w' if gs.whiteToMove else 'b'):
+def squareRect(row, col):
+    return pygame.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+
+
+class Renderer:
+    # Draws the game and remembers what each part of the screen shows, so a frame only
+    # redraws the squares and panels that changed. Drawing methods return the screen
+    # rectangles they touched, for pygame.display.update.
+    def __init__(self, screen):
+        self.screen = screen
+        # The empty board, drawn once; squares are restored from it
+        self.boardSurface = pygame.Surface((WIDTH, HEIGHT)).convert()
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                self.boardSurface.fill(BOARD_COLORS[(row + col) % 2], squareRect(row, col))
+        self.highlights = {}
+        for name, color in (('selected', 'blue'), ('target', 'yellow')):
             s = pygame.Surface((SQ_SIZE, SQ_SIZE))
             s.set_alpha(100)
-            s.fill(pygame.Color('blue'))
-            screen.blit(s, (col * SQ_SIZE, row * SQ_SIZE))
-            s.fill(pygame.Color('yellow'))
-            for move in validMoves:
-                if move.startRow == row and move.startCol == col:
-                    screen.blit(s, (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE))
-
-def drawGameState(screen, gs, validMoves, sqSelected, moveLogFont):
-    drawBoard(screen)
-    highlightSquare(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.board)
-    drawMoveLog(screen, gs, moveLogFont)
-
-
-def drawMoveLog(screen, gs, font):
-    moveLogRect = pygame.Rect(WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
-    pygame.draw.rect(screen, pygame.Color('black'), moveLogRect)
-    moveLog = gs.moveLog
-    moveTexts = []
-    for i in range (0, len(moveLog), 2):
-        moveString = str(i // 2 + 1) + '. ' + moveLog[i].getChessNotation() + ' - '
-        if i + 1 < len(moveLog):
-            moveString += moveLog[i + 1].getChessNotation()
-        moveTexts.append(moveString)
-    padding = 5
-    lineSpacing = 2
-    textY = padding
-    for i in range (len(moveTexts)):
-        text = moveTexts[i]
-        textObject = font.render(text, True, pygame.Color('white'))
-        textLocation = moveLogRect.move(padding, textY)
-        screen.blit(textObject, textLocation)
-        textY += textObject.get_height() + lineSpacing
-
-
-
-def drawBoard(screen):
-    global colors
-    colors = [pygame.Color('white'), pygame.Color('gray')]
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            color = colors[(row + col) % 2]
-            pygame.draw.rect(screen, color, pygame.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-def drawPieces(screen, board):
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            piece = board[row][col]
-            if piece != '--':
-                screen.blit(IMAGES[piece], (col * SQ_SIZE, row * SQ_SIZE))
-
-def animateMove(move, screen, board, clock):
-    global colors
-    coords = []
-    # list of coords that the animations will go through
-    dR = move.endRow - move.startRow
-    dC = move.endCol - move.startCol
-    framesPerSquare = 10 # frames to move one square
-    frameCount = (abs(dR) + abs(dC)) * framesPerSquare
-    for frame in range(frameCount + 1):
-        row, col = (move.startRow + frame * dR/ frameCount, move.startCol + frame * dC/ frameCount)
-        drawBoard(screen)
-        drawPieces(screen, board)
-        # Erase the piece moved from its ending square:
-        color = colors[(move.endRow + move.endCol) % 2]
-        endSquare = pygame.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        pygame.draw.rect(screen, color, endSquare)
-        # Draw captured piece onto rectangle
+            s.fill(pygame.Color(color))
+            self.highlights[name] = s
+        self.moveLogFont = pygame.font.SysFont('Helvetica', 16, True, False)
+        self.textFont = pygame.font.SysFont('Helvetica', 32, True, False)
+        self.textCache = {}
+        self.invalidate()
+
+    def invalidate(self):
+        # Forget what is on the screen, so the next frame is drawn in full
+        self.squares = [[None] * DIMENSION for row in range(DIMENSION)]
+        self.moveLogState = None
+        self.text = ''
+        self.textRect = None
+
+    def renderText(self, font, text, colorName, antialias):
+        key = (font, text, colorName, antialias)
+        surface = self.textCache.get(key)
+        if surface is None:
+            if len(self.textCache) >= TEXT_CACHE_SIZE:
+                self.textCache.clear()
+            surface = self.textCache[key] = font.render(text, antialias, pygame.Color(colorName))
+        return surface
+
+    def drawGameState(self, gs, validMoves, sqSelected, thinking, text):
+        highlights = {}
+        if sqSelected != ():
+            row, col = sqSelected
+            if gs.board[row][col][0] == ('w' if gs.whiteToMove else 'b'):
+                highlights[sqSelected] = 'selected'
+                for move in validMoves:
+                    if move.startRow == row and move.startCol == col:
+                        highlights[(move.endRow, move.endCol)] = 'target'
+        rects = self.drawSquares([[(gs.board[row][col], highlights.get((row, col))) for col in range(DIMENSION)]
+                                  for row in range(DIMENSION)])
+        rects += self.drawMoveLog(gs.moveLog, thinking)
+        rects += self.drawText(text, rects)
+        return rects
+
+    def drawSquares(self, squares):
+        # squares[row][col] is the (piece, highlight) the square should show; only the
+        # squares that show something else now are drawn
+        rects = []
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                square = squares[row][col]
+                if square != self.squares[row][col]:
+                    self.squares[row][col] = square
+                    rects.append(self.drawSquare(row, col, square))
+        return rects
+
+    def drawSquare(self, row, col, square):
+        piece, highlight = square
+        rect = squareRect(row, col)
+        self.screen.blit(self.boardSurface, rect, rect)
+        if highlight is not None:
+            self.screen.blit(self.highlights[highlight], rect)
+        if piece != '--':
+            self.screen.blit(IMAGES[piece], rect)
+        return rect
+
+    def drawMoveLog(self, moveLog, thinking):
+        state = (tuple(moveLog), thinking)
+        if state == self.moveLogState:
+            return []
+        self.moveLogState = state
+        moveLogRect = pygame.Rect(WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
+        self.screen.fill(pygame.Color('black'), moveLogRect)
+        padding = 5
+        lineSpacing = 2
+        textY = padding
+        for i in range (0, len(moveLog), 2):
+            moveString = str(i // 2 + 1) + '. ' + moveLog[i].getChessNotation() + ' - '
+            if i + 1 < len(moveLog):
+                moveString += moveLog[i + 1].getChessNotation()
+            textObject = self.renderText(self.moveLogFont, moveString, 'white', True)
+            self.screen.blit(textObject, moveLogRect.move(padding, textY))
+            textY += textObject.get_height() + lineSpacing
+        if thinking:
+            textObject = self.renderText(self.moveLogFont, 'Thinking...', 'yellow', True)
+            self.screen.blit(textObject, (WIDTH + 5, MOVE_LOG_PANEL_HEIGHT - textObject.get_height() - 5))
+        return [moveLogRect]
+
+    def drawText(self, text, dirtyRects):
+        # The game-over message lies on top of the board: it is drawn again whenever a square
+        # under it was redrawn, and the squares it covered are redrawn once it goes away
+        rects = []
+        if text != self.text and self.textRect is not None:
+            for row in range(DIMENSION):
+                for col in range(DIMENSION):
+                    if squareRect(row, col).colliderect(self.textRect):
+                        rects.append(self.drawSquare(row, col, self.squares[row][col]))
+            self.textRect = None
+        if text:
+            shadow = self.renderText(self.textFont, text, 'Black', False)
+            textLocation = pygame.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH // 2 - shadow.get_width() // 2, HEIGHT // 2 - shadow.get_height() // 2)
+            # The red text is drawn 2 pixels right of and below its black shadow
+            textRect = pygame.Rect(textLocation.left, textLocation.top, shadow.get_width() + 2, shadow.get_height() + 2)
+            if text != self.text or textRect.collidelist(dirtyRects + rects) != -1:
+                self.screen.blit(shadow, textLocation)
+                self.screen.blit(self.renderText(self.textFont, text, 'Red', False), textLocation.move(2, 2))
+                rects.append(textRect)
+            self.textRect = textRect
+        self.text = text
+        return rects
+
+    def animateMove(self, move, board, clock):
+        # board is the position after the move. The board is drawn with the moving piece lifted
+        # off it and what it captured still in place, then each frame only restores the piece's
+        # last rectangle from a copy of that picture and draws the piece at its next one.
+        squares = [[(board[row][col], None) for col in range(DIMENSION)] for row in range(DIMENSION)]
+        squares[move.endRow][move.endCol] = ('--', None)
         if move.pieceCaptured != '--':
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
-        # Draw moving piece
-        screen.blit(IMAGES[move.pieceMoved], pygame.Rect(col*SQ_SIZE, row*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        pygame.display.flip()
-        clock.tick(60)
-
-def drawText(screen, text):
-    font = pygame.font.SysFont('Helvetica', 32, True, False)
-    textObject = font.render(text, 0, pygame.Color('Black'))
-    textLocation = pygame.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH // 2 - textObject.get_width() // 2, HEIGHT // 2 - textObject.get_height() // 2)
-    screen.blit(textObject, textLocation)
-    textObject = font.render(text, 0, pygame.Color('Red'))
-    screen.blit(textObject, textLocation.move(2, 2))
+            if move.isEnpassantMove:
+                squares[move.startRow][move.endCol] = (move.pieceCaptured, None)
+            else:
+                squares[move.endRow][move.endCol] = (move.pieceCaptured, None)
+        rects = self.drawSquares(squares)
+        rects += self.drawText('', rects)
+        background = self.screen.subsurface(pygame.Rect(0, 0, WIDTH, HEIGHT)).copy()
+        dR = move.endRow - move.startRow
+        dC = move.endCol - move.startCol
+        framesPerSquare = 10 # frames to move one square
+        frameCount = (abs(dR) + abs(dC)) * framesPerSquare
+        pieceRect = None
+        for frame in range(frameCount + 1):
+            row, col = (move.startRow + frame * dR/ frameCount, move.startCol + frame * dC/ frameCount)
+            if pieceRect is not None:
+                self.screen.blit(background, pieceRect, pieceRect)
+                rects.append(pieceRect)
+            pieceRect = pygame.Rect(int(col * SQ_SIZE), int(row * SQ_SIZE), SQ_SIZE, SQ_SIZE)
+            self.screen.blit(IMAGES[move.pieceMoved], pieceRect)
+            rects.append(pieceRect)
+            pygame.display.update(rects)
+            rects = []
+            clock.tick(60)
+        # The piece is left on the end square, which the next frame redraws as it should look
+
+
 if __name__ == '__main__':
     main()
 
@@ -0,0 +1,123 @@
+import json
+import os
+
+# Material values and piece-square tables shared by MoveFinder.scoreBoard and the
+# running scores GameState keeps up to date in makeMove/undoMove. A weights file
+# (see Tuner.py) next to this module replaces them at startup.
+piece_score = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
+
+knight_scores = [[0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
+                 [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
+                 [0.2, 0.5, 0.6, 0.65, 0.65, 0.6, 0.5, 0.2],
+                 [0.2, 0.55, 0.65, 0.7, 0.7, 0.65, 0.55, 0.2],
+                 [0.2, 0.5, 0.65, 0.7, 0.7, 0.65, 0.5, 0.2],
+                 [0.2, 0.55, 0.6, 0.65, 0.65, 0.6, 0.55, 0.2],
+                 [0.1, 0.3, 0.5, 0.55, 0.55, 0.5, 0.3, 0.1],
+                 [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0]]
+
+bishop_scores = [[0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
+                 [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
+                 [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
+                 [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
+                 [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
+                 [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
+                 [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
+                 [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0]]
+
+rook_scores = [[0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25],
+               [0.5, 0.75, 0.75, 0.75, 0.75, 0.75, 0.75, 0.5],
+               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
+               [0.25, 0.25, 0.25, 0.5, 0.5, 0.25, 0.25, 0.25]]
+
+queen_scores = [[0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
+                [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
+                [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
+                [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
+                [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
+                [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
+                [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
+                [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0]]
+
+pawn_scores = [[0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
+               [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
+               [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
+               [0.25, 0.25, 0.3, 0.45, 0.45, 0.3, 0.25, 0.25],
+               [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
+               [0.25, 0.15, 0.1, 0.2, 0.2, 0.1, 0.15, 0.25],
+               [0.25, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.25],
+               [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2]]
+
+king_scores = [[0.0] * 8 for row in range(8)]
+
+piece_position_scores = {"wN": knight_scores,
+                         "bN": knight_scores[::-1],
+                         "wB": bishop_scores,
+                         "bB": bishop_scores[::-1],
+                         "wQ": queen_scores,
+                         "bQ": queen_scores[::-1],
+                         "wR": rook_scores,
+                         "bR": rook_scores[::-1],
+                         "wp": pawn_scores,
+                         "bp": pawn_scores[::-1],
+                         "wK": king_scores,
+                         "bK": king_scores[::-1]}
+
+# position_scores[piece][row * 8 + col]: piece-square bonus
+position_scores = {piece: [table[row][col] for row in range(8) for col in range(8)]
+                   for piece, table in piece_position_scores.items()}
+
+# Tables a weights file can set, by the names it uses for them (white's view, row 0 = rank 8)
+WEIGHT_TABLES = {'pawn_scores': pawn_scores, 'knight_scores': knight_scores, 'bishop_scores': bishop_scores,
+                 'rook_scores': rook_scores, 'queen_scores': queen_scores, 'king_scores': king_scores}
+WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'weights.json')
+
+
+def computeScores(board):
+    # Full rescan: (whiteMaterial, blackMaterial, whitePosition, blackPosition)
+    material = {"w": 0, "b": 0}
+    position = {"w": 0.0, "b": 0.0}
+    for row in range(8):
+        for col in range(8):
+            square = board[row][col]
+            if square == '--':
+                continue
+            material[square[0]] += piece_score[square[1]]
+            position[square[0]] += position_scores[square][row * 8 + col]
+    return material["w"], material["b"], position["w"], position["b"]
+
+
+def currentWeights():
+    # The material values and tables in use, in weights file form
+    weights = {'piece_score': dict(piece_score)}
+    for name, table in WEIGHT_TABLES.items():
+        weights[name] = [row[:] for row in table]
+    return weights
+
+
+def applyWeights(weights):
+    # Set material values and tables from a weights dict: a weights file's contents (any subset
+    # of piece_score and the WEIGHT_TABLES), or just material values ({"Q": 9.5}). Everything is
+    # changed in place, so modules that imported the tables see the new values; GameStates that
+    # already exist keep their running totals until resetDerivedState.
+    if 'piece_score' not in weights and not any(name in weights for name in WEIGHT_TABLES):
+        weights = {'piece_score': weights}
+    piece_score.update(weights.get('piece_score', {}))
+    for name, table in WEIGHT_TABLES.items():
+        if name in weights:
+            for row, values in zip(table, weights[name]):
+                row[:] = values
+    for piece, table in piece_position_scores.items():
+        position_scores[piece][:] = [table[row][col] for row in range(8) for col in range(8)]
+
+
+def loadWeights(path):
+    with open(path) as f:
+        applyWeights(json.load(f))
+
+
+if os.path.exists(WEIGHTS_FILE):
+    loadWeights(WEIGHTS_FILE)
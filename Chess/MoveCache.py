@@ -0,0 +1,39 @@
+from collections import OrderedDict
+
+# Default number of positions kept. An entry holds a list of about 35 moves, roughly 4 KB
+# with the Move objects, so the default stays around 16 MB.
+DEFAULT_ENTRIES = 4096
+
+
+class MoveCache:
+    # Legal moves of recently seen positions, keyed by Zobrist key (which covers the side to
+    # move, castling rights and the en passant square). When full, the least recently used
+    # position is dropped.
+    def __init__(self, maxEntries=DEFAULT_ENTRIES):
+        self.maxEntries = maxEntries
+        self.clear()
+
+    def clear(self):
+        # key -> (moves, checkMate, staleMate)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, moves, checkMate, staleMate):
+        self.entries[key] = (moves, checkMate, staleMate)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -1,68 +1,142 @@
 import random
-import chess
-from copy import deepcopy
-
-piece_score = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
-
-knight_scores = [[0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
-                 [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
-                 [0.2, 0.5, 0.6, 0.65, 0.65, 0.6, 0.5, 0.2],
-                 [0.2, 0.55, 0.65, 0.7, 0.7, 0.65, 0.55, 0.2],
-                 [0.2, 0.5, 0.65, 0.7, 0.7, 0.65, 0.5, 0.2],
-                 [0.2, 0.55, 0.6, 0.65, 0.65, 0.6, 0.55, 0.2],
-                 [0.1, 0.3, 0.5, 0.55, 0.55, 0.5, 0.3, 0.1],
-                 [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0]]
-
-bishop_scores = [[0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-                 [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-                 [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
-                 [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
-                 [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
-                 [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
-                 [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
-                 [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0]]
-
-rook_scores = [[0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25],
-               [0.5, 0.75, 0.75, 0.75, 0.75, 0.75, 0.75, 0.5],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.25, 0.25, 0.25, 0.5, 0.5, 0.25, 0.25, 0.25]]
-
-queen_scores = [[0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
-                [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-                [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-                [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-                [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-                [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-                [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
-                [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0]]
-
-pawn_scores = [[0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
-               [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
-               [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
-               [0.25, 0.25, 0.3, 0.45, 0.45, 0.3, 0.25, 0.25],
-               [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
-               [0.25, 0.15, 0.1, 0.2, 0.2, 0.1, 0.15, 0.25],
-               [0.25, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.25],
-               [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2]]
-
-piece_position_scores = {"wN": knight_scores,
-                         "bN": knight_scores[::-1],
-                         "wB": bishop_scores,
-                         "bB": bishop_scores[::-1],
-                         "wQ": queen_scores,
-                         "bQ": queen_scores[::-1],
-                         "wR": rook_scores,
-                         "bR": rook_scores[::-1],
-                         "wp": pawn_scores,
-                         "bp": pawn_scores[::-1]}
+import time
+from Chess.TranspositionTable import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+from Chess.Evaluation import piece_score, knight_scores, bishop_scores, rook_scores, queen_scores, pawn_scores, \
+    piece_position_scores
 
 CHECKMATE = 1000
 STALEMATE = 0
 DEPTH = 3
+nextMove = None
+# Filled in by findBestMove: depth and score (for the side to move) of the last
+# completed iteration, and the nodes visited by the main search and by the quiescence search
+depthReached = 0
+searchScore = 0
+nodesSearched = 0
+quiescenceNodes = 0
+# Budget of the running search; None means unlimited
+deadline = None
+nodeBudget = None
+# threading.Event of the running search; once set, the search stops at the next node
+stopSignal = None
+# OpeningBook consulted before searching; None searches every position
+openingBook = None
+# Tablebase probed at the root and inside the search; None searches endgames like any position
+tablebase = None
+# Memory budget of the transposition table shared by all searches
+HASH_SIZE_MB = 16
+transpositionTable = TranspositionTable(HASH_SIZE_MB)
+# How often (in nodes) the search looks at the clock
+CLOCK_CHECK_INTERVAL = 128
+# Move ordering: victim/attacker values for MVV-LVA and the per-ply tables of
+# quiet moves that caused beta cutoffs
+MAX_PLY = 64
+mvv_lva_values = {"K": 10, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
+killerMoves = [[None, None] for ply in range(MAX_PLY)]
+# (pieceMoved, end square) -> bonus earned by quiet moves that caused cutoffs
+historyScores = {}
+# Quiescence search: captures that can't lift the score to within this margin of alpha are skipped
+DELTA_MARGIN = 2
+# Static exchange values; the king is only used as the last recapturer
+see_values = {"K": 100, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
+# Selective search: principal variation search, aspiration windows, null-move pruning and
+# late move reductions. Off, every move is searched to full depth with the full window.
+SELECTIVE_SEARCH = True
+# Width of the windows that only test whether a score beats alpha, for the piece-square
+# evaluation: its weights have at most two decimals (Tuner.py rounds them), so its scores move
+# in steps of 0.01. An Nnue network's scores move in steps of 1 / outputScale (see scoutWindow).
+SCOUT_WINDOW = 0.01
+# Half-width of the root window around the previous iteration's score
+ASPIRATION_WINDOW = 0.5
+# Null move: depth reduction, and the least remaining depth it is tried at
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+# Late move reductions: quiet moves from this index on, at this depth and deeper, are
+# searched one ply shallower first (two plies from LMR_DEEP_MOVES on)
+LMR_MIN_MOVES = 3
+LMR_DEEP_MOVES = 6
+LMR_MIN_DEPTH = 3
+# Whether findBestMove collects the detailed statistics by default; collectStats overrides it per call
+COLLECT_STATS = False
+# SearchStats of the last findBestMove call
+searchStats = None
+# SearchStats the search hooks write to; None while statistics are off, so each hook is a single test
+activeStats = None
+
+
+class SearchStats:
+    # What one findBestMove call did. The node counts, depth and time are always filled in;
+    # the cutoff, transposition table and timing counters only when statistics were collected.
+    def __init__(self, collected=False):
+        self.collected = collected
+        # 'search', 'book' or 'tablebase'
+        self.source = 'search'
+        self.depthReached = 0
+        self.nodes = 0
+        self.quiescenceNodes = 0
+        self.time = 0.0
+        # Nodes whose moves were searched, and how many of them failed high
+        self.expandedNodes = 0
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.ttCutoffs = 0
+        self.nullMoveCutoffs = 0
+        # Reduced and zero-window searches that had to be repeated
+        self.reSearches = 0
+        self.moveGenCalls = 0
+        self.moveGenTime = 0.0
+        self.evalCalls = 0
+        self.evalTime = 0.0
+
+    @property
+    def totalNodes(self):
+        return self.nodes + self.quiescenceNodes
+
+    @property
+    def nps(self):
+        return self.totalNodes / self.time if self.time > 0 else 0
+
+    @property
+    def cutoffRate(self):
+        return self.betaCutoffs / self.expandedNodes if self.expandedNodes else 0
+
+    @property
+    def firstMoveCutoffRate(self):
+        # Share of cutoffs made by the first move tried: a measure of move ordering
+        return self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0
+
+    @property
+    def ttHitRate(self):
+        return self.ttHits / self.ttProbes if self.ttProbes else 0
+
+    def asDict(self):
+        stats = {'source': self.source, 'depth': self.depthReached, 'nodes': self.nodes,
+                 'quiescenceNodes': self.quiescenceNodes, 'time': self.time, 'nps': self.nps}
+        if self.collected:
+            stats.update({'expandedNodes': self.expandedNodes, 'betaCutoffs': self.betaCutoffs,
+                          'cutoffRate': self.cutoffRate, 'firstMoveCutoffRate': self.firstMoveCutoffRate,
+                          'ttProbes': self.ttProbes, 'ttHits': self.ttHits, 'ttHitRate': self.ttHitRate,
+                          'ttCutoffs': self.ttCutoffs, 'nullMoveCutoffs': self.nullMoveCutoffs,
+                          'reSearches': self.reSearches, 'moveGenCalls': self.moveGenCalls,
+                          'moveGenTime': self.moveGenTime, 'evalCalls': self.evalCalls, 'evalTime': self.evalTime})
+        return stats
+
+    def __str__(self):
+        line = 'depth %d nodes %d qnodes %d time %.3fs nps %.0f' % (self.depthReached, self.nodes, self.quiescenceNodes,
+                                                                     self.time, self.nps)
+        if self.collected:
+            line += ' cutoffs %.1f%% first-move %.1f%% tt hits %d/%d (%.1f%%) null cutoffs %d re-searches %d' \
+                    ' movegen %.3fs eval %.3fs' % (100 * self.cutoffRate, 100 * self.firstMoveCutoffRate, self.ttHits,
+                                                   self.ttProbes, 100 * self.ttHitRate, self.nullMoveCutoffs,
+                                                   self.reSearches, self.moveGenTime, self.evalTime)
+        return line
+
+
+class SearchAborted(Exception):
+    # Raised inside the search when its time or node budget runs out
+    pass
 
 
 def findRandomMove(validMoves):
@@ -85,45 +159,458 @@ def scoreBoard(gameState):
     elif gameState.staleMate:
         return STALEMATE
 
-    score = 0
-    for row in range (len(gameState.board)):
-        for col in range (len(gameState.board[row])):
-            piecePositionScore = 0
-            square = gameState.board[row][col]
-            if square == '--':
-                continue
-            if square[1] != 'K':
-                piecePositionScore = piece_position_scores[square][row][col]
-            if square[0] == "w":
-                score += piece_score[square[1]] + piecePositionScore
-            if square[0] == "b":
-                score -= piece_score[square[1]] + piecePositionScore
-    return score
-def findBestMove(gameState, validMoves):
-    global nextMove
-    nextMove = None
-    random.shuffle(validMoves)
-    findMoveNegamaxAlphaBeta(gameState, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gameState.whiteToMove else -1)
-    return nextMove
-def findMoveNegamaxAlphaBeta(gameState, validMoves, depth, alpha, beta, turnMultiplier):
-    print(alpha, beta)
-    global nextMove
+    # With a network attached (see Nnue.py) it scores the position instead of the tables
+    if gameState.nnue is not None:
+        return gameState.nnue.evaluate(gameState.whiteToMove)
+    # GameState keeps these running totals up to date in makeMove/undoMove
+    return (gameState.whiteMaterial + gameState.whitePosition) - (gameState.blackMaterial + gameState.blackPosition)
+
+
+def orderMoves(moves, ply, hashMoveID=None):
+    # Hash move first, then captures by MVV-LVA (most valuable victim, least valuable attacker),
+    # then promotions, then this ply's killer moves, then quiet moves by history score
+    killers = killerMoves[ply] if ply < MAX_PLY else (None, None)
+
+    def moveOrder(move):
+        moveID = move.moveID
+        if moveID == hashMoveID:
+            return 1000000
+        if move.pieceCaptured != '--':
+            return 100000 + 10 * mvv_lva_values[move.pieceCaptured[1]] - mvv_lva_values[move.pieceMoved[1]]
+        if move.isPawnPromotion:
+            return 90000 + mvv_lva_values[move.promoteTo]
+        if moveID == killers[0]:
+            return 80001
+        if moveID == killers[1]:
+            return 80000
+        # Bits 6-11 of the move code are its end square, row * 8 + col
+        return historyScores.get((move.pieceMoved, move.code >> 6 & 63), 0)
+
+    return sorted(moves, key=moveOrder, reverse=True)
+
+
+def recordCutoff(move, depth, ply):
+    # A quiet move refuted the opponent's last move: remember it for siblings and for later searches
+    if move.pieceCaptured != '--' or move.isPawnPromotion or ply >= MAX_PLY:
+        return
+    killers = killerMoves[ply]
+    if killers[0] != move.moveID:
+        killers[1] = killers[0]
+        killers[0] = move.moveID
+    key = (move.pieceMoved, move.code >> 6 & 63)
+    historyScores[key] = historyScores.get(key, 0) + depth * depth
+
+
+def clearMoveOrdering():
+    for killers in killerMoves:
+        killers[0] = killers[1] = None
+    # Keep some history from earlier searches, but let recent cutoffs dominate
+    for key in list(historyScores):
+        historyScores[key] //= 2
+
+
+def findBestMove(gameState, validMoves, maxDepth=None, timeLimit=None, nodeLimit=None, randomize=False,
+                 stopEvent=None, onIteration=None, collectStats=None):
+    # Iterative deepening: search depth 1, 2, ... up to maxDepth until timeLimit (seconds)
+    # or nodeLimit runs out, and return the best move of the last completed iteration.
+    # The depth of that iteration is left in depthReached. randomize shuffles the root
+    # moves first, so equally scored moves are picked at random. Setting stopEvent cancels
+    # the search from another thread; if that happens during depth 1 the result is None.
+    # onIteration(depth, score, bestMove) is called after every completed iteration.
+    # Book and tablebase moves are played without searching; depthReached is 0 then.
+    # What the search did is left in searchStats, with the detailed counters when collectStats
+    # (default COLLECT_STATS) is set.
+    global nextMove, depthReached, searchScore, nodesSearched, quiescenceNodes, deadline, nodeBudget, stopSignal, \
+        searchStats, activeStats
+    if maxDepth is None:
+        maxDepth = DEPTH
+    if collectStats is None:
+        collectStats = COLLECT_STATS
+    searchStats = SearchStats(collectStats)
+    if openingBook is not None:
+        bookMove = openingBook.findMove(gameState, validMoves, randomize)
+        if bookMove is not None:
+            nodesSearched = quiescenceNodes = depthReached = searchScore = 0
+            searchStats.source = 'book'
+            nextMove = bookMove
+            return bookMove
+    if tablebase is not None:
+        result = tablebase.bestMove(gameState, validMoves)
+        if result is not None:
+            nodesSearched = quiescenceNodes = depthReached = 0
+            searchStats.source = 'tablebase'
+            nextMove, searchScore = result
+            return nextMove
+    if randomize:
+        random.shuffle(validMoves)
+    clearMoveOrdering()
+    transpositionTable.newSearch()
+    nodesSearched = 0
+    quiescenceNodes = 0
+    depthReached = 0
+    searchScore = 0
+    deadline = None
+    nodeBudget = None
+    stopSignal = stopEvent
+    startTime = time.time()
+    movesMade = len(gameState.moveLog)
+    bestMove = None
+    activeStats = searchStats if collectStats else None
+    try:
+        for depth in range(1, maxDepth + 1):
+            # Depth 1 always completes, so there is always a move to return
+            if depth > 1:
+                deadline = startTime + timeLimit if timeLimit is not None else None
+                nodeBudget = nodeLimit
+            nextMove = None
+            try:
+                score = searchRoot(gameState, validMoves, depth, searchScore if depth > 1 else None)
+            except SearchAborted:
+                # Take back the moves the unfinished iteration left on the board
+                while len(gameState.moveLog) > movesMade:
+                    gameState.undoMove()
+                break
+            bestMove = nextMove
+            depthReached = depth
+            searchScore = score
+            if onIteration is not None:
+                onIteration(depth, score, bestMove)
+            # Mate scores don't depend on distance, so deeper iterations can't change a proven mate
+            if abs(score) >= CHECKMATE:
+                break
+            if (timeLimit is not None and time.time() - startTime >= timeLimit) or \
+                    (nodeLimit is not None and nodesSearched + quiescenceNodes >= nodeLimit):
+                break
+    finally:
+        # Direct calls to findMoveNegamaxAlphaBeta after this run without a budget or statistics
+        deadline = nodeBudget = stopSignal = activeStats = None
+    searchStats.depthReached = depthReached
+    searchStats.nodes = nodesSearched
+    searchStats.quiescenceNodes = quiescenceNodes
+    searchStats.time = time.time() - startTime
+    nextMove = bestMove
+    return bestMove
+
+
+def searchRoot(gameState, validMoves, depth, previousScore):
+    # One iteration of findBestMove. The selective search first tries a window around the
+    # previous iteration's score and only widens it when the score falls outside.
+    turnMultiplier = 1 if gameState.whiteToMove else -1
+    if not SELECTIVE_SEARCH or previousScore is None or abs(previousScore) >= CHECKMATE:
+        return findMoveNegamaxAlphaBeta(gameState, validMoves, depth, -CHECKMATE, CHECKMATE, turnMultiplier)
+    alpha, beta = previousScore - ASPIRATION_WINDOW, previousScore + ASPIRATION_WINDOW
+    while True:
+        score = findMoveNegamaxAlphaBeta(gameState, validMoves, depth, alpha, beta, turnMultiplier)
+        if score <= alpha and alpha > -CHECKMATE:
+            alpha = -CHECKMATE
+        elif score >= beta and beta < CHECKMATE:
+            beta = CHECKMATE
+        else:
+            return score
+        if activeStats is not None:
+            activeStats.reSearches += 1
+
+
+def scoutWindow(gameState):
+    # The smallest step between two scores of gameState's evaluation. A zero window any wider
+    # could hide a move that beats alpha by less than the window.
+    if gameState.nnue is not None:
+        return 1 / gameState.nnue.network.outputScale
+    return SCOUT_WINDOW
+
+
+def hasNonPawnMaterial(gameState):
+    # Null moves are unsafe in pawn endings, where having to move is often what loses (zugzwang)
+    color = 'w' if gameState.whiteToMove else 'b'
+    for row in gameState.board:
+        for piece in row:
+            if piece[0] == color and piece[1] in 'NBRQ':
+                return True
+    return False
+
+
+def principalVariation(gameState, firstMove, maxLength=MAX_PLY):
+    # Expected line of play: firstMove, then the best moves the transposition table
+    # holds for the positions that follow, until it runs out or a position repeats
+    line = [firstMove]
+    gameState.makeMove(firstMove)
+    seen = {gameState.zobristKey}
+    while len(line) < maxLength:
+        entry = transpositionTable.probe(gameState.zobristKey)
+        if entry is None:
+            break
+        move = next((move for move in gameState.getValidMoves() if move.moveID == entry[4]), None)
+        if move is None:
+            break
+        line.append(move)
+        gameState.makeMove(move)
+        if gameState.zobristKey in seen:
+            break
+        seen.add(gameState.zobristKey)
+    for move in line:
+        gameState.undoMove()
+    return line
+
+
+def findMoveNegamaxAlphaBeta(gameState, validMoves, depth, alpha, beta, turnMultiplier, ply=0, allowNullMove=True):
+    # Searches in place: every move is made on gameState and taken back before the next one.
+    # validMoves may be None, so positions answered by the transposition table skip move generation.
+    # allowNullMove is False right after a null move, so the search never passes twice in a row.
+    global nextMove, nodesSearched
     if depth == 0:
-        return turnMultiplier * scoreBoard(gameState)
+        return quiescenceSearch(gameState, alpha, beta, turnMultiplier, ply)
+    nodesSearched += 1
+    checkBudget()
+    if tablebase is not None and ply != 0:
+        score = tablebase.probeScore(gameState)
+        if score is not None:
+            return score
+    alphaOrig = alpha
+    hashMoveID = None
+    entry = transpositionTable.probe(gameState.zobristKey)
+    if activeStats is not None:
+        activeStats.ttProbes += 1
+        if entry is not None:
+            activeStats.ttHits += 1
+    if entry is not None:
+        entryDepth, entryScore, entryBound, hashMoveID = entry[1:5]
+        if ply != 0 and entryDepth >= depth:
+            if entryBound == EXACT:
+                cutoff = True
+            elif entryBound == LOWER_BOUND:
+                alpha = max(alpha, entryScore)
+                cutoff = alpha >= beta
+            else:
+                beta = min(beta, entryScore)
+                cutoff = alpha >= beta
+            if cutoff:
+                if activeStats is not None:
+                    activeStats.ttCutoffs += 1
+                return entryScore
+    inCheck = SELECTIVE_SEARCH and gameState.inCheck()
+    window = scoutWindow(gameState)
+    nullMove = SELECTIVE_SEARCH and allowNullMove and ply != 0 and depth >= NULL_MOVE_MIN_DEPTH and not inCheck and \
+        beta < CHECKMATE
+    if nullMove:
+        if activeStats is not None:
+            start = time.perf_counter()
+        nullMove = turnMultiplier * scoreBoard(gameState) >= beta
+        if activeStats is not None:
+            activeStats.evalTime += time.perf_counter() - start
+            activeStats.evalCalls += 1
+    if nullMove and hasNonPawnMaterial(gameState):
+        # Null move: if passing still fails high, a real move almost surely would as well
+        movesMade = len(gameState.moveLog)
+        state = gameState.makeNullMove()
+        try:
+            score = -findMoveNegamaxAlphaBeta(gameState, None, max(0, depth - 1 - NULL_MOVE_REDUCTION), -beta,
+                                              -beta + window, -turnMultiplier, ply + 1, False)
+        except SearchAborted:
+            # Take back the moves above the null move first, so findBestMove finds the moves it expects
+            while len(gameState.moveLog) > movesMade:
+                gameState.undoMove()
+            gameState.undoNullMove(state)
+            raise
+        gameState.undoNullMove(state)
+        if score >= beta:
+            if activeStats is not None:
+                activeStats.nullMoveCutoffs += 1
+            # A mate found after passing isn't a real mate
+            return beta if score >= CHECKMATE else score
+    if validMoves is None:
+        if activeStats is not None:
+            start = time.perf_counter()
+        validMoves = gameState.getValidMoves()
+        if activeStats is not None:
+            activeStats.moveGenTime += time.perf_counter() - start
+            activeStats.moveGenCalls += 1
+    if len(validMoves) == 0:
+        if activeStats is not None:
+            start = time.perf_counter()
+        score = turnMultiplier * scoreBoard(gameState)
+        if activeStats is not None:
+            activeStats.evalTime += time.perf_counter() - start
+            activeStats.evalCalls += 1
+        return score
+
+    validMoves = orderMoves(validMoves, ply, hashMoveID)
+    if activeStats is not None:
+        activeStats.expandedNodes += 1
 
     maxScore = - CHECKMATE
-    for move in validMoves:
-        local_gs = deepcopy(gameState)
-        local_gs.makeMove(move)
-        nextMoves = local_gs.getValidMoves()
-        score = -findMoveNegamaxAlphaBeta(local_gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
-        if score > maxScore:
+    bestMove = None
+    for moveIndex, move in enumerate(validMoves):
+        gameState.makeMove(move)
+        if moveIndex == 0 or not SELECTIVE_SEARCH:
+            score = -findMoveNegamaxAlphaBeta(gameState, None, depth - 1, -beta, -alpha, -turnMultiplier, ply + 1)
+        else:
+            # Principal variation search: the first move is expected to be best, so the others
+            # are only tested against alpha with a zero window. Late quiet moves are tested
+            # at reduced depth. A move that passes the test is searched again in full.
+            reduction = 0
+            if depth >= LMR_MIN_DEPTH and moveIndex >= LMR_MIN_MOVES and not inCheck and \
+                    move.pieceCaptured == '--' and not move.isPawnPromotion and not gameState.inCheck():
+                reduction = min(1 if moveIndex < LMR_DEEP_MOVES else 2, depth - 2)
+            score = -findMoveNegamaxAlphaBeta(gameState, None, depth - 1 - reduction, -alpha - window, -alpha,
+                                              -turnMultiplier, ply + 1)
+            if score > alpha and reduction:
+                if activeStats is not None:
+                    activeStats.reSearches += 1
+                score = -findMoveNegamaxAlphaBeta(gameState, None, depth - 1, -alpha - window, -alpha,
+                                                  -turnMultiplier, ply + 1)
+            if alpha < score < beta:
+                if activeStats is not None:
+                    activeStats.reSearches += 1
+                score = -findMoveNegamaxAlphaBeta(gameState, None, depth - 1, -beta, -alpha, -turnMultiplier, ply + 1)
+        gameState.undoMove()
+        if score > maxScore or bestMove is None:
             maxScore = score
-            if depth == DEPTH:
+            bestMove = move
+            if ply == 0:
                 nextMove = move
 
         if maxScore > alpha:
             alpha = maxScore
         if alpha >= beta:
+            recordCutoff(move, depth, ply)
+            if activeStats is not None:
+                activeStats.betaCutoffs += 1
+                if moveIndex == 0:
+                    activeStats.firstMoveCutoffs += 1
             break
+
+    if maxScore <= alphaOrig:
+        bound = UPPER_BOUND
+    elif maxScore >= beta:
+        bound = LOWER_BOUND
+    else:
+        bound = EXACT
+    transpositionTable.store(gameState.zobristKey, depth, maxScore, bound, bestMove.moveID)
     return maxScore
+
+
+def checkBudget():
+    if stopSignal is not None and stopSignal.is_set():
+        raise SearchAborted()
+    nodes = nodesSearched + quiescenceNodes
+    if nodeBudget is not None and nodes > nodeBudget:
+        raise SearchAborted()
+    if deadline is not None and nodes % CLOCK_CHECK_INTERVAL == 0 and time.time() >= deadline:
+        raise SearchAborted()
+
+
+def quiescenceSearch(gameState, alpha, beta, turnMultiplier, ply):
+    # At the horizon keep searching captures and promotions until the position is quiet,
+    # so a leaf is never scored halfway through an exchange
+    global quiescenceNodes
+    quiescenceNodes += 1
+    checkBudget()
+    if activeStats is not None:
+        start = time.perf_counter()
+    validMoves = gameState.getValidMoves()
+    if activeStats is not None:
+        activeStats.moveGenTime += time.perf_counter() - start
+        activeStats.moveGenCalls += 1
+    inCheck = len(validMoves) != 0 and gameState.inCheck()
+    if inCheck:
+        # No standing pat in check: every evasion is searched
+        standPat = -CHECKMATE
+        moves = validMoves
+    else:
+        # Stand pat: the side to move can usually do at least as well as not capturing.
+        # Without moves this is the score of the mate or stalemate.
+        if activeStats is not None:
+            start = time.perf_counter()
+        standPat = turnMultiplier * scoreBoard(gameState)
+        if activeStats is not None:
+            activeStats.evalTime += time.perf_counter() - start
+            activeStats.evalCalls += 1
+        if standPat >= beta or len(validMoves) == 0:
+            return standPat
+        moves = [move for move in validMoves if move.pieceCaptured != '--' or move.promoteTo == 'Q']
+    if standPat > alpha:
+        alpha = standPat
+
+    for move in orderMoves(moves, ply):
+        if not inCheck:
+            # Delta pruning: even winning the captured piece for free can't raise alpha
+            gain = piece_score[move.pieceCaptured[1]] if move.pieceCaptured != '--' else 0
+            if move.isPawnPromotion:
+                gain += piece_score[move.promoteTo] - piece_score['p']
+            if standPat + gain + DELTA_MARGIN < alpha:
+                continue
+            # Captures that lose material once all recaptures are played out
+            if move.pieceCaptured != '--' and staticExchangeEvaluation(gameState, move) < 0:
+                continue
+        gameState.makeMove(move)
+        score = -quiescenceSearch(gameState, -beta, -alpha, -turnMultiplier, ply + 1)
+        gameState.undoMove()
+        if score >= beta:
+            return score
+        if score > alpha:
+            alpha = score
+    return alpha
+
+
+def staticExchangeEvaluation(gameState, move):
+    # Material the moving side wins (negative: loses) on the target square if both
+    # sides keep recapturing there with their least valuable attacker
+    board = gameState.board
+    row, col = move.endRow, move.endCol
+    # Squares whose pieces have already taken part, treated as empty so x-ray attackers appear.
+    # An en passant capture also empties the square of the pawn it takes.
+    used = {(move.startRow, move.startCol)}
+    if move.isEnpassantMove:
+        used.add((move.startRow, move.endCol))
+    gains = [see_values[move.pieceCaptured[1]]]
+    pieceOnSquare = see_values[move.pieceMoved[1]]
+    color = 'b' if move.pieceMoved[0] == 'w' else 'w'
+    while True:
+        attacker = leastValuableAttacker(board, row, col, color, used)
+        if attacker is None:
+            break
+        # Score of this capture, from the capturing side's point of view
+        gains.append(pieceOnSquare - gains[-1])
+        pieceOnSquare = see_values[board[attacker[0]][attacker[1]][1]]
+        used.add(attacker)
+        color = 'b' if color == 'w' else 'w'
+    # Either side may stop capturing when continuing would lose material
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
+def leastValuableAttacker(board, row, col, color, used):
+    # Square of the cheapest piece of the given color attacking (row, col), or None
+    best = None
+    bestValue = None
+
+    def consider(r, c):
+        nonlocal best, bestValue
+        value = see_values[board[r][c][1]]
+        if bestValue is None or value < bestValue:
+            best, bestValue = (r, c), value
+
+    pawnRow = row + 1 if color == 'w' else row - 1
+    for c in (col - 1, col + 1):
+        if 0 <= pawnRow < 8 and 0 <= c < 8 and board[pawnRow][c] == color + 'p' and (pawnRow, c) not in used:
+            return (pawnRow, c)
+    for dRow, dCol in ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)):
+        r, c = row + dRow, col + dCol
+        if 0 <= r < 8 and 0 <= c < 8 and board[r][c] == color + 'N' and (r, c) not in used:
+            consider(r, c)
+    for j, (dRow, dCol) in enumerate(((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))):
+        for i in range(1, 8):
+            r, c = row + dRow * i, col + dCol * i
+            if not (0 <= r < 8 and 0 <= c < 8):
+                break
+            piece = board[r][c]
+            if piece == '--' or (r, c) in used:
+                continue
+            if piece[0] == color:
+                pieceType = piece[1]
+                if pieceType == 'Q' or (i == 1 and pieceType == 'K') or \
+                        (j < 4 and pieceType == 'R') or (j >= 4 and pieceType == 'B'):
+                    consider(r, c)
+            break
+    return best
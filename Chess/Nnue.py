@@ -0,0 +1,259 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from Chess.ChessEngine import MOVE_SQUARES, ENPASSANT_FLAG, CASTLE_FLAG
+
+# A small HalfKP-style network evaluated with NumPy, as an optional replacement for the
+# piece-square evaluation. Every position is seen from both sides (perspective 0 = white,
+# 1 = black). A perspective's inputs are one-hot features (own king square, piece, square) for
+# every piece but the kings, with the board flipped vertically for black, so both sides share
+# the same weights. The first layer's output for each perspective, the accumulator, is the sum
+# of its active features' weight columns. GameState keeps both accumulators up to date in
+# makeMove/undoMove (see Accumulator), so a leaf only pays for the small dense layers:
+#
+#   accumulators (side to move, other side) -> clipped ReLU -> HIDDEN_SIZE -> clipped ReLU -> 1
+#
+# Weights are integers, as trained networks are usually quantized: activations run from 0 to
+# ACTIVATION_MAX, hidden weights are scaled by 2 ** WEIGHT_SHIFT, and the output divided by
+# the network's outputScale is the score in pawns for the side to move. The dense layers run in
+# float32, which is faster than NumPy's integer products and exact while every sum stays below
+# FLOAT32_EXACT.
+PIECE_TYPES = ('p', 'N', 'B', 'R', 'Q')
+NUM_PIECE_FEATURES = 2 * len(PIECE_TYPES)
+NUM_FEATURES = 64 * NUM_PIECE_FEATURES * 64
+ACCUMULATOR_SIZE = 128
+HIDDEN_SIZE = 32
+ACTIVATION_MAX = 127
+WEIGHT_SHIFT = 6
+OUTPUT_SCALE = ACTIVATION_MAX << WEIGHT_SHIFT
+FLOAT32_EXACT = 1 << 24
+KINGS = ('wK', 'bK')
+# XOR with a square index (row * 8 + col) flips the board vertically for black's perspective
+FLIPS = (0, 56)
+# Offset of each piece's 64 squares within a king square's block, per perspective: the
+# perspective's own pieces first, then the opponent's
+PIECE_OFFSETS = tuple({color + pieceType: ((0 if color == own else len(PIECE_TYPES)) + i) * 64
+                       for color in 'wb' for i, pieceType in enumerate(PIECE_TYPES)}
+                      for own in 'wb')
+
+
+def featureIndex(perspective, kingSquare, piece, square):
+    # Input feature of a (non-king) piece on square, kingSquare being the perspective's own
+    # king; both squares are row * 8 + col as on the board
+    return (kingSquare ^ FLIPS[perspective]) * NUM_PIECE_FEATURES * 64 + PIECE_OFFSETS[perspective][piece] + \
+        (square ^ FLIPS[perspective])
+
+
+def kingSquare(gameState, perspective):
+    row, col = gameState.whiteKingLocation if perspective == 0 else gameState.blackKingLocation
+    return row * 8 + col
+
+
+def fitsIn(weights, dtype):
+    # Whether every weight is within the range of the integer type dtype
+    info = np.iinfo(dtype)
+    return weights.size == 0 or (info.min <= weights.min() and weights.max() <= info.max)
+
+
+class Network:
+    # The quantized weights, and the two halves of an evaluation: building an accumulator from
+    # scratch, and the dense layers that turn a pair of accumulators into a score
+    def __init__(self, featureWeights, featureBias, hiddenWeights, hiddenBias, outputWeights, outputBias,
+                 outputScale=OUTPUT_SCALE):
+        accumulatorSize = featureBias.shape[0]
+        hiddenSize = hiddenBias.shape[0]
+        if featureWeights.shape != (NUM_FEATURES, accumulatorSize) or \
+                hiddenWeights.shape != (2 * accumulatorSize, hiddenSize) or outputWeights.shape != (hiddenSize,):
+            raise ValueError('network shapes don\'t match: features %s, hidden %s, output %s' %
+                             (featureWeights.shape, hiddenWeights.shape, outputWeights.shape))
+        hiddenSums = ACTIVATION_MAX * np.abs(hiddenWeights).astype(np.int64).sum(axis=0) + np.abs(hiddenBias)
+        outputSum = ACTIVATION_MAX * np.abs(outputWeights).astype(np.int64).sum()
+        if max(int(hiddenSums.max()), int(outputSum)) >= FLOAT32_EXACT:
+            raise ValueError('network weights too large for exact float32 evaluation')
+        if not fitsIn(featureWeights, np.int16):
+            raise ValueError('feature weights don\'t fit in int16')
+        self.featureWeights = featureWeights.astype(np.int16)
+        self.featureBias = featureBias.astype(np.int32)
+        self.hiddenWeights = hiddenWeights.astype(np.float32)
+        self.hiddenBias = hiddenBias.astype(np.float32)
+        self.outputWeights = outputWeights.astype(np.float32)
+        self.outputBias = int(outputBias)
+        self.outputScale = float(outputScale)
+
+    def accumulate(self, board, perspective, king):
+        # One perspective's accumulator from every piece on the board (the reference path)
+        features = [featureIndex(perspective, king, piece, row * 8 + col)
+                    for row in range(8) for col in range(8)
+                    for piece in (board[row][col],) if piece != '--' and piece[1] != 'K']
+        return self.featureBias + self.featureWeights[features].sum(axis=0, dtype=np.int32)
+
+    def evaluate(self, us, them):
+        # Score in pawns for the side whose accumulator is us
+        # (np.maximum/np.minimum, because np.clip costs more than the product on arrays this small)
+        inputs = np.concatenate((us, them)).astype(np.float32)
+        np.maximum(inputs, 0, out=inputs)
+        np.minimum(inputs, ACTIVATION_MAX, out=inputs)
+        hidden = inputs @ self.hiddenWeights
+        hidden += self.hiddenBias
+        # An arithmetic shift right, as the integer layer would do it
+        hidden *= 1.0 / (1 << WEIGHT_SHIFT)
+        np.floor(hidden, out=hidden)
+        np.maximum(hidden, 0, out=hidden)
+        np.minimum(hidden, ACTIVATION_MAX, out=hidden)
+        return (int(hidden @ self.outputWeights) + self.outputBias) / self.outputScale
+
+    def evaluatePosition(self, gameState):
+        # Full recompute of both accumulators: white's score in pawns, like scoreBoard. Slow;
+        # it is what the incremental accumulators are checked against.
+        white = self.accumulate(gameState.board, 0, kingSquare(gameState, 0))
+        black = self.accumulate(gameState.board, 1, kingSquare(gameState, 1))
+        if gameState.whiteToMove:
+            return self.evaluate(white, black)
+        return -self.evaluate(black, white)
+
+
+class Accumulator:
+    # Both perspectives' accumulators for one GameState, assigned to its nnue attribute.
+    # makeMove adds the weight columns of the pieces a move put down and subtracts those of
+    # the pieces it picked up; a king move rebuilds its own side's accumulator, since every
+    # feature of that perspective depends on the king square. undoMove pops the previous pair.
+    # Null moves leave the board, and so the accumulators, unchanged.
+    def __init__(self, network, gameState):
+        self.network = network
+        self.refresh(gameState)
+
+    def refresh(self, gameState):
+        self.values = (self.network.accumulate(gameState.board, 0, kingSquare(gameState, 0)),
+                       self.network.accumulate(gameState.board, 1, kingSquare(gameState, 1)))
+        self.stack = []
+
+    def makeMove(self, gameState, move):
+        # Called at the end of gameState.makeMove, with the board already updated
+        startRow, startCol, endRow, endCol = MOVE_SQUARES[move.code & 0xFFF]
+        flags = move.code >> 12
+        removed = [(move.pieceMoved, startRow * 8 + startCol)]
+        added = [(gameState.board[endRow][endCol], endRow * 8 + endCol)]
+        if move.pieceCaptured != '--':
+            capturedSquare = startRow * 8 + endCol if flags == ENPASSANT_FLAG else endRow * 8 + endCol
+            removed.append((move.pieceCaptured, capturedSquare))
+        if flags == CASTLE_FLAG:
+            rook = move.pieceMoved[0] + 'R'
+            if endCol - startCol == 2:
+                removed.append((rook, endRow * 8 + endCol + 1))
+                added.append((rook, endRow * 8 + endCol - 1))
+            else:
+                removed.append((rook, endRow * 8 + endCol - 2))
+                added.append((rook, endRow * 8 + endCol + 1))
+        weights = self.network.featureWeights
+        values = []
+        for perspective in (0, 1):
+            king = kingSquare(gameState, perspective)
+            if move.pieceMoved == KINGS[perspective]:
+                values.append(self.network.accumulate(gameState.board, perspective, king))
+                continue
+            value = self.values[perspective].copy()
+            for piece, square in added:
+                if piece[1] != 'K':
+                    value += weights[featureIndex(perspective, king, piece, square)]
+            for piece, square in removed:
+                if piece[1] != 'K':
+                    value -= weights[featureIndex(perspective, king, piece, square)]
+            values.append(value)
+        self.stack.append(self.values)
+        self.values = tuple(values)
+
+    def undoMove(self):
+        self.values = self.stack.pop()
+
+    def evaluate(self, whiteToMove):
+        # White's score in pawns, like scoreBoard
+        white, black = self.values
+        if whiteToMove:
+            return self.network.evaluate(white, black)
+        return -self.network.evaluate(black, white)
+
+
+def loadNetwork(path):
+    # A network saved by saveNetwork: an .npz file with the six weight arrays (and optionally
+    # outputScale), e.g. exported from a trainer after quantizing
+    data = np.load(path)
+    outputScale = float(data['outputScale']) if 'outputScale' in data else OUTPUT_SCALE
+    return Network(data['featureWeights'], data['featureBias'], data['hiddenWeights'], data['hiddenBias'],
+                   data['outputWeights'], data['outputBias'], outputScale)
+
+
+def saveNetwork(path, network):
+    # The hidden and output weights are stored as int8, which a network built with larger ones can't be
+    if not fitsIn(network.hiddenWeights, np.int8) or not fitsIn(network.outputWeights, np.int8):
+        raise ValueError('hidden and output weights must fit in int8 to be saved')
+    np.savez_compressed(path, featureWeights=network.featureWeights, featureBias=network.featureBias,
+                        hiddenWeights=network.hiddenWeights.astype(np.int8), hiddenBias=network.hiddenBias,
+                        outputWeights=network.outputWeights.astype(np.int8), outputBias=network.outputBias,
+                        outputScale=network.outputScale)
+
+
+def randomNetwork(seed=0, accumulatorSize=ACCUMULATOR_SIZE, hiddenSize=HIDDEN_SIZE):
+    # Untrained network of the right shapes, for benchmarks and consistency checks
+    rng = np.random.default_rng(seed)
+    return Network(rng.integers(-8, 9, (NUM_FEATURES, accumulatorSize)), rng.integers(0, 64, accumulatorSize),
+                   rng.integers(-16, 17, (2 * accumulatorSize, hiddenSize)), rng.integers(0, 1 << WEIGHT_SHIFT, hiddenSize),
+                   rng.integers(-8, 9, hiddenSize), 0)
+
+
+if __name__ == '__main__':
+    # Checks the incremental accumulators against the full recompute along random games, then
+    # compares evaluations per second with scoreBoard
+    from Chess.ChessEngine import GameState
+    from Chess import MoveFinder
+    parser = argparse.ArgumentParser(description='Consistency check and benchmark of the NNUE evaluation')
+    parser.add_argument('--network', help='network file (default: a random network)')
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    network = loadNetwork(args.network) if args.network else randomNetwork(args.seed)
+    random.seed(args.seed)
+    positions = []
+    mismatches = 0
+    for game in range(args.games):
+        gs = GameState()
+        gs.nnue = Accumulator(network, gs)
+        for ply in range(120):
+            validMoves = gs.getValidMoves()
+            if abs(gs.nnue.evaluate(gs.whiteToMove) - network.evaluatePosition(gs)) > 1e-9:
+                mismatches += 1
+            positions.append(GameState.fromFEN(gs.toFEN()))
+            if len(validMoves) == 0:
+                break
+            # Take some moves back now and then, so undoMove is checked too
+            if ply > 10 and random.random() < 0.1:
+                gs.undoMove()
+                gs.undoMove()
+            else:
+                gs.makeMove(random.choice(validMoves))
+    print('positions: %d, mismatches: %d' % (len(positions), mismatches))
+
+    def rate(function, items):
+        start = time.time()
+        for item in items:
+            function(item)
+        return len(items) / (time.time() - start)
+
+    print('scoreBoard:           %9.0f evals/s' % rate(MoveFinder.scoreBoard, positions * 5))
+    for gs in positions:
+        gs.nnue = Accumulator(network, gs)
+    print('nnue (incremental):   %9.0f evals/s' % rate(lambda gs: gs.nnue.evaluate(gs.whiteToMove), positions * 5))
+    print('nnue (full recompute): %8.0f evals/s' % rate(network.evaluatePosition, positions))
+    # What keeping the accumulators up to date adds to makeMove/undoMove
+    plain = [GameState.fromFEN(gs.toFEN()) for gs in positions]
+    pairs = [(gs, move) for gs in plain for move in gs.getValidMoves()[:5]]
+    withNnue = [(gs, move) for gs in positions for move in gs.getValidMoves()[:5]]
+
+    def makeUndo(pair):
+        pair[0].makeMove(pair[1])
+        pair[0].undoMove()
+
+    print('makeMove/undoMove:    %9.0f pairs/s plain, %.0f with accumulators' %
+          (rate(makeUndo, pairs), rate(makeUndo, withNnue)))
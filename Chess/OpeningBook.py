@@ -0,0 +1,129 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+
+from Chess.ChessEngine import GameState
+from Chess.Pgn import readGames, parseSAN
+
+# One record per (position, move): Zobrist key, move ID, weight; big-endian, sorted by key
+RECORD = struct.Struct('>QHH')
+MAX_WEIGHT = 0xFFFF
+
+
+class OpeningBook:
+    # Read-only view of a book file. The file is memory-mapped rather than read, so every
+    # engine process using the same book shares one copy of its pages.
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.numRecords = size // RECORD.size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b''
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def keyAt(self, index):
+        return struct.unpack_from('>Q', self.data, index * RECORD.size)[0]
+
+    def lookup(self, key):
+        # [(moveID, weight)] stored for the position with this key
+        low, high = 0, self.numRecords
+        while low < high:
+            mid = (low + high) // 2
+            if self.keyAt(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        entries = []
+        index = low
+        while index < self.numRecords:
+            recordKey, moveID, weight = RECORD.unpack_from(self.data, index * RECORD.size)
+            if recordKey != key:
+                break
+            entries.append((moveID, weight))
+            index += 1
+        return entries
+
+    def findMove(self, gameState, validMoves, randomize=True):
+        # A book move for gameState, or None when the position isn't in the book. With randomize
+        # moves are picked with probability proportional to their weight, else the heaviest is played.
+        movesByID = {move.moveID: move for move in validMoves}
+        # Entries whose move isn't legal here come from a key collision and are ignored
+        entries = [(movesByID[moveID], weight) for moveID, weight in self.lookup(gameState.zobristKey)
+                   if moveID in movesByID and weight > 0]
+        if not entries:
+            return None
+        if not randomize:
+            return max(entries, key=lambda entry: entry[1])[0]
+        pick = random.randrange(sum(weight for move, weight in entries))
+        for move, weight in entries:
+            if pick < weight:
+                return move
+            pick -= weight
+
+
+def buildBook(pgnPaths, outPath, maxPlies=20, minGames=1):
+    # Write a book of the first maxPlies moves of every game in the PGN files. A move's weight
+    # is 2 per win and 1 per draw for the side that played it, so losing moves stay out of the book.
+    # Moves seen in fewer than minGames games are left out. Returns the number of records.
+    counts = {}
+    weights = {}
+    for path in pgnPaths:
+        with open(path) as f:
+            for tags, sanMoves, result in readGames(f):
+                if 'FEN' in tags:
+                    gameState = GameState.fromFEN(tags['FEN'])
+                else:
+                    gameState = GameState()
+                for san in sanMoves[:maxPlies]:
+                    move = parseSAN(gameState, san)
+                    if move is None:
+                        break
+                    if result == '1/2-1/2':
+                        score = 1
+                    elif result == ('1-0' if gameState.whiteToMove else '0-1'):
+                        score = 2
+                    else:
+                        score = 0
+                    entry = (gameState.zobristKey, move.moveID)
+                    counts[entry] = counts.get(entry, 0) + 1
+                    weights[entry] = weights.get(entry, 0) + score
+                    gameState.makeMove(move)
+    records = sorted((key, moveID, weight) for (key, moveID), weight in weights.items()
+                     if counts[(key, moveID)] >= minGames and weight > 0)
+    # Scale down if the most played move doesn't fit in 16 bits, keeping every move at least 1
+    heaviest = max((weight for key, moveID, weight in records), default=0)
+    scale = MAX_WEIGHT / heaviest if heaviest > MAX_WEIGHT else 1
+    with open(outPath, 'wb') as f:
+        for key, moveID, weight in records:
+            f.write(RECORD.pack(key, moveID, max(1, int(weight * scale))))
+    return len(records)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or query an opening book')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='build a book from PGN files')
+    build.add_argument('pgn', nargs='+')
+    build.add_argument('--out', default='book.bin')
+    build.add_argument('--plies', type=int, default=20, help='book depth in plies')
+    build.add_argument('--min-games', type=int, default=1, help='leave out moves played in fewer games')
+    probe = subparsers.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('book')
+    probe.add_argument('--fen', help='position to look up (default: the start position)')
+    args = parser.parse_args()
+    if args.command == 'build':
+        print('%d records written to %s' % (buildBook(args.pgn, args.out, args.plies, args.min_games), args.out))
+    else:
+        book = OpeningBook(args.book)
+        gameState = GameState.fromFEN(args.fen) if args.fen else GameState()
+        movesByID = {move.moveID: move for move in gameState.getValidMoves()}
+        for moveID, weight in sorted(book.lookup(gameState.zobristKey), key=lambda entry: -entry[1]):
+            if moveID in movesByID:
+                print(movesByID[moveID].getChessNotation(), weight)
+        book.close()
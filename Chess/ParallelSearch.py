@@ -0,0 +1,274 @@
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from Chess import MoveFinder
+from Chess.ChessEngine import GameState
+
+# Number of worker processes; 1 searches in this process with MoveFinder.findBestMove
+WORKERS = os.cpu_count() or 1
+
+# More than any position has legal moves
+MAX_ROOT_MOVES = 256
+
+_pool = None
+_poolWorkers = 0
+# Shared by all workers: the id of the current search, then the score of every root move
+# searched so far in it, by its place in move ordering (-CHECKMATE until it finishes)
+_sharedScores = None
+# Written to _sharedScores[0] when a search is cancelled; search ids are never negative
+CANCELLED = -1.0
+# Score (side to move's view) and nodes, quiescence included, of the last search, like
+# MoveFinder.searchScore and MoveFinder.nodesSearched, and its depth if it completed (0 if a
+# limit cut it short and the move is the best found so far)
+searchScore = 0
+nodesSearched = 0
+depthReached = 0
+# In a worker: Nnue networks loaded so far, by file, and the file of the one the transposition
+# table's scores came from (None for the piece-square evaluation)
+_networks = {}
+_networkPath = None
+
+
+def _initWorker(sharedScores):
+    global _sharedScores
+    _sharedScores = sharedScores
+
+
+class _Cancellation:
+    # Stands in for MoveFinder.stopSignal in a worker, so a running task stops at its next
+    # node once the parent has cancelled its search or started another one
+    def __init__(self, searchId):
+        self.searchId = searchId
+        # Read without the lock: a stale value only delays the stop by a node
+        self.scores = _sharedScores.get_obj()
+
+    def is_set(self):
+        return self.scores[0] != self.searchId
+
+
+def _searchRootMove(stateClass, encoded, index, moveID, depth, searchId, selective, deadline, nodeLimit,
+                    networkPath):
+    # Runs in a worker: score root move number index at depth - 1. Alpha is the best score
+    # of the moves ordered before it, so a move can only lose to an earlier one on a tie
+    # and the choice doesn't depend on which worker finishes first. deadline (a time.time()
+    # value) and nodeLimit bound this task. Returns (moveID, score, exact, nodes); score is
+    # None if the task ran out of time or nodes. networkPath is the Nnue network file to
+    # evaluate with, or None for the piece-square evaluation.
+    # selective is the caller's MoveFinder.SELECTIVE_SEARCH, which may have changed since the fork.
+    global _networkPath
+    MoveFinder.SELECTIVE_SEARCH = selective
+    gameState = stateClass.decode(encoded)
+    if networkPath != _networkPath:
+        # Scores stored under another evaluation would be wrong for this one
+        MoveFinder.transpositionTable.clear()
+        _networkPath = networkPath
+    if networkPath is not None:
+        from Chess.Nnue import Accumulator, loadNetwork
+        if networkPath not in _networks:
+            _networks[networkPath] = loadNetwork(networkPath)
+        gameState.nnue = Accumulator(_networks[networkPath], gameState)
+    turnMultiplier = 1 if gameState.whiteToMove else -1
+    move = next(move for move in gameState.getValidMoves() if move.moveID == moveID)
+    with _sharedScores.get_lock():
+        if _sharedScores[0] != searchId:
+            # A newer search has started; this task was left over from a cancelled one
+            return moveID, None, False, 0
+        alpha = max(_sharedScores[1:1 + index])
+    MoveFinder.nodesSearched = 0
+    MoveFinder.quiescenceNodes = 0
+    MoveFinder.transpositionTable.newSearch()
+    MoveFinder.deadline = deadline
+    MoveFinder.nodeBudget = nodeLimit
+    MoveFinder.stopSignal = _Cancellation(searchId)
+    gameState.makeMove(move)
+    try:
+        score = -MoveFinder.findMoveNegamaxAlphaBeta(gameState, None, depth - 1, -MoveFinder.CHECKMATE, -alpha,
+                                                     -turnMultiplier, 1)
+    except MoveFinder.SearchAborted:
+        return moveID, None, False, MoveFinder.nodesSearched + MoveFinder.quiescenceNodes
+    finally:
+        MoveFinder.deadline = MoveFinder.nodeBudget = MoveFinder.stopSignal = None
+    with _sharedScores.get_lock():
+        if _sharedScores[0] == searchId:
+            _sharedScores[1 + index] = score
+    # A score at or below alpha is only an upper bound, not the move's real score
+    return moveID, score, score > alpha, MoveFinder.nodesSearched + MoveFinder.quiescenceNodes
+
+
+def getPool(workers):
+    # The pool is kept between searches so workers keep their transposition tables warm
+    global _pool, _poolWorkers, _sharedScores
+    if _pool is None or _poolWorkers != workers:
+        shutdown()
+        _sharedScores = multiprocessing.Array('d', 1 + MAX_ROOT_MOVES)
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(_sharedScores,))
+        _poolWorkers = workers
+        # Start the workers now, from the calling thread. Forked from a search thread they
+        # could inherit a lock another thread holds (e.g. one blocked reading stdin) and hang.
+        _pool.submit(int).result()
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def findBestMoveParallel(gameState, validMoves, depth=None, workers=None, stopEvent=None, timeLimit=None,
+                         nodeLimit=None, networkPath=None):
+    # Root-splitting search (see searchRootSplit) with the given number of worker processes,
+    # after the opening book and tablebases. With workers <= 1 this is exactly
+    # MoveFinder.findBestMove.
+    global searchScore, nodesSearched, depthReached
+    if depth is None:
+        depth = MoveFinder.DEPTH
+    if workers is None:
+        workers = WORKERS
+    if workers <= 1 or len(validMoves) <= 1:
+        bestMove = MoveFinder.findBestMove(gameState, validMoves, maxDepth=depth, timeLimit=timeLimit,
+                                           nodeLimit=nodeLimit, stopEvent=stopEvent)
+        searchScore = MoveFinder.searchScore
+        nodesSearched = MoveFinder.nodesSearched + MoveFinder.quiescenceNodes
+        depthReached = MoveFinder.depthReached
+        return bestMove
+    searchScore = nodesSearched = depthReached = 0
+    if MoveFinder.openingBook is not None:
+        bookMove = MoveFinder.openingBook.findMove(gameState, validMoves)
+        if bookMove is not None:
+            return bookMove
+    if MoveFinder.tablebase is not None:
+        result = MoveFinder.tablebase.bestMove(gameState, validMoves)
+        if result is not None:
+            bestMove, searchScore = result
+            return bestMove
+    return searchRootSplit(gameState, validMoves, depth, getPool(workers), stopEvent, timeLimit, nodeLimit,
+                           networkPath)
+
+
+def searchRootSplit(gameState, validMoves, depth, pool, stopEvent=None, timeLimit=None, nodeLimit=None,
+                    networkPath=None):
+    # Each root move is searched to the full depth by one of pool's worker processes. The
+    # first move (in move-ordering order) is searched here first to give the workers a good
+    # alpha. The result is the first move, in that order, with the highest score.
+    # Running past timeLimit (seconds) or nodeLimit, or setting stopEvent, cancels the tasks
+    # still running and returns the best move found so far; depthReached is 0 then. The
+    # result is None only if stopEvent is set before the first move has its score.
+    # The score and node count are left in searchScore and nodesSearched. If gameState has an
+    # Nnue accumulator, networkPath is the file its network was loaded from, for the workers.
+    global searchScore, nodesSearched, depthReached
+    if gameState.nnue is not None and networkPath is None:
+        raise ValueError('the workers need the network file of an Nnue evaluation')
+    searchScore = nodesSearched = depthReached = 0
+    startTime = time.time()
+    deadline = startTime + timeLimit if timeLimit is not None else None
+    rootMoves = MoveFinder.orderMoves(validMoves, 0)
+    turnMultiplier = 1 if gameState.whiteToMove else -1
+    movesMade = len(gameState.moveLog)
+    MoveFinder.nodesSearched = MoveFinder.quiescenceNodes = 0
+    MoveFinder.stopSignal = stopEvent
+    MoveFinder.deadline = deadline
+    MoveFinder.nodeBudget = nodeLimit
+    try:
+        gameState.makeMove(rootMoves[0])
+        firstScore = -MoveFinder.findMoveNegamaxAlphaBeta(gameState, None, depth - 1, -MoveFinder.CHECKMATE,
+                                                          MoveFinder.CHECKMATE, -turnMultiplier, 1)
+    except MoveFinder.SearchAborted:
+        # Like MoveFinder.findBestMove, only a stop leaves no move at all
+        nodesSearched = MoveFinder.nodesSearched + MoveFinder.quiescenceNodes
+        return None if stopEvent is not None and stopEvent.is_set() else rootMoves[0]
+    finally:
+        MoveFinder.stopSignal = MoveFinder.deadline = MoveFinder.nodeBudget = None
+        while len(gameState.moveLog) > movesMade:
+            gameState.undoMove()
+    nodes = MoveFinder.nodesSearched + MoveFinder.quiescenceNodes
+
+    searchId = random.random()
+    with _sharedScores.get_lock():
+        _sharedScores[0] = searchId
+        _sharedScores[1] = firstScore
+        for index in range(1, len(rootMoves)):
+            _sharedScores[1 + index] = -MoveFinder.CHECKMATE
+    encoded = gameState.encode()
+    taskNodes = nodeLimit - nodes if nodeLimit is not None else None
+    if gameState.nnue is None:
+        networkPath = None
+    futures = [pool.submit(_searchRootMove, type(gameState), encoded, index, move.moveID, depth, searchId,
+                           MoveFinder.SELECTIVE_SEARCH, deadline, taskNodes, networkPath)
+               for index, move in enumerate(rootMoves) if index > 0]
+    results = {}
+    cancelled = False
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+        aborted = False
+        for future in done:
+            results[future] = future.result()
+            nodes += results[future][3]
+            aborted = aborted or results[future][1] is None
+        # Once every move has its score the result stands, even if a limit ran out meanwhile
+        if aborted or pending and ((stopEvent is not None and stopEvent.is_set()) or
+                                   (deadline is not None and time.time() >= deadline) or
+                                   (nodeLimit is not None and nodes >= nodeLimit)):
+            # Queued tasks never start; running ones see the changed id and stop
+            with _sharedScores.get_lock():
+                _sharedScores[0] = CANCELLED
+            for future in pending:
+                future.cancel()
+            cancelled = True
+            break
+
+    # In move-ordering order, only an exact score higher than every earlier one takes over.
+    # After a cancel, the moves whose tasks didn't finish are left out.
+    bestMove, bestScore = rootMoves[0], firstScore
+    for move, future in zip(rootMoves[1:], futures):
+        if future in results:
+            moveID, score, exact, taskNodes = results[future]
+            if exact and score > bestScore:
+                bestMove, bestScore = move, score
+    searchScore = bestScore
+    nodesSearched = nodes
+    if not cancelled:
+        depthReached = depth
+    return bestMove
+
+
+def benchmark(positions, depth=3, workerCounts=(1, 2, 4, 8, 16)):
+    # Time the same root-split search with each number of workers over the same positions and
+    # print the speedups over one worker
+    serialTime = None
+    for workers in workerCounts:
+        pool = getPool(workers)
+        start = time.time()
+        for encoded in positions:
+            gameState = GameState.decode(encoded)
+            MoveFinder.transpositionTable.clear()
+            searchRootSplit(gameState, gameState.getValidMoves(), depth, pool)
+        elapsed = time.time() - start
+        if serialTime is None:
+            serialTime = elapsed
+        print('workers %2d: %.2fs, speedup %.2fx' % (workers, elapsed, serialTime / elapsed))
+    shutdown()
+
+
+def benchmarkPositions(count=8, plies=16, seed=1):
+    # A fixed set of middlegame positions reached by seeded random play
+    rng = random.Random(seed)
+    positions = []
+    for i in range(count):
+        gameState = GameState()
+        for ply in range(plies):
+            validMoves = gameState.getValidMoves()
+            if len(validMoves) == 0:
+                break
+            gameState.makeMove(rng.choice(validMoves))
+        positions.append(gameState.encode())
+    return positions
+
+
+if __name__ == '__main__':
+    benchmark(benchmarkPositions())
@@ -0,0 +1,89 @@
+import argparse
+import time
+
+from Chess.ChessEngine import GameState
+
+# (name, FEN, {depth: number of leaf nodes}) from the standard perft test positions
+POSITIONS = [
+    ('startpos', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    # En passant that would expose the king along the rank, and checks by pawns
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    # Promotions and under-promotions, castling out of and through check
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+]
+
+
+def perft(gameState, depth):
+    # Number of leaf nodes of the legal move tree, depth plies deep
+    if depth == 0:
+        return 1
+    validMoves = gameState.getValidMoves()
+    if depth == 1:
+        return len(validMoves)
+    nodes = 0
+    for move in validMoves:
+        gameState.makeMove(move)
+        nodes += perft(gameState, depth - 1)
+        gameState.undoMove()
+    return nodes
+
+
+def divide(gameState, depth):
+    # Leaf counts below each root move, to narrow a wrong total down to one move
+    counts = {}
+    for move in gameState.getValidMoves():
+        gameState.makeMove(move)
+        counts[move.getChessNotation()] = perft(gameState, depth - 1)
+        gameState.undoMove()
+    return counts
+
+
+def runSuite(maxDepth, stateClass=GameState):
+    # Check every position up to maxDepth against the known counts; returns True if all match
+    allPassed = True
+    totalNodes = 0
+    totalTime = 0.0
+    for name, fen, expected in POSITIONS:
+        gameState = stateClass.fromFEN(fen)
+        for depth in sorted(expected):
+            if depth > maxDepth:
+                break
+            start = time.time()
+            nodes = perft(gameState, depth)
+            elapsed = time.time() - start
+            totalNodes += nodes
+            totalTime += elapsed
+            passed = nodes == expected[depth]
+            allPassed = allPassed and passed
+            print('%-10s depth %d: %10d nodes  %-4s %8.2fs  %8.0f nodes/s' %
+                  (name, depth, nodes, 'ok' if passed else 'FAIL (expected %d)' % expected[depth],
+                   elapsed, nodes / elapsed if elapsed > 0 else 0))
+    print('total: %d nodes in %.2fs, %.0f nodes/s' % (totalNodes, totalTime, totalNodes / totalTime if totalTime > 0 else 0))
+    return allPassed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Perft move generator checks and benchmark')
+    parser.add_argument('--depth', type=int, default=3, help='deepest depth to run for each position')
+    parser.add_argument('--bitboard', action='store_true', help='use the bitboard backend')
+    parser.add_argument('--divide', metavar='FEN', help='print per-move counts for this position instead')
+    args = parser.parse_args()
+    if args.bitboard:
+        from Chess.Bitboard import BitboardGameState
+        stateClass = BitboardGameState
+    else:
+        stateClass = GameState
+    if args.divide:
+        counts = divide(stateClass.fromFEN(args.divide), args.depth)
+        for notation in sorted(counts):
+            print(notation, counts[notation])
+        print('total', sum(counts.values()))
+    else:
+        raise SystemExit(0 if runSuite(args.depth, stateClass) else 1)
@@ -0,0 +1,157 @@
+import re
+
+from Chess.ChessEngine import Move, START_FEN
+
+# Seven Tag Roster, in the order PGN requires them
+STANDARD_TAGS = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+LINE_WIDTH = 80
+
+
+def moveToSAN(gameState, move, validMoves=None):
+    # Standard algebraic notation (Nf3, exd5, e8=Q+, O-O) of a legal move in gameState.
+    # validMoves are gameState's legal moves, if the caller already has them.
+    if validMoves is None:
+        validMoves = gameState.getValidMoves()
+    if move.isCastleMove:
+        san = 'O-O' if move.endCol > move.startCol else 'O-O-O'
+    else:
+        target = move.getRankFile(move.endRow, move.endCol)
+        capture = 'x' if move.pieceCaptured != '--' else ''
+        if move.pieceMoved[1] == 'p':
+            san = (move.colsToFiles[move.startCol] + capture if capture else '') + target
+            if move.isPawnPromotion:
+                san += '=' + move.promoteTo
+        else:
+            # Other pieces of the same kind that can also reach the target square
+            rivals = [other for other in validMoves if other.pieceMoved == move.pieceMoved and
+                      (other.endRow, other.endCol) == (move.endRow, move.endCol) and
+                      (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+            disambiguation = ''
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    disambiguation = move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    disambiguation = move.rowsToRanks[move.startRow]
+                else:
+                    disambiguation = move.getRankFile(move.startRow, move.startCol)
+            san = move.pieceMoved[1] + disambiguation + capture + target
+    gameState.makeMove(move)
+    if gameState.inCheck():
+        san += '#' if len(gameState.getValidMoves()) == 0 else '+'
+    gameState.undoMove()
+    return san
+
+
+def writeGame(output, tags, sanMoves, result, startFEN=START_FEN, startFullmove=1, startWhiteToMove=True):
+    # Write one game in PGN export format: the Seven Tag Roster (missing values as '?'),
+    # any other tags, then the movetext wrapped at LINE_WIDTH
+    tags = dict(tags)
+    tags['Result'] = result
+    if startFEN != START_FEN:
+        tags['SetUp'] = '1'
+        tags['FEN'] = startFEN
+    for name in STANDARD_TAGS:
+        output.write('[%s "%s"]\n' % (name, escapeTag(tags.get(name, '?'))))
+    for name, value in tags.items():
+        if name not in STANDARD_TAGS:
+            output.write('[%s "%s"]\n' % (name, escapeTag(value)))
+    output.write('\n')
+
+    tokens = []
+    fullmove = startFullmove
+    whiteToMove = startWhiteToMove
+    for i, san in enumerate(sanMoves):
+        if whiteToMove:
+            tokens.append('%d.' % fullmove)
+        elif i == 0:
+            tokens.append('%d...' % fullmove)
+        tokens.append(san)
+        if not whiteToMove:
+            fullmove += 1
+        whiteToMove = not whiteToMove
+    tokens.append(result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_WIDTH:
+            output.write(line + '\n')
+            line = token
+        else:
+            line = line + ' ' + token if line else token
+    output.write(line + '\n\n')
+
+
+def escapeTag(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+
+def parseSAN(gameState, san, validMoves=None):
+    # The legal move written as san in gameState, or None if there isn't exactly one
+    if validMoves is None:
+        validMoves = gameState.getValidMoves()
+    san = san.rstrip('+#!?')
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        kingside = len(san) == 3
+        for move in validMoves:
+            if move.isCastleMove and (move.endCol > move.startCol) == kingside:
+                return move
+        return None
+    match = SAN_PATTERN.match(san)
+    if match is None:
+        return None
+    pieceType, fromFile, fromRank, target, promoteTo = match.groups()
+    pieceType = pieceType or 'p'
+    endRow, endCol = Move.ranksToRows[target[1]], Move.filesToCols[target[0]]
+    candidates = [move for move in validMoves if move.pieceMoved[1] == pieceType and
+                  (move.endRow, move.endCol) == (endRow, endCol) and
+                  (fromFile is None or move.startCol == Move.filesToCols[fromFile]) and
+                  (fromRank is None or move.startRow == Move.ranksToRows[fromRank]) and
+                  (move.promoteTo == (promoteTo or 'Q') if move.isPawnPromotion else promoteTo is None)]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def readGames(stream):
+    # Yield (tags, SAN moves, result) for every game in a PGN stream. Comments, variations,
+    # NAGs and move numbers are skipped.
+    tags = {}
+    movetext = []
+    inMovetext = False
+    for line in stream:
+        line = line.strip()
+        if line.startswith('[') and line.endswith(']'):
+            if inMovetext:
+                yield finishGame(tags, movetext)
+                tags, movetext, inMovetext = {}, [], False
+            name, _, value = line[1:-1].partition(' ')
+            tags[name] = value.strip().strip('"').replace('\\"', '"').replace('\\\\', '\\')
+        elif line and not line.startswith('%'):
+            inMovetext = True
+            movetext.append(line)
+    if inMovetext or tags:
+        yield finishGame(tags, movetext)
+
+
+def finishGame(tags, movetext):
+    text = re.sub(r';[^\n]*', '', '\n'.join(movetext))
+    text = re.sub(r'\{[^}]*\}', ' ', text)
+    # Variations can nest, so strip the innermost ones until none are left
+    while '(' in text:
+        stripped = re.sub(r'\([^()]*\)', ' ', text)
+        if stripped == text:
+            break
+        text = stripped
+    sanMoves = []
+    result = tags.get('Result', '*')
+    for token in text.split():
+        token = re.sub(r'^\d+\.+', '', token)
+        if not token or token.startswith('$'):
+            continue
+        if token in RESULTS:
+            result = token
+        else:
+            sanMoves.append(token)
+    return tags, sanMoves, result
@@ -0,0 +1,356 @@
+import argparse
+import io
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Chess import MoveFinder, Evaluation
+from Chess.ChessEngine import GameState, START_FEN
+from Chess.Evaluation import computeScores
+from Chess.Pgn import moveToSAN, writeGame
+from Chess.TranspositionTable import TranspositionTable
+
+# Short opening lines (UCI moves from the start position). Every opening is played
+# twice, once with each engine as white, so neither side profits from a lopsided line.
+OPENINGS = [
+    'e2e4 e7e5 g1f3 b8c6 f1b5 a7a6',    # Ruy Lopez
+    'e2e4 e7e5 g1f3 b8c6 f1c4 f8c5',    # Italian
+    'e2e4 c7c5 g1f3 d7d6 d2d4 c5d4',    # Sicilian
+    'e2e4 e7e6 d2d4 d7d5 b1c3',         # French
+    'e2e4 c7c6 d2d4 d7d5 b1c3',         # Caro-Kann
+    'e2e4 d7d5 e4d5 d8d5 b1c3 d5a5',    # Scandinavian
+    'd2d4 d7d5 c2c4 e7e6 b1c3 g8f6',    # Queen's Gambit Declined
+    'd2d4 d7d5 c2c4 d5c4 g1f3',         # Queen's Gambit Accepted
+    'd2d4 g8f6 c2c4 g7g6 b1c3 f8g7',    # King's Indian
+    'd2d4 g8f6 c2c4 e7e6 b1c3 f8b4',    # Nimzo-Indian
+    'c2c4 e7e5 b1c3 g8f6 g1f3',         # English
+    'g1f3 d7d5 g2g3 g8f6 f1g2',         # Reti
+]
+
+# Adjudication. Scores are the engines' own search scores, in pawns, from white's side.
+MAX_PLIES = 400              # Longer games are drawn
+RESIGN_SCORE = 8             # Both engines agree one side is this far ahead ...
+RESIGN_PLIES = 8             # ... for this many plies in a row: that side wins
+DRAW_SCORE = 0.1             # Both engines see the game within this of equal ...
+DRAW_PLIES = 16              # ... for this many plies in a row ...
+DRAW_MIN_PLY = 80            # ... after this many plies: draw
+
+# Evaluation weights the engines are built with, restored before applying an engine's own weights
+DEFAULT_WEIGHTS = Evaluation.currentWeights()
+
+# Per-process search tables of each engine, so the two sides never share a hash table
+_engineTables = {}
+# Networks loaded in this process, by file
+_networks = {}
+
+
+def parseEngine(text, name):
+    # "depth=3,time=0.5,nodes=20000,weights=file.json,hash=16,selective=0" -> engine configuration dict.
+    # weights is a JSON weights file written by Tuner.py, or just material values ({"Q": 9.5, "N": 3.2}),
+    # replacing the defaults.
+    # selective=0 turns off MoveFinder's selective search.
+    # nnue is a network file (see Nnue.py) that replaces the tables' evaluation.
+    engine = {'name': name, 'depth': None, 'time': None, 'nodes': None, 'weights': None, 'hash': MoveFinder.HASH_SIZE_MB,
+              'selective': True, 'nnue': None}
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        key, value = item.split('=', 1)
+        key = key.strip()
+        if key in ('depth', 'nodes', 'hash'):
+            engine[key] = int(value)
+        elif key == 'time':
+            engine[key] = float(value)
+        elif key == 'selective':
+            engine[key] = value.strip() not in ('0', 'false', 'off')
+        elif key == 'weights':
+            with open(value) as f:
+                engine[key] = json.load(f)
+        elif key in ('name', 'nnue'):
+            engine[key] = value
+        else:
+            raise ValueError('unknown engine option: %s' % key)
+    if engine['depth'] is None and engine['time'] is None and engine['nodes'] is None:
+        engine['depth'] = MoveFinder.DEPTH
+    return engine
+
+
+def loadOpenings(path):
+    # One opening per line: a FEN (or EPD) position, or UCI moves from the start position
+    openings = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                openings.append(line)
+    return openings
+
+
+def openingPosition(opening):
+    # (starting FEN, list of opening moves) of an OPENINGS / loadOpenings entry
+    if '/' in opening:
+        fields = opening.split()
+        # EPD lines carry operations after the four position fields
+        if len(fields) > 6 or (len(fields) > 4 and not fields[4].isdigit()):
+            fields = fields[:4]
+        return ' '.join(fields), []
+    return START_FEN, opening.split()
+
+
+def selectEngine(engine, gameState):
+    # Swap in this engine's hash table, history table, search mode and evaluation weights before it searches
+    tables = _engineTables.get(engine['name'])
+    if tables is None:
+        tables = (TranspositionTable(engine['hash']), {})
+        _engineTables[engine['name']] = tables
+    MoveFinder.transpositionTable, MoveFinder.historyScores = tables
+    MoveFinder.SELECTIVE_SEARCH = engine['selective']
+    Evaluation.applyWeights(DEFAULT_WEIGHTS)
+    if engine['weights'] is not None:
+        Evaluation.applyWeights(engine['weights'])
+    # The running totals were built with the other engine's values
+    gameState.whiteMaterial, gameState.blackMaterial, gameState.whitePosition, gameState.blackPosition = \
+        computeScores(gameState.board)
+    if engine['nnue'] is None:
+        gameState.nnue = None
+    else:
+        from Chess.Nnue import Accumulator, loadNetwork
+        if engine['nnue'] not in _networks:
+            _networks[engine['nnue']] = loadNetwork(engine['nnue'])
+        gameState.nnue = Accumulator(_networks[engine['nnue']], gameState)
+
+
+def insufficientMaterial(board):
+    # Bare kings, or king and one minor piece against a bare king
+    pieces = [piece[1] for row in board for piece in row if piece != '--' and piece[1] != 'K']
+    return len(pieces) == 0 or (len(pieces) == 1 and pieces[0] in ('B', 'N'))
+
+
+def playGame(gameIndex, opening, white, black):
+    # Play one game to the end and return its record, including the PGN text
+    startTime = time.time()
+    startFEN, openingMoves = openingPosition(opening)
+    gameState = GameState.fromFEN(startFEN)
+    for engine in (white, black):
+        tables = _engineTables.get(engine['name'])
+        if tables is not None:
+            tables[0].clear()
+            tables[1].clear()
+    sanMoves = []
+    uciMoves = []
+    keyCounts = {gameState.zobristKey: 1}
+    scores = []
+    result = None
+    termination = None
+    while result is None:
+        validMoves = gameState.getValidMoves()
+        if gameState.checkMate:
+            result, termination = ('0-1' if gameState.whiteToMove else '1-0'), 'checkmate'
+            break
+        if gameState.staleMate:
+            result, termination = '1/2-1/2', 'stalemate'
+            break
+        if keyCounts[gameState.zobristKey] >= 3:
+            result, termination = '1/2-1/2', 'threefold repetition'
+            break
+        if gameState.halfmoveClock >= 100:
+            result, termination = '1/2-1/2', 'fifty-move rule'
+            break
+        if insufficientMaterial(gameState.board):
+            result, termination = '1/2-1/2', 'insufficient material'
+            break
+        if len(sanMoves) >= MAX_PLIES:
+            result, termination = '1/2-1/2', 'move limit'
+            break
+
+        ply = len(sanMoves)
+        if ply < len(openingMoves):
+            move = next((move for move in validMoves if move.getChessNotation() == openingMoves[ply]), None)
+            if move is None:
+                raise ValueError('illegal opening move %s in %r' % (openingMoves[ply], opening))
+        else:
+            engine = white if gameState.whiteToMove else black
+            selectEngine(engine, gameState)
+            maxDepth = engine['depth'] if engine['depth'] is not None else MoveFinder.MAX_PLY
+            move = MoveFinder.findBestMove(gameState, validMoves, maxDepth=maxDepth, timeLimit=engine['time'],
+                                           nodeLimit=engine['nodes'])
+            scores.append(MoveFinder.searchScore if gameState.whiteToMove else -MoveFinder.searchScore)
+            result, termination = adjudicate(scores, ply)
+            if result is not None:
+                break
+        sanMoves.append(moveToSAN(gameState, move, validMoves))
+        uciMoves.append(move.getChessNotation())
+        gameState.makeMove(move)
+        keyCounts[gameState.zobristKey] = keyCounts.get(gameState.zobristKey, 0) + 1
+
+    startState = GameState.fromFEN(startFEN)
+    pgn = io.StringIO()
+    writeGame(pgn, {'Event': 'Self-play', 'Site': '?', 'Date': time.strftime('%Y.%m.%d'), 'Round': gameIndex + 1,
+                    'White': white['name'], 'Black': black['name'], 'Termination': termination},
+              sanMoves, result, startFEN, startState.fullmoveNumber, startState.whiteToMove)
+    return {'game': gameIndex, 'opening': opening, 'white': white['name'], 'black': black['name'],
+            'result': result, 'termination': termination, 'plies': len(uciMoves), 'moves': ' '.join(uciMoves),
+            'seconds': round(time.time() - startTime, 3), 'pgn': pgn.getvalue()}
+
+
+def adjudicate(scores, ply):
+    # (result, termination) once the engines' recent scores settle the game, else (None, None)
+    recent = scores[-RESIGN_PLIES:]
+    if len(recent) == RESIGN_PLIES:
+        if all(score >= RESIGN_SCORE for score in recent):
+            return '1-0', 'adjudication'
+        if all(score <= -RESIGN_SCORE for score in recent):
+            return '0-1', 'adjudication'
+    recent = scores[-DRAW_PLIES:]
+    if ply >= DRAW_MIN_PLY and len(recent) == DRAW_PLIES and all(abs(score) <= DRAW_SCORE for score in recent):
+        return '1/2-1/2', 'adjudication'
+    return None, None
+
+
+def eloDifference(wins, draws, losses):
+    # Logistic Elo difference and its 95% error margin from a win/draw/loss count
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, float('inf')
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.959964 * math.sqrt(variance / games)
+    elo = scoreToElo(score)
+    return elo, (scoreToElo(score + margin) - scoreToElo(score - margin)) / 2
+
+
+def scoreToElo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def eloToScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def sprtLLR(wins, draws, losses, elo0, elo1):
+    # Log-likelihood ratio of H1 (elo = elo1) against H0 (elo = elo0), using the
+    # normal approximation to the trinomial game-result distribution
+    games = wins + draws + losses
+    if games == 0 or wins + draws == 0 or losses + draws == 0:
+        return 0.0
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance <= 0:
+        return 0.0
+    score0, score1 = eloToScore(elo0), eloToScore(elo1)
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def sprtBounds(alpha, beta):
+    # LLR at or below the lower bound accepts H0, at or above the upper bound accepts H1
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def schedule(openings, games):
+    # (gameIndex, opening, engine A plays white) in game order: each opening twice in a row, colors reversed
+    tasks = []
+    while len(tasks) < games:
+        for opening in openings:
+            for engineAWhite in (True, False):
+                if len(tasks) < games:
+                    tasks.append((len(tasks), opening, engineAWhite))
+    return tasks
+
+
+def runMatch(engineA, engineB, games, openings=None, workers=None, pgnPath=None, jsonlPath=None, sprt=None,
+             alpha=0.05, beta=0.05):
+    # Play games between engineA and engineB across worker processes, writing every game to the
+    # PGN / JSONL files as it finishes. sprt=(elo0, elo1) stops the match as soon as the test
+    # accepts either hypothesis. Returns (wins, draws, losses) from engineA's side.
+    if openings is None:
+        openings = OPENINGS
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if engineA['name'] == engineB['name']:
+        engineB = dict(engineB, name=engineB['name'] + ' (2)')
+    lowerBound, upperBound = sprtBounds(alpha, beta)
+    pgnFile = open(pgnPath, 'w') if pgnPath else None
+    jsonlFile = open(jsonlPath, 'w') if jsonlPath else None
+    wins = draws = losses = 0
+    startTime = time.time()
+    tasks = schedule(openings, games)
+
+    def record(game):
+        nonlocal wins, draws, losses
+        if pgnFile is not None:
+            pgnFile.write(game['pgn'])
+            pgnFile.flush()
+        if jsonlFile is not None:
+            jsonlFile.write(json.dumps({key: value for key, value in game.items() if key != 'pgn'}) + '\n')
+            jsonlFile.flush()
+        if game['result'] == '1/2-1/2':
+            draws += 1
+        elif (game['result'] == '1-0') == (game['white'] == engineA['name']):
+            wins += 1
+        else:
+            losses += 1
+        elo, margin = eloDifference(wins, draws, losses)
+        line = 'game %d/%d  +%d =%d -%d  elo %+.1f +/- %.1f  %.2f games/s' % (
+            wins + draws + losses, len(tasks), wins, draws, losses, elo, margin,
+            (wins + draws + losses) / (time.time() - startTime))
+        if sprt is not None:
+            llr = sprtLLR(wins, draws, losses, sprt[0], sprt[1])
+            line += '  LLR %.2f (%.2f, %.2f)' % (llr, lowerBound, upperBound)
+            print(line)
+            if llr <= lowerBound:
+                print('SPRT: H0 accepted (elo <= %g)' % sprt[0])
+                return True
+            if llr >= upperBound:
+                print('SPRT: H1 accepted (elo >= %g)' % sprt[1])
+                return True
+        else:
+            print(line)
+        return False
+
+    def players(engineAWhite):
+        return (engineA, engineB) if engineAWhite else (engineB, engineA)
+
+    try:
+        if workers <= 1:
+            for gameIndex, opening, engineAWhite in tasks:
+                if record(playGame(gameIndex, opening, *players(engineAWhite))):
+                    break
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(playGame, gameIndex, opening, *players(engineAWhite))
+                           for gameIndex, opening, engineAWhite in tasks]
+                for future in as_completed(futures):
+                    if record(future.result()):
+                        # Games already being played are finished but not counted
+                        for pending in futures:
+                            pending.cancel()
+                        break
+    finally:
+        if pgnFile is not None:
+            pgnFile.close()
+        if jsonlFile is not None:
+            jsonlFile.close()
+    return wins, draws, losses
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Engine-vs-engine self-play match')
+    parser.add_argument('--engine-a', default='', help='options of the engine under test, e.g. depth=3,weights=w.json')
+    parser.add_argument('--engine-b', default='', help='options of the reference engine')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--openings', help='file with one FEN/EPD or UCI move line per opening')
+    parser.add_argument('--pgn', help='write the games to this PGN file')
+    parser.add_argument('--jsonl', help='write one JSON result per game to this file')
+    parser.add_argument('--sprt', nargs=2, type=float, metavar=('ELO0', 'ELO1'), help='stop early by SPRT')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    args = parser.parse_args()
+    wins, draws, losses = runMatch(parseEngine(args.engine_a, 'A'), parseEngine(args.engine_b, 'B'), args.games,
+                                   loadOpenings(args.openings) if args.openings else None, args.workers,
+                                   args.pgn, args.jsonl, args.sprt, args.alpha, args.beta)
+    elo, margin = eloDifference(wins, draws, losses)
+    print('final: +%d =%d -%d, elo %+.1f +/- %.1f' % (wins, draws, losses, elo, margin))
@@ -0,0 +1,461 @@
+import argparse
+import glob
+import mmap
+import os
+import time
+
+from Chess.Evaluation import piece_score
+from Chess.Bitboard import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rookAttacks, bishopAttacks, queenAttacks
+
+# Distance-to-mate tables for endings with few pieces, generated locally by retrograde analysis.
+#
+# A table covers one material set, e.g. 'KQvK', with the stronger side as white; positions where
+# black has that material are probed with colors swapped and the board flipped (sq ^ 56).
+# Entry index: side to move (0 white, 1 black) * 64 ** n + the squares of the n pieces, in
+# key order, as base-64 digits. Squares are row * 8 + col as in GameState.board.
+# Entry value: 0 for a draw (or an impossible position), else plies to mate + 1. An odd number
+# of plies to mate is a win for the side to move, an even number a loss (0: checkmated).
+# Castling and en passant rights aren't covered; positions where they matter aren't probed.
+# En passant needs a pawn on each side, so material sets with pawns on both sides get no table:
+# their double pushes would be valued without the en passant reply.
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
+FILE_MAGIC = b'CTB1'
+# Piece types in table key order
+PIECE_TYPES = 'KQRBNp'
+# Only used to decide which side of a material set is the stronger one
+TYPE_VALUES = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'p': 1}
+PROMOTION_TYPES = 'QRBN'
+# Score of a won tablebase position, less a hundredth of a pawn per ply to mate, so shorter
+# mates score higher. Above any material score, below MoveFinder.CHECKMATE.
+TABLEBASE_WIN = 500
+MAX_VALUE = 255
+
+
+def pieceAttacks(piece, sq, occupied):
+    pieceType = piece[1]
+    if pieceType == 'K':
+        return KING_ATTACKS[sq]
+    if pieceType == 'N':
+        return KNIGHT_ATTACKS[sq]
+    if pieceType == 'p':
+        return PAWN_ATTACKS[piece[0]][sq]
+    if pieceType == 'R':
+        return rookAttacks(sq, occupied)
+    if pieceType == 'B':
+        return bishopAttacks(sq, occupied)
+    return queenAttacks(sq, occupied)
+
+
+def sideString(types):
+    return ''.join(sorted(types, key=PIECE_TYPES.index)).replace('p', 'P')
+
+
+def materialKey(pieces):
+    # 'KQvK' style key of a list of pieces ('wK', 'wQ', 'bK'), white first
+    return sideString(p[1] for p in pieces if p[0] == 'w') + 'v' + sideString(p[1] for p in pieces if p[0] == 'b')
+
+
+def keyPieces(key):
+    # Pieces of a table, in index order: 'KPvK' -> ['wK', 'wp', 'bK']
+    white, black = key.split('v')
+    return ['w' + t.replace('P', 'p') for t in white] + ['b' + t.replace('P', 'p') for t in black]
+
+
+def pawnsOnBothSides(pieces):
+    return 'wp' in pieces and 'bp' in pieces
+
+
+def needsMirror(pieces):
+    # True if black holds the stronger half of the material, so the position is stored mirrored
+    def strength(color):
+        types = [p[1] for p in pieces if p[0] == color]
+        return sum(TYPE_VALUES[t] for t in types), sideString(types)
+    return strength('b') > strength('w')
+
+
+def canonicalIndex(placement, whiteToMove):
+    # (table key, entry index) of a position given as [(piece, sq)]
+    pieces = [piece for piece, sq in placement]
+    if needsMirror(pieces):
+        placement = [(('b' if piece[0] == 'w' else 'w') + piece[1], sq ^ 56) for piece, sq in placement]
+        whiteToMove = not whiteToMove
+    placement = sorted(placement, key=lambda entry: (entry[0][0] == 'b', PIECE_TYPES.index(entry[0][1]), entry[1]))
+    index = 0
+    for piece, sq in placement:
+        index = index * 64 + sq
+    size = 64 ** len(placement)
+    return materialKey([piece for piece, sq in placement]), (0 if whiteToMove else size) + index
+
+
+def isValue(value, winning):
+    # Whether a non-draw table value is a win (or a loss) for the side to move
+    return value != 0 and ((value - 1) % 2 == 1) == winning
+
+
+def valueToScore(value):
+    # Table value -> search score for the side to move
+    if value == 0:
+        return 0
+    plies = value - 1
+    if plies % 2 == 1:
+        return TABLEBASE_WIN - plies * 0.01
+    return -TABLEBASE_WIN + plies * 0.01
+
+
+class TableFile:
+    # One table file, memory-mapped; entries are packed with the same number of bits each
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] != FILE_MAGIC:
+            raise ValueError('%s is not a tablebase file' % path)
+        self.bits = self.data[4]
+        self.mask = (1 << self.bits) - 1
+
+    def __getitem__(self, index):
+        bitPosition = index * self.bits
+        byte = 5 + (bitPosition >> 3)
+        word = self.data[byte] | self.data[byte + 1] << 8
+        return (word >> (bitPosition & 7)) & self.mask
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def writeTable(path, values):
+    bits = max(1, max(values).bit_length())
+    if bits == 8:
+        packed = bytearray(values)
+    else:
+        packed = bytearray((len(values) * bits + 7) // 8)
+        bitPosition = 0
+        for value in values:
+            if value:
+                byte = bitPosition >> 3
+                shifted = value << (bitPosition & 7)
+                packed[byte] |= shifted & 0xFF
+                if shifted > 0xFF:
+                    packed[byte + 1] |= shifted >> 8
+            bitPosition += bits
+    with open(path, 'wb') as f:
+        f.write(FILE_MAGIC + bytes([bits]) + packed + b'\0')
+    return bits
+
+
+class Tablebase:
+    # All tables found in a directory, for probing from the search
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.directory = directory
+        self.tables = {}
+        for path in glob.glob(os.path.join(directory, '*.tb')):
+            key = os.path.basename(path)[:-3]
+            # Left over from before such tables were refused; their values can't be trusted
+            if not pawnsOnBothSides(keyPieces(key)):
+                self.tables[key] = TableFile(path)
+        self.maxPieces = max((len(keyPieces(key)) for key in self.tables), default=0)
+        self.tableTypes = [[piece[1] for piece in keyPieces(key)] for key in self.tables]
+
+    def maxMaterial(self):
+        # Positions with more material than any table are rejected without looking at the board.
+        # Read from the engine's current piece values, which the running totals in GameState use.
+        return max((sum(piece_score[pieceType] for pieceType in types) for types in self.tableTypes), default=0)
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+
+    def probeValue(self, gameState):
+        # Table value of gameState, or None if no table covers it
+        if not self.tables or gameState.whiteMaterial + gameState.blackMaterial > self.maxMaterial() + 1e-9:
+            return None
+        if gameState.currentCastlingRight.getBits() != 0:
+            return None
+        placement = []
+        for row in range(8):
+            for col in range(8):
+                piece = gameState.board[row][col]
+                if piece != '--':
+                    placement.append((piece, row * 8 + col))
+                    if len(placement) > self.maxPieces:
+                        return None
+        if gameState.enpassantPossible != ():
+            # The right only matters if a pawn can actually take en passant
+            row, col = gameState.enpassantPossible
+            capturer = 'wp' if gameState.whiteToMove else 'bp'
+            captureRow = row + 1 if gameState.whiteToMove else row - 1
+            for c in (col - 1, col + 1):
+                if 0 <= c < 8 and gameState.board[captureRow][c] == capturer:
+                    return None
+        if len(placement) == 2:
+            return 0
+        key, index = canonicalIndex(placement, gameState.whiteToMove)
+        table = self.tables.get(key)
+        if table is None:
+            return None
+        return table[index]
+
+    def probeScore(self, gameState):
+        # Search score of gameState for the side to move, or None if no table covers it
+        value = self.probeValue(gameState)
+        return None if value is None else valueToScore(value)
+
+    def bestMove(self, gameState, validMoves):
+        # (move, score) playing perfectly by the tables: the fastest mate when winning, a move
+        # that holds the draw when drawn, the longest resistance when losing. None if any
+        # move leads to a position no table covers.
+        results = []
+        for move in validMoves:
+            gameState.makeMove(move)
+            value = self.probeValue(gameState)
+            gameState.undoMove()
+            if value is None:
+                return None
+            results.append((move, value))
+        if not results:
+            return None
+        wins = [(value, move) for move, value in results if isValue(value, False)]
+        if wins:
+            value, move = min(wins, key=lambda entry: entry[0])
+            return move, -valueToScore(value)
+        draws = [move for move, value in results if value == 0]
+        if draws:
+            return draws[0], 0
+        value, move = max(((value, move) for move, value in results), key=lambda entry: entry[0])
+        return move, -valueToScore(value)
+
+
+def generate(key, directory=TABLEBASE_DIR, log=print):
+    # Build the table for key (and, first, every smaller table its captures and promotions
+    # lead to) and write it to directory. Returns the path of the table file.
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, key + '.tb')
+    if os.path.exists(path):
+        return path
+    pieces = keyPieces(key)
+    if materialKey(pieces) != key or needsMirror(pieces) or pieces.count('wK') != 1 or pieces.count('bK') != 1:
+        raise ValueError('%s is not a table key; write the stronger side first, e.g. KQvK' % key)
+    if pawnsOnBothSides(pieces):
+        raise ValueError('%s has pawns on both sides; en passant isn\'t covered, so it gets no table' % key)
+    subtables = {}
+    for child in conversionKeys(pieces):
+        subtables[child] = TableFile(generate(child, directory, log))
+
+    startTime = time.time()
+    n = len(pieces)
+    size = 64 ** n
+    shifts = [6 * (n - 1 - i) for i in range(n)]
+    colors = [piece[0] for piece in pieces]
+    whiteKing, blackKing = pieces.index('wK'), pieces.index('bK')
+    # Per position (side * size + index): value (0 = unknown/draw), legal flag, in-table moves
+    # not yet known to lose, whether some move draws, whether a capture or promotion wins,
+    # and the longest loss those conversions allow
+    values = bytearray(2 * size)
+    legal = bytearray(2 * size)
+    remaining = bytearray(2 * size)
+    drawEscape = bytearray(2 * size)
+    winningConversion = bytearray(2 * size)
+    lossFloor = bytearray(2 * size)
+    buckets = {}
+
+    def attacked(sq, byColor, squares, occupied):
+        for i in range(n):
+            if colors[i] == byColor and squares[i] >= 0 and pieceAttacks(pieces[i], squares[i], occupied) >> sq & 1:
+                return True
+        return False
+
+    def lookup(placement, whiteToMove):
+        if len(placement) == 2:
+            return 0
+        childKey, index = canonicalIndex(placement, whiteToMove)
+        return subtables[childKey][index]
+
+    # Pass 1: legality, mates, and the outcomes of every move that leaves this table
+    for index in range(size):
+        squares = [(index >> shift) & 63 for shift in shifts]
+        if len(set(squares)) != n:
+            continue
+        if any(pieces[i][1] == 'p' and squares[i] // 8 in (0, 7) for i in range(n)):
+            continue
+        if KING_ATTACKS[squares[whiteKing]] >> squares[blackKing] & 1:
+            continue
+        occupied = 0
+        for sq in squares:
+            occupied |= 1 << sq
+        for side in (0, 1):
+            color, enemy = ('w', 'b') if side == 0 else ('b', 'w')
+            ownKing, enemyKing = (whiteKing, blackKing) if side == 0 else (blackKing, whiteKing)
+            # The side that just moved can't be left in check
+            if attacked(squares[enemyKing], color, squares, occupied):
+                continue
+            position = side * size + index
+            legal[position] = 1
+            ownOccupied = 0
+            for i in range(n):
+                if colors[i] == color:
+                    ownOccupied |= 1 << squares[i]
+            moveCount = 0
+            inTable = 0
+            bestWin = 0
+            for i in range(n):
+                if colors[i] != color:
+                    continue
+                start = squares[i]
+                if pieces[i][1] == 'p':
+                    step = -8 if color == 'w' else 8
+                    targets = PAWN_ATTACKS[color][start] & occupied & ~ownOccupied
+                    if not occupied >> (start + step) & 1:
+                        targets |= 1 << (start + step)
+                        if start // 8 == (6 if color == 'w' else 1) and not occupied >> (start + 2 * step) & 1:
+                            targets |= 1 << (start + 2 * step)
+                else:
+                    targets = pieceAttacks(pieces[i], start, occupied) & ~ownOccupied
+                while targets:
+                    lowest = targets & -targets
+                    end = lowest.bit_length() - 1
+                    targets ^= lowest
+                    captured = squares.index(end) if occupied & lowest else -1
+                    newSquares = list(squares)
+                    newSquares[i] = end
+                    if captured >= 0:
+                        newSquares[captured] = -1
+                    newOccupied = (occupied ^ (1 << start)) | lowest
+                    kingSquare = newSquares[ownKing]
+                    if attacked(kingSquare, enemy, newSquares, newOccupied):
+                        continue
+                    promotion = pieces[i][1] == 'p' and end // 8 in (0, 7)
+                    if captured < 0 and not promotion:
+                        moveCount += 1
+                        inTable += 1
+                        continue
+                    for promoteTo in (PROMOTION_TYPES if promotion else (None,)):
+                        placement = [((color + promoteTo) if j == i and promoteTo else pieces[j], newSquares[j])
+                                     for j in range(n) if newSquares[j] >= 0]
+                        childValue = lookup(placement, side == 1)
+                        moveCount += 1
+                        if childValue == 0:
+                            drawEscape[position] = 1
+                        elif isValue(childValue, False):
+                            if bestWin == 0 or childValue < bestWin:
+                                bestWin = childValue
+                        else:
+                            lossFloor[position] = max(lossFloor[position], childValue)
+            if moveCount == 0:
+                if attacked(squares[ownKing], enemy, squares, occupied):
+                    buckets.setdefault(0, []).append(position)
+                continue
+            remaining[position] = inTable
+            if bestWin:
+                winningConversion[position] = 1
+                buckets.setdefault(bestWin, []).append(position)
+            elif inTable == 0 and not drawEscape[position]:
+                buckets.setdefault(lossFloor[position], []).append(position)
+
+    # Pass 2: walk backwards from decided positions one ply at a time. A position is lost once
+    # every move loses, won as soon as one move reaches a lost position.
+    level = 0
+    maxLevel = max(buckets, default=-1)
+    while level <= maxLevel and level < MAX_VALUE:
+        for position in buckets.pop(level, ()):
+            if values[position]:
+                continue
+            values[position] = level + 1
+            side, index = divmod(position, size)
+            squares = [(index >> shift) & 63 for shift in shifts]
+            occupied = 0
+            for sq in squares:
+                occupied |= 1 << sq
+            # The side that made the last move, whose moves are taken back
+            mover = 'b' if side == 0 else 'w'
+            previousSide = 1 - side
+            lost = level % 2 == 0
+            for i in range(n):
+                if colors[i] != mover:
+                    continue
+                current = squares[i]
+                if pieces[i][1] == 'p':
+                    step = 8 if mover == 'w' else -8
+                    origins = 0
+                    back = current + step
+                    if 0 <= back < 64 and not occupied >> back & 1 and back // 8 not in (0, 7):
+                        origins |= 1 << back
+                        if current // 8 == (4 if mover == 'w' else 3) and not occupied >> (back + step) & 1:
+                            origins |= 1 << (back + step)
+                else:
+                    origins = pieceAttacks(pieces[i], current, occupied) & ~occupied
+                while origins:
+                    lowest = origins & -origins
+                    origin = lowest.bit_length() - 1
+                    origins ^= lowest
+                    previous = previousSide * size + index + ((origin - current) << shifts[i])
+                    if not legal[previous] or values[previous]:
+                        continue
+                    if lost:
+                        buckets.setdefault(level + 1, []).append(previous)
+                        maxLevel = max(maxLevel, level + 1)
+                    else:
+                        remaining[previous] -= 1
+                        if remaining[previous] == 0 and not drawEscape[previous] and not winningConversion[previous]:
+                            lossLevel = max(level + 1, lossFloor[previous])
+                            buckets.setdefault(lossLevel, []).append(previous)
+                            maxLevel = max(maxLevel, lossLevel)
+        level += 1
+
+    for table in subtables.values():
+        table.close()
+    bits = writeTable(path, values)
+    decided = 2 * size - values.count(0)
+    log('%s: %d legal positions, %d decided, longest mate %d plies, %d bits/entry, %.1fs' %
+        (key, sum(legal), decided, max(values) - 1 if decided else 0, bits, time.time() - startTime))
+    return path
+
+
+def conversionKeys(pieces):
+    # Tables reached from this material by one capture or promotion (bare kings need no table)
+    keys = set()
+    for i, piece in enumerate(pieces):
+        if piece[1] == 'K':
+            continue
+        rest = pieces[:i] + pieces[i + 1:]
+        if len(rest) > 2:
+            keys.add(tuple(rest))
+        if piece[1] == 'p':
+            for promoteTo in PROMOTION_TYPES:
+                keys.add(tuple(pieces[:i] + [piece[0] + promoteTo] + pieces[i + 1:]))
+    result = set()
+    for childPieces in keys:
+        if needsMirror(childPieces):
+            childPieces = [('b' if p[0] == 'w' else 'w') + p[1] for p in childPieces]
+        result.add(materialKey(childPieces))
+    return sorted(result)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate or probe endgame tablebases')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    generateParser = subparsers.add_parser('generate', help='generate tables, e.g. KQvK KRvK KPvK')
+    generateParser.add_argument('keys', nargs='+')
+    generateParser.add_argument('--dir', default=TABLEBASE_DIR)
+    probeParser = subparsers.add_parser('probe', help='look up a position and its best move')
+    probeParser.add_argument('fen')
+    probeParser.add_argument('--dir', default=TABLEBASE_DIR)
+    args = parser.parse_args()
+    if args.command == 'generate':
+        for tableKey in args.keys:
+            generate(tableKey, args.dir)
+    else:
+        from Chess.ChessEngine import GameState
+        tablebase = Tablebase(args.dir)
+        gameState = GameState.fromFEN(args.fen)
+        value = tablebase.probeValue(gameState)
+        if value is None:
+            print('not in the tablebases')
+        elif value == 0:
+            print('draw')
+        else:
+            print('%s in %d plies' % ('win' if isValue(value, True) else 'loss', value - 1))
+        result = tablebase.bestMove(gameState, gameState.getValidMoves())
+        if result is not None:
+            print('best move', result[0].getChessNotation())
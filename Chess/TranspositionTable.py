@@ -0,0 +1,53 @@
+# Bound types of a stored score
+EXACT = 0
+LOWER_BOUND = 1  # The search failed high: the real score is at least this
+UPPER_BOUND = 2  # The search failed low: the real score is at most this
+
+# Rough size of one stored entry (tuple, its values and the list slot), used to
+# turn a memory budget into a number of buckets
+ENTRY_BYTES = 150
+
+
+class TranspositionTable:
+    # Fixed-size table of two-slot buckets. Slot 0 keeps the deepest result seen
+    # for the bucket in the current search, slot 1 is always replaced, so
+    # shallow recent results never push out expensive deep ones.
+    def __init__(self, sizeMB=16):
+        self.resize(sizeMB)
+
+    def resize(self, sizeMB):
+        self.numBuckets = max(1, int(sizeMB * 1024 * 1024) // (2 * ENTRY_BYTES))
+        self.clear()
+
+    def clear(self):
+        # Entries are (key, depth, score, bound, bestMoveID, generation)
+        self.slots = [None] * (2 * self.numBuckets)
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def newSearch(self):
+        # Entries from older searches lose their claim on the depth-preferred slot
+        self.generation += 1
+
+    def probe(self, key):
+        self.probes += 1
+        index = (key % self.numBuckets) * 2
+        entry = self.slots[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        entry = self.slots[index + 1]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, score, bound, bestMoveID):
+        index = (key % self.numBuckets) * 2
+        entry = (key, depth, score, bound, bestMoveID, self.generation)
+        deepest = self.slots[index]
+        if deepest is None or deepest[0] == key or depth >= deepest[1] or deepest[5] != self.generation:
+            self.slots[index] = entry
+        else:
+            self.slots[index + 1] = entry
@@ -0,0 +1,238 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from Chess import Evaluation, MoveFinder
+from Chess.ChessEngine import GameState
+from Chess.Pgn import readGames, parseSAN
+
+# Texel tuning: fit the evaluation so that sigmoid(scale * score) predicts the result of the game
+# a position came from. The evaluation is linear in its weights, so a set of positions is a sparse
+# matrix of feature counts (white's minus black's) and scoring them all is one product with the
+# weight vector.
+#
+# Feature layout: material of p, N, B, R, Q (the king's never changes), then one square of the
+# piece-square table per piece type, in white's view (black pieces are mirrored).
+MATERIAL_PIECES = ('p', 'N', 'B', 'R', 'Q')
+TABLE_PIECES = ('p', 'N', 'B', 'R', 'Q', 'K')
+TABLE_NAMES = {'p': 'pawn_scores', 'N': 'knight_scores', 'B': 'bishop_scores', 'R': 'rook_scores',
+               'Q': 'queen_scores', 'K': 'king_scores'}
+TABLE_OFFSET = len(MATERIAL_PIECES)
+NUM_FEATURES = TABLE_OFFSET + 64 * len(TABLE_PIECES)
+RESULT_VALUES = {'1-0': 1.0, '1/2-1/2': 0.5, '0-1': 0.0}
+# Positions this close to the start are mostly book moves and are skipped
+SKIP_PLIES = 8
+# Tuned weights are rounded to this many decimals when written
+DECIMALS = 2
+
+
+def encodeFeatures(board):
+    # (feature indices, counts) of one position
+    counts = {}
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if piece == '--':
+                continue
+            if piece[0] == 'w':
+                sign, square = 1, row * 8 + col
+            else:
+                sign, square = -1, (7 - row) * 8 + col
+            if piece[1] != 'K':
+                feature = MATERIAL_PIECES.index(piece[1])
+                counts[feature] = counts.get(feature, 0) + sign
+            feature = TABLE_OFFSET + TABLE_PIECES.index(piece[1]) * 64 + square
+            counts[feature] = counts.get(feature, 0) + sign
+    features = [feature for feature, count in counts.items() if count != 0]
+    return features, [counts[feature] for feature in features]
+
+
+def weightVector(weights=None):
+    # Evaluation weights (default: the ones in use) as a vector in feature order
+    if weights is None:
+        weights = Evaluation.currentWeights()
+    vector = np.zeros(NUM_FEATURES)
+    for i, piece in enumerate(MATERIAL_PIECES):
+        vector[i] = weights['piece_score'][piece]
+    for i, piece in enumerate(TABLE_PIECES):
+        vector[TABLE_OFFSET + i * 64:TABLE_OFFSET + (i + 1) * 64] = np.ravel(weights[TABLE_NAMES[piece]])
+    return vector
+
+
+def vectorWeights(vector):
+    # Inverse of weightVector, rounded to DECIMALS, as written to a weights file
+    weights = {'piece_score': {'K': 0}}
+    for i, piece in enumerate(MATERIAL_PIECES):
+        weights['piece_score'][piece] = round(float(vector[i]), DECIMALS)
+    for i, piece in enumerate(TABLE_PIECES):
+        table = vector[TABLE_OFFSET + i * 64:TABLE_OFFSET + (i + 1) * 64].reshape(8, 8)
+        weights[TABLE_NAMES[piece]] = [[round(float(value), DECIMALS) for value in row] for row in table]
+    return weights
+
+
+def isQuiet(gameState, validMoves):
+    # Not in check, and no capture or promotion changes the static score: the evaluation
+    # alone describes the position, which is all the tuner can fit
+    if len(validMoves) == 0 or gameState.inCheck():
+        return False
+    turnMultiplier = 1 if gameState.whiteToMove else -1
+    standPat = turnMultiplier * MoveFinder.scoreBoard(gameState)
+    score = MoveFinder.quiescenceSearch(gameState, -MoveFinder.CHECKMATE, MoveFinder.CHECKMATE, turnMultiplier, 0)
+    return abs(score - standPat) < 1e-9
+
+
+def extractPositions(pgnPaths, skipPlies=SKIP_PLIES):
+    # Quiet positions of every decided or drawn game in the PGN files, as a CSR matrix:
+    # returns (indptr, features, counts, results), results being white's score in the game
+    indptr = [0]
+    features = []
+    counts = []
+    results = []
+    for path in pgnPaths:
+        with open(path) as f:
+            for tags, sanMoves, result in readGames(f):
+                if result not in RESULT_VALUES:
+                    continue
+                gameState = GameState.fromFEN(tags['FEN']) if 'FEN' in tags else GameState()
+                for ply, san in enumerate(sanMoves):
+                    validMoves = gameState.getValidMoves()
+                    if ply >= skipPlies and isQuiet(gameState, validMoves):
+                        positionFeatures, positionCounts = encodeFeatures(gameState.board)
+                        features.extend(positionFeatures)
+                        counts.extend(positionCounts)
+                        indptr.append(len(features))
+                        results.append(RESULT_VALUES[result])
+                    move = parseSAN(gameState, san, validMoves)
+                    if move is None:
+                        break
+                    gameState.makeMove(move)
+    return (np.array(indptr, dtype=np.int64), np.array(features, dtype=np.int32),
+            np.array(counts, dtype=np.int8), np.array(results))
+
+
+def savePositions(path, indptr, features, counts, results):
+    np.savez_compressed(path, indptr=indptr, features=features, counts=counts, results=results)
+
+
+def loadPositions(path):
+    data = np.load(path)
+    return data['indptr'], data['features'], data['counts'], data['results']
+
+
+class PositionMatrix:
+    # The sparse feature matrix of a position set, with the two products the tuner needs
+    def __init__(self, indptr, features, counts):
+        self.numPositions = len(indptr) - 1
+        self.rows = np.repeat(np.arange(self.numPositions), np.diff(indptr))
+        self.features = features.astype(np.int64)
+        self.counts = counts.astype(np.float64)
+
+    def scores(self, vector):
+        # Static score of every position, white's view
+        return np.bincount(self.rows, weights=self.counts * vector[self.features], minlength=self.numPositions)
+
+    def transposeTimes(self, values, power=1):
+        # Sum over positions of values[position] * counts ** power, per feature
+        return np.bincount(self.features, weights=self.counts ** power * values[self.rows], minlength=NUM_FEATURES)
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def meanError(matrix, results, vector, scale):
+    return float(np.mean((results - sigmoid(scale * matrix.scores(vector))) ** 2))
+
+
+def fitScale(matrix, results, vector):
+    # The sigmoid scale that best fits the starting weights; tuning then keeps it fixed, which
+    # keeps the weights in the same units (roughly pawns)
+    scores = matrix.scores(vector)
+    low, high = 0.01, 10.0
+    for iteration in range(60):
+        # Golden-section search: the error is unimodal in the scale
+        a = high - (high - low) * 0.618
+        b = low + (high - low) * 0.618
+        if np.mean((results - sigmoid(a * scores)) ** 2) < np.mean((results - sigmoid(b * scores)) ** 2):
+            high = b
+        else:
+            low = a
+    return (low + high) / 2
+
+
+def tune(matrix, results, vector, scale, iterations=500, rate=0.5, regularization=0.0, log=None):
+    # Minimize the mean squared error of the predictions with full-batch gradient steps. Each
+    # weight's step is divided by the curvature of the error along it (diagonal Newton), so rare
+    # squares move as fast as common ones. regularization adds that much of the squared distance
+    # from the starting weights to the error, which keeps rarely seen squares from fitting noise.
+    # Returns the tuned vector.
+    start = vector
+    vector = vector.copy()
+    predicted = sigmoid(scale * matrix.scores(vector))
+    curvature = 2 * scale * scale * matrix.transposeTimes(predicted * (1 - predicted), 2) / matrix.numPositions
+    curvature[curvature > 0] += 2 * regularization
+    # Weights no position uses keep their value
+    used = curvature > 0
+    for iteration in range(iterations):
+        predicted = sigmoid(scale * matrix.scores(vector))
+        error = predicted - results
+        gradient = 2 * scale * matrix.transposeTimes(error * predicted * (1 - predicted)) / matrix.numPositions + \
+            2 * regularization * (vector - start)
+        vector[used] -= rate * gradient[used] / curvature[used]
+        if log is not None and (iteration % 50 == 0 or iteration == iterations - 1):
+            log('iteration %d: error %.6f' % (iteration, float(np.mean(error ** 2))))
+    return recenter(vector, start, used)
+
+
+def recenter(vector, start, used):
+    # Adding c to every square of a table and taking c off the piece's material changes no score
+    # (for the king, whose counts always cancel, the table alone). Give each table back the
+    # average it started with over the squares the positions use and move the difference into
+    # the material value, so material stays comparable to the piece values search pruning uses.
+    vector = vector.copy()
+    for i, piece in enumerate(TABLE_PIECES):
+        squares = slice(TABLE_OFFSET + i * 64, TABLE_OFFSET + (i + 1) * 64)
+        squaresUsed = used[squares]
+        if squaresUsed.any():
+            shift = vector[squares][squaresUsed].mean() - start[squares][squaresUsed].mean()
+            vector[squares][squaresUsed] -= shift
+            if piece in MATERIAL_PIECES:
+                vector[MATERIAL_PIECES.index(piece)] += shift
+    return vector
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Texel tuning of the evaluation weights')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    extract = subparsers.add_parser('extract', help='collect quiet positions and results from PGN files')
+    extract.add_argument('pgn', nargs='+')
+    extract.add_argument('--out', default='positions.npz')
+    extract.add_argument('--skip-plies', type=int, default=SKIP_PLIES, help='skip the opening plies of every game')
+    fit = subparsers.add_parser('tune', help='fit the weights to extracted positions')
+    fit.add_argument('positions', help='file written by extract')
+    fit.add_argument('--out', default=Evaluation.WEIGHTS_FILE, help='weights file (default: the one loaded at startup)')
+    fit.add_argument('--iterations', type=int, default=500)
+    fit.add_argument('--rate', type=float, default=0.5)
+    fit.add_argument('--scale', type=float, help='sigmoid scale (default: fitted to the current weights)')
+    fit.add_argument('--regularization', type=float, default=0.0, help='pull towards the current weights')
+    args = parser.parse_args()
+    if args.command == 'extract':
+        start = time.time()
+        data = extractPositions(args.pgn, args.skip_plies)
+        savePositions(args.out, *data)
+        print('%d positions written to %s in %.1fs' % (len(data[3]), args.out, time.time() - start))
+    else:
+        indptr, features, counts, results = loadPositions(args.positions)
+        matrix = PositionMatrix(indptr, features, counts)
+        start = weightVector()
+        scale = args.scale if args.scale is not None else fitScale(matrix, results, start)
+        print('%d positions, scale %.4f, starting error %.6f' % (matrix.numPositions, scale,
+                                                                 meanError(matrix, results, start, scale)))
+        tuned = tune(matrix, results, start, scale, args.iterations, args.rate, args.regularization, log=print)
+        weights = vectorWeights(tuned)
+        print('tuned error %.6f' % meanError(matrix, results, weightVector(weights), scale))
+        with open(args.out, 'w') as f:
+            json.dump(weights, f, indent=1)
+        print('weights written to', args.out)
@@ -0,0 +1,307 @@
+import sys
+import threading
+import time
+
+from Chess import MoveFinder
+from Chess.ChessEngine import GameState, START_FEN
+
+ENGINE_NAME = 'ChessAI'
+ENGINE_AUTHOR = 'khnhk0ogei04'
+# Depth limit for searches bounded only by time, nodes or "stop"
+MAX_DEPTH = MoveFinder.MAX_PLY
+# Time kept back from every clock-based search for the GUI and process overhead (seconds)
+MOVE_OVERHEAD = 0.05
+# Moves left to plan for when the GUI doesn't send movestogo
+DEFAULT_MOVES_TO_GO = 30
+
+
+class UciEngine:
+    # One engine process: reads commands from a stream, runs one search at a time on a
+    # background thread and writes responses. The transposition table and move-ordering
+    # tables live in MoveFinder, so they stay warm from one "go" to the next.
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock()
+        self.gameState = GameState()
+        self.workers = 1
+        # "debug on": collect search statistics and report them after every search
+        self.debug = False
+        # Nnue.Network from the EvalFile option, or None for the piece-square evaluation, and
+        # its file, which the parallel search's workers load it from
+        self.network = None
+        self.networkPath = None
+        self.searchThread = None
+        self.stopEvent = threading.Event()
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def run(self, stream=sys.stdin):
+        for line in stream:
+            if not self.handle(line):
+                break
+        self.stopSearch()
+        if self.workers > 1:
+            from Chess import ParallelSearch
+            ParallelSearch.shutdown()
+
+    def handle(self, line):
+        # Process one command line; returns False on "quit"
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send('id name %s' % ENGINE_NAME)
+            self.send('id author %s' % ENGINE_AUTHOR)
+            self.send('option name Hash type spin default %d min 1 max 4096' % MoveFinder.HASH_SIZE_MB)
+            self.send('option name Threads type spin default 1 min 1 max 64')
+            self.send('option name SelectiveSearch type check default %s' % str(MoveFinder.SELECTIVE_SEARCH).lower())
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('option name EvalFile type string default <empty>')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'debug':
+            self.debug = args[:1] == ['on']
+        elif command == 'setoption':
+            self.setOption(args)
+        elif command == 'ucinewgame':
+            self.stopSearch()
+            MoveFinder.transpositionTable.clear()
+            MoveFinder.historyScores.clear()
+            self.gameState = GameState()
+        elif command == 'position':
+            self.stopSearch()
+            self.setPosition(args)
+        elif command == 'go':
+            self.stopSearch()
+            self.startSearch(args)
+        elif command == 'stop':
+            self.stopSearch()
+        elif command == 'quit':
+            return False
+        return True
+
+    def setOption(self, args):
+        # setoption name <name...> [value <value...>]
+        if 'name' not in args:
+            return
+        if 'value' in args:
+            name = ' '.join(args[args.index('name') + 1:args.index('value')])
+            value = ' '.join(args[args.index('value') + 1:])
+        else:
+            name = ' '.join(args[args.index('name') + 1:])
+            value = ''
+        self.stopSearch()
+        try:
+            if name.lower() == 'hash':
+                MoveFinder.HASH_SIZE_MB = max(1, int(value))
+                MoveFinder.transpositionTable.resize(MoveFinder.HASH_SIZE_MB)
+            elif name.lower() == 'threads':
+                self.workers = max(1, int(value))
+                if self.workers > 1:
+                    from Chess import ParallelSearch
+                    ParallelSearch.getPool(self.workers)
+            elif name.lower() == 'selectivesearch':
+                MoveFinder.SELECTIVE_SEARCH = value.lower() == 'true'
+            elif name.lower() == 'bookfile':
+                if MoveFinder.openingBook is not None:
+                    MoveFinder.openingBook.close()
+                    MoveFinder.openingBook = None
+                if value and value != '<empty>':
+                    from Chess.OpeningBook import OpeningBook
+                    MoveFinder.openingBook = OpeningBook(value)
+            elif name.lower() == 'tablebasepath':
+                if MoveFinder.tablebase is not None:
+                    MoveFinder.tablebase.close()
+                    MoveFinder.tablebase = None
+                if value and value != '<empty>':
+                    from Chess.Tablebase import Tablebase
+                    MoveFinder.tablebase = Tablebase(value)
+            elif name.lower() == 'evalfile':
+                self.network = self.networkPath = None
+                if value and value != '<empty>':
+                    from Chess.Nnue import loadNetwork
+                    self.network = loadNetwork(value)
+                    self.networkPath = value
+        except (ValueError, OSError) as error:
+            # A bad value or an unreadable file must not take the engine down
+            self.send('info string invalid value for option %s: %s' % (name, error))
+
+    def setPosition(self, args):
+        # position startpos|fen <fen> [moves <move>...]
+        if 'moves' in args:
+            movesIndex = args.index('moves')
+            moveTexts = args[movesIndex + 1:]
+            args = args[:movesIndex]
+        else:
+            moveTexts = []
+        if args and args[0] == 'fen':
+            fen = ' '.join(args[1:])
+        else:
+            fen = START_FEN
+        try:
+            gameState = GameState.fromFEN(fen)
+        except ValueError as error:
+            # Keep the previous position rather than search a broken one
+            self.send('info string invalid position: %s' % error)
+            return
+        self.gameState = gameState
+        for moveText in moveTexts:
+            move = findMove(self.gameState, moveText)
+            if move is None:
+                self.send('info string illegal move %s' % moveText)
+                break
+            self.gameState.makeMove(move)
+
+    def startSearch(self, args):
+        def onInvalid(name, text):
+            self.send('info string invalid value for %s: %s' % (name, text))
+        limits = parseGoLimits(args, onInvalid)
+        self.stopEvent = threading.Event()
+        # The search works on its own copy, so a following "position" can't disturb it
+        gameState = GameState.fromFEN(self.gameState.toFEN())
+        if self.network is not None:
+            from Chess.Nnue import Accumulator
+            gameState.nnue = Accumulator(self.network, gameState)
+        self.searchThread = threading.Thread(target=self.search, args=(gameState, limits, self.stopEvent),
+                                             daemon=True)
+        self.searchThread.start()
+
+    def stopSearch(self):
+        if self.searchThread is not None:
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+    def search(self, gameState, limits, stopEvent):
+        validMoves = gameState.getValidMoves()
+        if len(validMoves) == 0:
+            self.send('bestmove 0000')
+            return
+        timeLimit = allocateTime(limits, gameState.whiteToMove)
+        maxDepth = limits.get('depth', MAX_DEPTH)
+        startTime = time.time()
+        if self.workers > 1:
+            bestMove = self.searchParallel(gameState, validMoves, maxDepth, timeLimit, limits.get('nodes'),
+                                           stopEvent, startTime)
+        else:
+            def onIteration(depth, score, bestMove):
+                self.sendInfo(gameState, depth, score, bestMove, startTime)
+            bestMove = MoveFinder.findBestMove(gameState, validMoves, maxDepth=maxDepth, timeLimit=timeLimit,
+                                               nodeLimit=limits.get('nodes'), stopEvent=stopEvent,
+                                               onIteration=onIteration, collectStats=self.debug)
+            if self.debug:
+                self.send('info string %s' % MoveFinder.searchStats)
+        if bestMove is None:
+            bestMove = MoveFinder.orderMoves(validMoves, 0)[0]
+        # "go infinite" and "go ponder" may not answer before "stop"
+        if limits.get('infinite'):
+            stopEvent.wait()
+        self.send('bestmove %s' % bestMove.getChessNotation())
+
+    def searchParallel(self, gameState, validMoves, maxDepth, timeLimit, nodeLimit, stopEvent, startTime):
+        # Iterative deepening over ParallelSearch's root split. The clock is enforced by setting
+        # stopEvent, which cancels the unfinished depth; each depth gets the nodes the earlier
+        # ones left.
+        from Chess import ParallelSearch
+        timer = None
+        if timeLimit is not None:
+            timer = threading.Timer(timeLimit, stopEvent.set)
+            timer.start()
+        bestMove = None
+        nodes = 0
+        try:
+            for depth in range(1, maxDepth + 1):
+                move = ParallelSearch.findBestMoveParallel(gameState, validMoves, depth=depth, workers=self.workers,
+                                                           stopEvent=stopEvent,
+                                                           nodeLimit=nodeLimit - nodes if nodeLimit is not None else None,
+                                                           networkPath=self.networkPath)
+                if move is None:
+                    break
+                nodes += ParallelSearch.nodesSearched
+                if ParallelSearch.depthReached < depth:
+                    # Cut short by a limit, or a book or tablebase move: the last completed depth's
+                    # move stands if there is one
+                    if bestMove is None:
+                        bestMove = move
+                    break
+                bestMove = move
+                self.sendInfo(gameState, depth, ParallelSearch.searchScore, move, startTime, nodes)
+                if abs(ParallelSearch.searchScore) >= MoveFinder.CHECKMATE or \
+                        (nodeLimit is not None and nodes >= nodeLimit):
+                    break
+        finally:
+            if timer is not None:
+                timer.cancel()
+        return bestMove
+
+    def sendInfo(self, gameState, depth, score, bestMove, startTime, nodes=None):
+        # nodes defaults to those of MoveFinder's current search
+        elapsed = time.time() - startTime
+        if nodes is None:
+            nodes = MoveFinder.nodesSearched + MoveFinder.quiescenceNodes
+        line = MoveFinder.principalVariation(gameState, bestMove, depth)
+        self.send('info depth %d score %s nodes %d nps %d time %d pv %s' %
+                  (depth, formatScore(score, len(line)), nodes, nodes / elapsed if elapsed > 0 else 0,
+                   elapsed * 1000, ' '.join(move.getChessNotation() for move in line)))
+
+
+def findMove(gameState, moveText):
+    # The legal move written in long algebraic notation (e2e4, e7e8q), or None
+    moveText = moveText.lower()
+    for move in gameState.getValidMoves():
+        if move.getChessNotation() == moveText:
+            return move
+    return None
+
+
+def parseGoLimits(args, onInvalid=None):
+    # go [depth N] [nodes N] [movetime ms] [wtime ms] [btime ms] [winc ms] [binc ms] [movestogo N] [infinite]
+    # A limit whose value isn't a number is left out and passed to onInvalid(name, text).
+    limits = {}
+    i = 0
+    while i < len(args):
+        if args[i] in ('depth', 'nodes', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo') and i + 1 < len(args):
+            try:
+                limits[args[i]] = int(args[i + 1])
+            except ValueError:
+                if onInvalid is not None:
+                    onInvalid(args[i], args[i + 1])
+            i += 2
+        else:
+            if args[i] in ('infinite', 'ponder'):
+                limits['infinite'] = True
+            i += 1
+    return limits
+
+
+def allocateTime(limits, whiteToMove):
+    # Seconds to spend on this move, or None for no time limit
+    if 'movetime' in limits:
+        return max(0.0, limits['movetime'] / 1000.0 - MOVE_OVERHEAD)
+    remaining = limits.get('wtime' if whiteToMove else 'btime')
+    if remaining is None:
+        return None
+    increment = limits.get('winc' if whiteToMove else 'binc', 0)
+    movesToGo = limits.get('movestogo', DEFAULT_MOVES_TO_GO)
+    budget = remaining / max(1, movesToGo) + increment * 0.75
+    return max(0.0, min(budget, remaining - MOVE_OVERHEAD * 1000) / 1000.0)
+
+
+def formatScore(score, pvLength):
+    # Scores are in pawns from the side to move's point of view. Mates aren't scored by
+    # distance, so the moves to mate are read off the principal variation.
+    if score >= MoveFinder.CHECKMATE:
+        return 'mate %d' % ((pvLength + 1) // 2)
+    if score <= -MoveFinder.CHECKMATE:
+        return 'mate -%d' % (pvLength // 2)
+    return 'cp %d' % round(score * 100)
+
+
+if __name__ == '__main__':
+    UciEngine().run()
@@ -0,0 +1,31 @@
+import random
+
+# A fixed seed keeps keys identical across runs and processes, so stored
+# tables keyed by position stay valid.
+_random = random.Random(0x5EED)
+
+PIECES = ('wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK')
+# PIECE_KEYS[piece][row * 8 + col]
+PIECE_KEYS = {piece: [_random.getrandbits(64) for sq in range(64)] for piece in PIECES}
+# XORed in when black is to move
+SIDE_KEY = _random.getrandbits(64)
+# Indexed by CastleRights.getBits()
+CASTLE_KEYS = [_random.getrandbits(64) for bits in range(16)]
+# Indexed by the file of the en passant square
+ENPASSANT_KEYS = [_random.getrandbits(64) for col in range(8)]
+
+
+def computeKey(gameState):
+    # Full recomputation; makeMove keeps gameState.zobristKey up to date incrementally
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            piece = gameState.board[row][col]
+            if piece != '--':
+                key ^= PIECE_KEYS[piece][row * 8 + col]
+    if not gameState.whiteToMove:
+        key ^= SIDE_KEY
+    key ^= CASTLE_KEYS[gameState.currentCastlingRight.getBits()]
+    if gameState.enpassantPossible != ():
+        key ^= ENPASSANT_KEYS[gameState.enpassantPossible[1]]
+    return key
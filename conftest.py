@@ -0,0 +1 @@
+# Lets pytest import the Chess package from the repository root
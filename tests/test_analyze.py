@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from Chess.Analyze import analyzePosition, parseEPD, runSuite
+from Chess.SelfPlay import parseEngine
+
+START = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -'
+
+
+@pytest.mark.parametrize('line, fen, operations', [
+    # Plain FEN lines, with and without move counters
+    (START + ' 3 12', START + ' 3 12', {}),
+    (START, START + ' 0 1', {}),
+    # Several operands, and a quoted operand holding spaces and ';'
+    (START + ' bm e4 d4; id "Start; both centre pawns";', START + ' 0 1',
+     {'bm': ['e4', 'd4'], 'id': ['Start; both centre pawns']}),
+    # hmvc/fmvn become the move counters
+    (START + ' am f3; hmvc 7; fmvn 20;', START + ' 7 20', {'am': ['f3'], 'hmvc': ['7'], 'fmvn': ['20']}),
+    # A full FEN followed by operations anyway
+    (START + ' 2 5 bm Nf3;', START + ' 2 5', {'bm': ['Nf3']}),
+])
+def test_parse_epd(line, fen, operations):
+    assert parseEPD(line) == (fen, operations)
+
+
+ENGINE = parseEngine('depth=2', 'engine')
+# White mates in one with Rh8
+MATE = 'k7/8/1K6/8/8/8/8/7R w - -'
+
+
+@pytest.mark.parametrize('operations, solved', [
+    ('bm Rh8#; id "mate";', True),
+    ('bm Kc6;', False),
+    ('am Rh8#;', False),
+    ('am Kc6 Kc5;', True),
+])
+def test_analyze_checks_bm_and_am(operations, solved):
+    record = analyzePosition(0, MATE + ' ' + operations, ENGINE)
+    assert record['bestMove'] == 'Rh8#' and record['uci'] == 'h1h8'
+    assert record['solved'] is solved
+    assert ('solvedDepth' in record) is solved
+    assert 'error' not in record
+
+
+def test_analyze_reports_bad_positions():
+    record = analyzePosition(0, MATE + ' bm Qh8;', ENGINE)
+    assert record['error'].startswith('unparsable bm move')
+    record = analyzePosition(1, 'k1R5/8/1K6/8/8/8/8/8 b - -', ENGINE)
+    assert record['bestMove'] is None and record['error'] == 'no legal moves'
+    assert 'solved' not in record
+
+
+def test_run_suite(tmp_path, capsys):
+    suitePath = tmp_path / 'suite.epd'
+    suitePath.write_text('# comment\n%s bm Rh8#; id "mate";\n\n%s bm Kc6;\n%s\n' % (MATE, MATE, START))
+    jsonlPath = str(tmp_path / 'results.jsonl')
+    summary = runSuite(str(suitePath), ENGINE, workers=1, jsonlPath=jsonlPath)
+    assert (summary['positions'], summary['checked'], summary['solved']) == (3, 2, 1)
+    with open(jsonlPath) as f:
+        records = [json.loads(line) for line in f]
+    assert [record['index'] for record in records] == [0, 1, 2]
+    assert records[0]['id'] == 'mate' and 'solved' not in records[2]
+    assert runSuite(str(suitePath), ENGINE, workers=1, limit=1)['positions'] == 1
+    assert 'FAIL' in capsys.readouterr().out
@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+
+from Chess import BatchEvaluation, MoveFinder
+from Chess.ChessEngine import GameState
+
+
+def randomPositions(games=10, plies=60, seed=1):
+    # Non-terminal positions from random games, each a fresh GameState
+    rng = random.Random(seed)
+    positions = []
+    for game in range(games):
+        gameState = GameState()
+        for ply in range(plies):
+            validMoves = gameState.getValidMoves()
+            if len(validMoves) == 0:
+                break
+            positions.append(GameState.fromFEN(gameState.toFEN()))
+            gameState.makeMove(rng.choice(validMoves))
+    return positions
+
+
+def test_encode_planes_marks_every_piece():
+    gameState = GameState()
+    planes = BatchEvaluation.encodePlanes([gameState])
+    assert planes.shape == (1, 12, 64)
+    for row in range(8):
+        for col in range(8):
+            piece = gameState.board[row][col]
+            expected = [int(piece == planePiece) for planePiece in BatchEvaluation.PLANE_PIECES]
+            assert list(planes[0, :, row * 8 + col]) == expected
+
+
+def test_score_planes_matches_score_board():
+    positions = randomPositions()
+    scores = BatchEvaluation.scorePlanes(BatchEvaluation.encodePlanes(positions))
+    expected = np.array([MoveFinder.scoreBoard(gameState) for gameState in positions])
+    assert np.allclose(scores, expected)
+
+
+def test_score_game_states_matches_score_board():
+    positions = randomPositions(games=3, seed=2)
+    scores = BatchEvaluation.scoreGameStates(positions)
+    assert np.allclose(scores, [MoveFinder.scoreBoard(gameState) for gameState in positions])
+
+
+def test_checkmate_and_stalemate_override_the_planes():
+    # Fool's mate (white is mated), the same with colors reversed, and a stalemate
+    fens = ['rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3',
+            'rnbqkbnr/ppppp2p/5p2/6pQ/4P3/8/PPPP1PPP/RNB1KBNR b KQkq - 1 3',
+            '7k/5Q2/6K1/8/8/8/8/8 b - - 0 1']
+    positions = [GameState.fromFEN(fen) for fen in fens]
+    for gameState in positions:
+        gameState.getValidMoves()
+    scores = BatchEvaluation.scoreGameStates(positions)
+    assert list(scores) == [-BatchEvaluation.CHECKMATE, BatchEvaluation.CHECKMATE, BatchEvaluation.STALEMATE]
+    assert list(scores) == [MoveFinder.scoreBoard(gameState) for gameState in positions]
@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from Chess.Bitboard import BitboardGameState
+from Chess.ChessEngine import GameState, START_FEN
+from Chess.Perft import POSITIONS
+
+FENS = [START_FEN] + [fen for name, fen, expected in POSITIONS] + [
+    # En passant square, black to move, partial castling rights and move counters
+    'rnbqkbnr/pppp1ppp/8/8/3Pp3/8/PPP1PPPP/RNBQKBNR b Kq d3 0 3',
+    '8/8/4k3/8/8/4K3/8/8 w - - 57 112',
+]
+
+
+@pytest.mark.parametrize('fen', FENS)
+def test_fen_round_trip(fen):
+    assert GameState.fromFEN(fen).toFEN() == fen
+
+
+def test_start_position_matches_new_game():
+    assert GameState().toFEN() == START_FEN
+    assert GameState.fromFEN(START_FEN).zobristKey == GameState().zobristKey
+
+
+@pytest.mark.parametrize('stateClass', [GameState, BitboardGameState], ids=lambda stateClass: stateClass.__name__)
+def test_fen_round_trip_during_games(stateClass):
+    # A position rebuilt from its FEN has the same key, scores and legal moves as the game it came from
+    rng = random.Random(3)
+    for game in range(10):
+        gameState = stateClass()
+        for ply in range(80):
+            validMoves = gameState.getValidMoves()
+            copy = stateClass.fromFEN(gameState.toFEN())
+            assert copy.toFEN() == gameState.toFEN()
+            assert copy.board == gameState.board
+            assert copy.zobristKey == gameState.zobristKey
+            assert (copy.whiteMaterial, copy.blackMaterial) == (gameState.whiteMaterial, gameState.blackMaterial)
+            assert sorted(move.moveID for move in copy.getValidMoves()) == sorted(move.moveID for move in validMoves)
+            if len(validMoves) == 0:
+                break
+            gameState.makeMove(rng.choice(validMoves))
@@ -0,0 +1,93 @@
+import random
+
+import pytest
+
+from Chess.Bitboard import BitboardGameState
+from Chess.ChessEngine import GameState
+from Chess.MoveCache import MoveCache
+
+BACKENDS = [GameState, BitboardGameState]
+
+
+def moveIDs(moves):
+    return sorted(move.moveID for move in moves)
+
+
+@pytest.mark.parametrize('stateClass', BACKENDS, ids=lambda stateClass: stateClass.__name__)
+def test_cached_moves_match_generated_moves(stateClass):
+    # Random games with takebacks revisit positions, so most lookups after the first game hit
+    rng = random.Random(7)
+    cache = MoveCache()
+    for game in range(8):
+        cached = stateClass()
+        cached.moveCache = cache
+        plain = stateClass()
+        for ply in range(150):
+            moves = cached.getValidMoves()
+            assert moveIDs(moves) == moveIDs(plain.getValidMoves())
+            assert (cached.checkMate, cached.staleMate) == (plain.checkMate, plain.staleMate)
+            if len(moves) == 0:
+                break
+            if ply > 10 and rng.random() < 0.15:
+                for gameState in (cached, plain):
+                    gameState.undoMove()
+                    gameState.undoMove()
+            else:
+                move = rng.choice(moves)
+                cached.makeMove(move)
+                plain.makeMove(move)
+    assert cache.hits > 0 and cache.misses > 0
+
+
+def test_mate_flags_come_back_from_the_cache():
+    cache = MoveCache()
+    # Fool's mate: the second lookup is a hit, and must set the flags again
+    mated = GameState.fromFEN('rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3')
+    mated.moveCache = cache
+    assert mated.getValidMoves() == [] and mated.checkMate
+    mated.checkMate = False
+    assert mated.getValidMoves() == [] and mated.checkMate and not mated.staleMate
+    assert cache.hits == 1
+
+
+def test_callers_get_their_own_list():
+    gameState = GameState()
+    gameState.moveCache = MoveCache()
+    moves = gameState.getValidMoves()
+    expected = moveIDs(moves)
+    moves.reverse()
+    moves.pop()
+    moves.append(moves[0])
+    again = gameState.getValidMoves()
+    assert again is not moves
+    assert moveIDs(again) == expected
+    again.clear()
+    assert moveIDs(gameState.getValidMoves()) == expected
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = MoveCache(maxEntries=2)
+    cache.put(1, ['a'], False, False)
+    cache.put(2, ['b'], False, False)
+    # Reading 1 makes 2 the least recently used
+    assert cache.get(1) == (['a'], False, False)
+    cache.put(3, ['c'], False, False)
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+    assert list(cache.entries) == [1, 3]
+    # Replacing an entry doesn't grow the cache
+    cache.put(1, ['d'], True, False)
+    assert len(cache.entries) == 2 and cache.get(1) == (['d'], True, False)
+
+
+def test_hit_and_miss_counters():
+    cache = MoveCache()
+    assert cache.hitRate() == 0.0
+    assert cache.get(5) is None
+    cache.put(5, [], False, True)
+    assert cache.get(5) == ([], False, True)
+    assert cache.get(5) is not None
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert cache.hitRate() == pytest.approx(2 / 3)
+    cache.clear()
+    assert (cache.hits, cache.misses, len(cache.entries)) == (0, 0, 0)
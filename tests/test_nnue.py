@@ -0,0 +1,91 @@
+import random
+
+import numpy as np
+import pytest
+
+from Chess import Nnue
+from Chess.Bitboard import BitboardGameState
+from Chess.ChessEngine import GameState
+from Chess.Perft import POSITIONS
+
+BACKENDS = [GameState, BitboardGameState]
+# A small network keeps the test fast; the feature layout doesn't depend on the sizes
+NETWORK = Nnue.randomNetwork(seed=5, accumulatorSize=16, hiddenSize=8)
+
+
+def assertMatchesReference(gameState):
+    # The incremental accumulators equal a full recompute, and so does the evaluation
+    for perspective in (0, 1):
+        expected = NETWORK.accumulate(gameState.board, perspective, Nnue.kingSquare(gameState, perspective))
+        assert np.array_equal(gameState.nnue.values[perspective], expected)
+    assert gameState.nnue.evaluate(gameState.whiteToMove) == NETWORK.evaluatePosition(gameState)
+
+
+def withAccumulator(stateClass, fen):
+    gameState = stateClass.fromFEN(fen)
+    gameState.nnue = Nnue.Accumulator(NETWORK, gameState)
+    return gameState
+
+
+@pytest.mark.parametrize('stateClass', BACKENDS, ids=lambda stateClass: stateClass.__name__)
+def test_every_kind_of_move(stateClass):
+    # Every legal move of the perft positions, made and taken back, plus an en passant capture
+    fens = [fen for name, fen, expected in POSITIONS] + ['rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3']
+    kinds = set()
+    for fen in fens:
+        gameState = withAccumulator(stateClass, fen)
+        for move in gameState.getValidMoves():
+            kinds.update(kind for kind, made in (('enpassant', move.isEnpassantMove), ('castle', move.isCastleMove),
+                                                 ('promotion', move.isPawnPromotion),
+                                                 ('king', move.pieceMoved[1] == 'K')) if made)
+            gameState.makeMove(move)
+            assertMatchesReference(gameState)
+            gameState.undoMove()
+            assertMatchesReference(gameState)
+    assert kinds == {'enpassant', 'castle', 'promotion', 'king'}
+
+
+@pytest.mark.parametrize('stateClass', BACKENDS, ids=lambda stateClass: stateClass.__name__)
+def test_random_games_with_undo(stateClass):
+    rng = random.Random(11)
+    for game in range(6):
+        gameState = withAccumulator(stateClass, GameState().toFEN())
+        for ply in range(100):
+            validMoves = gameState.getValidMoves()
+            if len(validMoves) == 0:
+                break
+            if ply > 10 and rng.random() < 0.1:
+                gameState.undoMove()
+                gameState.undoMove()
+            else:
+                gameState.makeMove(rng.choice(validMoves))
+            assertMatchesReference(gameState)
+            if not gameState.inCheck():
+                state = gameState.makeNullMove()
+                assertMatchesReference(gameState)
+                gameState.undoNullMove(state)
+                assertMatchesReference(gameState)
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'network.npz')
+    Nnue.saveNetwork(path, NETWORK)
+    loaded = Nnue.loadNetwork(path)
+    gameState = GameState.fromFEN(POSITIONS[1][1])
+    assert loaded.evaluatePosition(gameState) == NETWORK.evaluatePosition(gameState)
+
+
+def test_save_rejects_weights_beyond_int8(tmp_path):
+    network = Nnue.randomNetwork(seed=5, accumulatorSize=16, hiddenSize=8)
+    network.outputWeights[0] = 200
+    with pytest.raises(ValueError):
+        Nnue.saveNetwork(str(tmp_path / 'network.npz'), network)
+
+
+def test_rejects_feature_weights_beyond_int16():
+    network = Nnue.randomNetwork(seed=5, accumulatorSize=16, hiddenSize=8)
+    featureWeights = network.featureWeights.astype(np.int32)
+    featureWeights[0, 0] = 40000
+    with pytest.raises(ValueError):
+        Nnue.Network(featureWeights, network.featureBias, network.hiddenWeights, network.hiddenBias,
+                     network.outputWeights, network.outputBias)
@@ -0,0 +1,86 @@
+import pytest
+
+from Chess import MoveFinder
+from Chess.ChessEngine import GameState
+from Chess.OpeningBook import OpeningBook, buildBook
+from Chess.Uci import findMove
+
+PGN = '''[Event "Book test"]
+[White "A"]
+[Black "B"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Event "Book test"]
+[White "C"]
+[Black "D"]
+[Result "1/2-1/2"]
+
+1. d4 d5 2. c4 1/2-1/2
+'''
+
+
+@pytest.fixture
+def pgnPath(tmp_path):
+    path = tmp_path / 'games.pgn'
+    path.write_text(PGN)
+    return str(path)
+
+
+def bookMoves(book, moveTexts=()):
+    # {move: weight} the book holds for the position after moveTexts
+    gameState = GameState()
+    for moveText in moveTexts:
+        gameState.makeMove(findMove(gameState, moveText))
+    movesByID = {move.moveID: move.getChessNotation() for move in gameState.getValidMoves()}
+    return {movesByID[moveID]: weight for moveID, weight in book.lookup(gameState.zobristKey)}
+
+
+def test_build_and_probe(pgnPath, tmp_path):
+    bookPath = str(tmp_path / 'book.bin')
+    # The winner's moves weigh 2, both sides' moves in the draw 1, the loser's moves are left out
+    assert buildBook([pgnPath], bookPath) == 5
+    book = OpeningBook(bookPath)
+    try:
+        assert bookMoves(book) == {'e2e4': 2, 'd2d4': 1}
+        assert bookMoves(book, ['e2e4']) == {}
+        assert bookMoves(book, ['e2e4', 'e7e5']) == {'g1f3': 2}
+        assert bookMoves(book, ['d2d4']) == {'d7d5': 1}
+        assert bookMoves(book, ['d2d4', 'd7d5']) == {'c2c4': 1}
+        gameState = GameState()
+        validMoves = gameState.getValidMoves()
+        assert book.findMove(gameState, validMoves, randomize=False).getChessNotation() == 'e2e4'
+        assert book.findMove(gameState, validMoves).getChessNotation() in ('e2e4', 'd2d4')
+        gameState.makeMove(findMove(gameState, 'g1f3'))
+        assert book.findMove(gameState, gameState.getValidMoves()) is None
+    finally:
+        book.close()
+
+
+def test_ply_and_game_limits(pgnPath, tmp_path):
+    bookPath = str(tmp_path / 'book.bin')
+    assert buildBook([pgnPath], bookPath, maxPlies=1) == 2
+    assert buildBook([pgnPath], bookPath, minGames=2) == 0
+    # An empty book loads and has nothing to say
+    book = OpeningBook(bookPath)
+    try:
+        gameState = GameState()
+        assert book.numRecords == 0
+        assert book.findMove(gameState, gameState.getValidMoves()) is None
+    finally:
+        book.close()
+
+
+def test_search_plays_book_moves(pgnPath, tmp_path, monkeypatch):
+    bookPath = str(tmp_path / 'book.bin')
+    buildBook([pgnPath], bookPath)
+    book = OpeningBook(bookPath)
+    monkeypatch.setattr(MoveFinder, 'openingBook', book)
+    try:
+        gameState = GameState()
+        move = MoveFinder.findBestMove(gameState, gameState.getValidMoves(), maxDepth=3)
+        assert move.getChessNotation() in ('e2e4', 'd2d4')
+        assert MoveFinder.searchStats.source == 'book' and MoveFinder.depthReached == 0
+    finally:
+        book.close()
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+from Chess import MoveFinder, ParallelSearch
+from Chess.ChessEngine import GameState
+from Chess.Perft import POSITIONS
+
+WORKERS = 2
+
+
+@pytest.fixture(scope='module', autouse=True)
+def pool():
+    yield ParallelSearch.getPool(WORKERS)
+    ParallelSearch.shutdown()
+
+
+def resetSearch():
+    # Root move ordering depends on the history scores, which clearMoveOrdering only ages
+    MoveFinder.clearMoveOrdering()
+    MoveFinder.historyScores.clear()
+    MoveFinder.transpositionTable.clear()
+
+
+def rootScores(gameState, depth):
+    # Root moves in the order the search tries them, and each one's full-window score
+    resetSearch()
+    rootMoves = MoveFinder.orderMoves(gameState.getValidMoves(), 0)
+    turnMultiplier = 1 if gameState.whiteToMove else -1
+    scores = []
+    for move in rootMoves:
+        MoveFinder.transpositionTable.clear()
+        gameState.makeMove(move)
+        scores.append(-MoveFinder.findMoveNegamaxAlphaBeta(gameState, None, depth - 1, -MoveFinder.CHECKMATE,
+                                                           MoveFinder.CHECKMATE, -turnMultiplier, 1))
+        gameState.undoMove()
+    return rootMoves, scores
+
+
+@pytest.mark.parametrize('fen', [
+    # A pawn ending where several moves tie, the first of them not being the first move tried
+    '6k1/5ppp/8/8/8/8/5PPP/6K1 w - - 0 1',
+    # Two mates in one
+    '4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1',
+    POSITIONS[1][1],
+])
+def test_picks_the_first_of_the_best_moves(monkeypatch, fen):
+    monkeypatch.setattr(MoveFinder, 'SELECTIVE_SEARCH', False)
+    depth = 3 if fen != POSITIONS[1][1] else 2
+    gameState = GameState.fromFEN(fen)
+    rootMoves, scores = rootScores(gameState, depth)
+    expected = rootMoves[scores.index(max(scores))]
+    for attempt in range(2):
+        resetSearch()
+        move = ParallelSearch.findBestMoveParallel(gameState, gameState.getValidMoves(), depth=depth, workers=WORKERS)
+        assert move == expected
+        assert ParallelSearch.searchScore == max(scores)
+        assert ParallelSearch.depthReached == depth
+    assert gameState.toFEN() == fen
+
+
+def test_limits_return_a_move():
+    gameState = GameState.fromFEN(POSITIONS[1][1])
+    validMoves = gameState.getValidMoves()
+    for limits in ({'timeLimit': 0.0}, {'nodeLimit': 50}):
+        move = ParallelSearch.findBestMoveParallel(gameState, validMoves, depth=4, workers=WORKERS, **limits)
+        assert move in validMoves
+        assert ParallelSearch.depthReached == 0
+    assert gameState.toFEN() == POSITIONS[1][1]
+
+
+def test_stop_before_the_first_score_returns_none():
+    gameState = GameState.fromFEN(POSITIONS[1][1])
+    stopEvent = threading.Event()
+    stopEvent.set()
+    assert ParallelSearch.findBestMoveParallel(gameState, gameState.getValidMoves(), depth=3, workers=WORKERS,
+                                               stopEvent=stopEvent) is None
+    assert gameState.toFEN() == POSITIONS[1][1]
+
+
+def test_cancel_stops_running_tasks():
+    # A task sees the changed search id at its next node, however deep it was asked to go
+    gameState = GameState.fromFEN(POSITIONS[1][1])
+    move = MoveFinder.orderMoves(gameState.getValidMoves(), 0)[1]
+    searchId = 0.5
+    with ParallelSearch._sharedScores.get_lock():
+        ParallelSearch._sharedScores[0] = searchId
+        ParallelSearch._sharedScores[1] = -MoveFinder.CHECKMATE
+    future = ParallelSearch.getPool(WORKERS).submit(ParallelSearch._searchRootMove, GameState, gameState.encode(), 1,
+                                                    move.moveID, 8, searchId, True, None, None, None)
+    with ParallelSearch._sharedScores.get_lock():
+        ParallelSearch._sharedScores[0] = ParallelSearch.CANCELLED
+    moveID, score, exact, nodes = future.result(timeout=30)
+    assert moveID == move.moveID and score is None
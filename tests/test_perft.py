@@ -0,0 +1,29 @@
+import pytest
+
+from Chess.Bitboard import BitboardGameState
+from Chess.ChessEngine import GameState
+from Chess.Perft import POSITIONS, perft, divide
+
+# Deepest depth run for each position; deeper counts are left to Perft.py
+MAX_DEPTH = 3
+BACKENDS = [GameState, BitboardGameState]
+CASES = [(name, fen, depth, nodes) for name, fen, expected in POSITIONS
+         for depth, nodes in sorted(expected.items()) if depth <= MAX_DEPTH]
+
+
+@pytest.mark.parametrize('stateClass', BACKENDS, ids=lambda stateClass: stateClass.__name__)
+@pytest.mark.parametrize('name, fen, depth, nodes', CASES, ids=['%s-%d' % (case[0], case[2]) for case in CASES])
+def test_perft(stateClass, name, fen, depth, nodes):
+    gameState = stateClass.fromFEN(fen)
+    assert perft(gameState, depth) == nodes
+    # Every move was taken back
+    assert gameState.toFEN() == fen
+    assert gameState.moveLog == []
+
+
+@pytest.mark.parametrize('stateClass', BACKENDS, ids=lambda stateClass: stateClass.__name__)
+def test_divide_adds_up(stateClass):
+    name, fen, expected = POSITIONS[1]
+    counts = divide(stateClass.fromFEN(fen), 2)
+    assert len(counts) == expected[1]
+    assert sum(counts.values()) == expected[2]
@@ -0,0 +1,124 @@
+import pytest
+
+from Chess import MoveFinder, Nnue
+from Chess.ChessEngine import GameState
+from Chess.Perft import POSITIONS
+
+
+@pytest.fixture(params=[False, True], ids=['full', 'selective'])
+def selective(request, monkeypatch):
+    monkeypatch.setattr(MoveFinder, 'SELECTIVE_SEARCH', request.param)
+    MoveFinder.transpositionTable.clear()
+    MoveFinder.historyScores.clear()
+    return request.param
+
+
+def search(fen, depth, **options):
+    gameState = GameState.fromFEN(fen)
+    validMoves = gameState.getValidMoves()
+    move = MoveFinder.findBestMove(gameState, validMoves, maxDepth=depth, **options)
+    # The search took back every move it made
+    assert gameState.toFEN() == fen
+    assert gameState.zobristKey == GameState.fromFEN(fen).zobristKey
+    assert gameState.moveLog == []
+    assert move in validMoves
+    return gameState, move
+
+
+def matesInOne(gameState):
+    for move in gameState.getValidMoves():
+        gameState.makeMove(move)
+        mate = gameState.getValidMoves() == [] and gameState.checkMate
+        gameState.undoMove()
+        if mate:
+            return True
+    return False
+
+
+def test_finds_mate_in_two(selective):
+    # Kc7 or Kb6, then mate on the a- or eighth rank whatever black does
+    gameState, move = search('k7/8/2K5/8/8/8/8/7R w - - 0 1', 4)
+    assert MoveFinder.searchScore >= MoveFinder.CHECKMATE
+    gameState.makeMove(move)
+    for reply in gameState.getValidMoves():
+        gameState.makeMove(reply)
+        assert matesInOne(gameState)
+        gameState.undoMove()
+
+
+@pytest.mark.parametrize('fen, bestMove', [('8/8/1p6/1P6/1K6/8/8/k7 w - - 0 1', 'b4c4'),
+                                           ('8/8/8/2k5/2p5/2P1K3/8/8 w - - 0 1', 'e3e4')])
+def test_zugzwang_in_a_pawn_ending(selective, fen, bestMove):
+    # White wins a pawn because black's king runs out of safe moves. A null move would let
+    # black pass instead, so with null moves in pawn endings the search misses the win.
+    gameState, move = search(fen, 6)
+    assert move.getChessNotation() == bestMove
+    assert MoveFinder.searchScore > 1
+
+
+def test_selective_and_full_search_agree_on_mate(monkeypatch):
+    scores = []
+    for selective in (False, True):
+        monkeypatch.setattr(MoveFinder, 'SELECTIVE_SEARCH', selective)
+        search('6k1/5ppp/8/8/8/8/Q4PPP/1R4K1 w - - 0 1', 3)
+        scores.append(MoveFinder.searchScore)
+    assert scores == [MoveFinder.CHECKMATE, MoveFinder.CHECKMATE]
+
+
+class NullMoveCounter(GameState):
+    # Knows when a null-move search is in progress, so a test can stop the search inside one
+    def __init__(self):
+        super().__init__()
+        self.nullMoves = 0
+
+    def makeNullMove(self):
+        self.nullMoves += 1
+        return super().makeNullMove()
+
+    def undoNullMove(self, state):
+        self.nullMoves -= 1
+        super().undoNullMove(state)
+
+
+class StopInsideNullMove:
+    # Stands in for a threading.Event: set from the skip-th budget check made inside a null-move search
+    def __init__(self, gameState, skip):
+        self.gameState = gameState
+        self.skip = skip
+        self.fired = False
+
+    def is_set(self):
+        if self.gameState.nullMoves:
+            self.skip -= 1
+            self.fired = self.fired or self.skip < 0
+        return self.fired
+
+
+@pytest.mark.parametrize('skip', [0, 10, 200])
+def test_stop_inside_a_null_move_search_restores_the_position(monkeypatch, skip):
+    monkeypatch.setattr(MoveFinder, 'SELECTIVE_SEARCH', True)
+    fen = POSITIONS[1][1]
+    gameState = NullMoveCounter.fromFEN(fen)
+    validMoves = gameState.getValidMoves()
+    stopEvent = StopInsideNullMove(gameState, skip)
+    move = MoveFinder.findBestMove(gameState, validMoves, maxDepth=6, stopEvent=stopEvent)
+    assert stopEvent.fired
+    assert move in validMoves
+    assert gameState.nullMoves == 0
+    assert gameState.toFEN() == fen
+    assert gameState.zobristKey == GameState.fromFEN(fen).zobristKey
+    assert gameState.moveLog == []
+
+
+def test_node_limits_restore_the_position(selective):
+    # Node limits landing at many different points of depth-5 searches
+    for nodeLimit in range(50, 3000, 611):
+        search(POSITIONS[1][1], 5, nodeLimit=nodeLimit)
+
+
+def test_scout_window_follows_the_evaluation():
+    gameState = GameState()
+    assert MoveFinder.scoutWindow(gameState) == MoveFinder.SCOUT_WINDOW
+    network = Nnue.randomNetwork(seed=1, accumulatorSize=16, hiddenSize=8)
+    gameState.nnue = Nnue.Accumulator(network, gameState)
+    assert MoveFinder.scoutWindow(gameState) == 1 / network.outputScale
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from Chess import MoveFinder
+from Chess.ChessEngine import GameState
+from Chess.Perft import POSITIONS
+
+SCORE_BOARD = MoveFinder.scoreBoard
+
+
+def search(**options):
+    gameState = GameState.fromFEN(POSITIONS[1][1])
+    move = MoveFinder.findBestMove(gameState, gameState.getValidMoves(), **options)
+    # Nothing was left patched on the game or the module
+    assert 'getValidMoves' not in vars(gameState)
+    assert MoveFinder.scoreBoard is SCORE_BOARD
+    assert MoveFinder.activeStats is None
+    return move
+
+
+def test_collected_statistics():
+    search(maxDepth=3, collectStats=True)
+    stats = MoveFinder.searchStats
+    assert stats.collected and stats.source == 'search'
+    assert stats.depthReached == 3
+    assert stats.nodes == MoveFinder.nodesSearched and stats.quiescenceNodes == MoveFinder.quiescenceNodes
+    assert stats.expandedNodes > 0 and stats.betaCutoffs > 0 and stats.ttProbes >= stats.ttHits > 0
+    assert stats.moveGenCalls > 0 and stats.evalCalls > 0
+    assert stats.moveGenTime > 0 and stats.evalTime > 0
+    assert 0 < stats.cutoffRate <= 1 and 0 < stats.firstMoveCutoffRate <= 1
+    assert set(stats.asDict()) > {'nodes', 'nps', 'cutoffRate', 'moveGenTime', 'evalTime'}
+    assert 'cutoffs' in str(stats)
+
+
+def test_statistics_off():
+    search(maxDepth=3, collectStats=False)
+    stats = MoveFinder.searchStats
+    assert not stats.collected
+    assert stats.depthReached == 3 and stats.nodes > 0
+    # The detailed counters stay at zero, and aren't reported
+    assert stats.expandedNodes == stats.ttProbes == stats.moveGenCalls == stats.evalCalls == 0
+    assert 'cutoffRate' not in stats.asDict() and 'cutoffs' not in str(stats)
+
+
+@pytest.mark.parametrize('collectStats', [False, True])
+def test_aborted_searches_switch_statistics_off(collectStats):
+    search(maxDepth=8, nodeLimit=500, collectStats=collectStats)
+    assert MoveFinder.searchStats.depthReached < 8
+    stopEvent = threading.Event()
+    threading.Timer(0.2, stopEvent.set).start()
+    search(maxDepth=20, stopEvent=stopEvent, collectStats=collectStats)
+    assert MoveFinder.searchStats.depthReached < 20
+    # A later direct search writes to no statistics
+    gameState = GameState()
+    counts = MoveFinder.searchStats.asDict()
+    MoveFinder.findMoveNegamaxAlphaBeta(gameState, gameState.getValidMoves(), 2, -MoveFinder.CHECKMATE,
+                                        MoveFinder.CHECKMATE, 1)
+    assert MoveFinder.searchStats.asDict() == counts
@@ -0,0 +1,70 @@
+import pytest
+
+from Chess import MoveFinder
+from Chess.ChessEngine import GameState
+
+
+def findMove(gameState, text):
+    return next(move for move in gameState.getValidMoves() if move.getChessNotation() == text)
+
+
+@pytest.mark.parametrize('fen, text, expected', [
+    # Undefended knight
+    ('4k3/8/8/3n4/8/8/3Q4/4K3 w - - 0 1', 'd2d5', 3),
+    # Queen takes a pawn defended by a pawn
+    ('4k3/8/4p3/3p4/8/8/3Q4/4K3 w - - 0 1', 'd2d5', -8),
+    # The rook behind the capturing rook recaptures through it, so black doesn't take back
+    ('3rk3/8/8/3p4/8/8/3R4/3RK3 w - - 0 1', 'd2d5', 1),
+    ('3rk3/8/8/3p4/8/8/3R4/4K3 w - - 0 1', 'd2d5', -4),
+    # Black queen takes a pawn defended by a pawn
+    ('4k3/8/3q4/8/3P4/2P5/8/4K3 b - - 0 1', 'd6d4', -8),
+    # En passant: safe, taken back by a pawn, and backed up by a rook behind the captured pawn
+    ('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1', 'e5d6', 1),
+    ('4k3/2p5/8/3pP3/8/8/8/4K3 w - d6 0 1', 'e5d6', 0),
+    ('3rk3/8/8/3pP3/8/8/8/3RK3 w - d6 0 1', 'e5d6', 1),
+])
+def test_static_exchange_evaluation(fen, text, expected):
+    gameState = GameState.fromFEN(fen)
+    assert MoveFinder.staticExchangeEvaluation(gameState, findMove(gameState, text)) == expected
+
+
+def leastValuableAttackerSquare(board, squareText, color, used):
+    row, col = 8 - int(squareText[1]), 'abcdefgh'.index(squareText[0])
+    return MoveFinder.leastValuableAttacker(board, row, col, color, used)
+
+
+def test_least_valuable_attacker():
+    board = GameState.fromFEN('3rk3/8/2n5/3p4/4P3/8/3Q4/3RK3 w - - 0 1').board
+    # The pawn on e4 before the queen on d2
+    assert leastValuableAttackerSquare(board, 'd5', 'w', set()) == (4, 4)
+    assert leastValuableAttackerSquare(board, 'd5', 'w', {(4, 4)}) == (6, 3)
+    # With the queen gone the rook behind it shows up
+    assert leastValuableAttackerSquare(board, 'd5', 'w', {(4, 4), (6, 3)}) == (7, 3)
+    assert leastValuableAttackerSquare(board, 'd4', 'b', set()) == (2, 2)
+    assert leastValuableAttackerSquare(board, 'a4', 'b', set()) is None
+
+
+def quiescenceScore(gameState):
+    turnMultiplier = 1 if gameState.whiteToMove else -1
+    return MoveFinder.quiescenceSearch(gameState, -MoveFinder.CHECKMATE, MoveFinder.CHECKMATE, turnMultiplier, 0)
+
+
+@pytest.mark.parametrize('fen, capture', [
+    ('4k3/8/8/3q4/8/4N3/8/4K3 w - - 0 1', 'e3d5'),
+    ('4k3/8/2n5/8/3R4/8/8/4K3 b - - 0 1', 'c6d4'),
+])
+def test_quiescence_takes_a_hanging_piece(fen, capture):
+    gameState = GameState.fromFEN(fen)
+    turnMultiplier = 1 if gameState.whiteToMove else -1
+    standPat = turnMultiplier * MoveFinder.scoreBoard(gameState)
+    score = quiescenceScore(gameState)
+    assert gameState.toFEN() == fen
+    gameState.makeMove(findMove(gameState, capture))
+    # Nothing is left to capture, so the score is that of the position after the capture
+    assert score == turnMultiplier * MoveFinder.scoreBoard(gameState)
+    assert score > standPat + 4
+
+
+def test_quiescence_stands_pat_rather_than_lose_the_queen():
+    gameState = GameState.fromFEN('4k3/8/4p3/3p4/8/8/3Q4/4K3 w - - 0 1')
+    assert quiescenceScore(gameState) == MoveFinder.scoreBoard(gameState)
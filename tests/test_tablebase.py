@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from Chess import MoveFinder
+from Chess.ChessEngine import GameState
+from Chess.Tablebase import Tablebase, TableFile, TABLEBASE_WIN, generate
+
+
+@pytest.fixture(scope='module')
+def tableDirectory(tmp_path_factory):
+    # KQvK is the smallest table; generating it takes a while, so it is built once
+    directory = str(tmp_path_factory.mktemp('tablebases'))
+    generate('KQvK', directory, log=lambda line: None)
+    return directory
+
+
+@pytest.fixture
+def tablebase(tableDirectory):
+    tablebase = Tablebase(tableDirectory)
+    yield tablebase
+    tablebase.close()
+
+
+def test_longest_mate(tableDirectory):
+    # Mate in 10 with white to move, so 19 plies; black to move lasts one ply longer
+    table = TableFile(os.path.join(tableDirectory, 'KQvK.tb'))
+    try:
+        size = 64 ** 3
+        assert max(table[index] for index in range(size)) - 1 == 19
+        assert max(table[index] for index in range(size, 2 * size)) - 1 == 20
+    finally:
+        table.close()
+
+
+@pytest.mark.parametrize('fen, value', [
+    # Mate in one for the side with the queen, either color
+    ('k7/8/1K6/8/8/8/8/2Q5 w - - 0 1', 2),
+    ('K7/8/1k6/8/8/8/8/2q5 b - - 0 1', 2),
+    # Checkmated, and stalemated
+    ('k1Q5/8/1K6/8/8/8/8/8 b - - 0 1', 1),
+    ('k7/2Q5/1K6/8/8/8/8/8 b - - 0 1', 0),
+    # Bare kings need no table
+    ('8/8/4k3/8/8/4K3/8/8 w - - 0 1', 0),
+])
+def test_probe(tablebase, fen, value):
+    assert tablebase.probeValue(GameState.fromFEN(fen)) == value
+
+
+def test_probe_scores(tablebase):
+    assert tablebase.probeScore(GameState.fromFEN('k7/8/1K6/8/8/8/8/2Q5 w - - 0 1')) == pytest.approx(TABLEBASE_WIN - 0.01)
+    assert tablebase.probeScore(GameState.fromFEN('k1Q5/8/1K6/8/8/8/8/8 b - - 0 1')) == -TABLEBASE_WIN
+
+
+@pytest.mark.parametrize('fen', [
+    # No table for the material, castling rights, an en passant capture available
+    '4k3/8/8/8/8/8/8/R2QK3 w - - 0 1',
+    '4k3/8/8/8/8/8/8/3QK2R w K - 0 1',
+    '4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1',
+])
+def test_positions_without_a_table(tablebase, fen):
+    assert tablebase.probeValue(GameState.fromFEN(fen)) is None
+
+
+def test_best_move_mates(tablebase):
+    gameState = GameState.fromFEN('k7/8/1K6/8/8/8/8/2Q5 w - - 0 1')
+    move, score = tablebase.bestMove(gameState, gameState.getValidMoves())
+    assert move.getChessNotation() == 'c1c8'
+    gameState.makeMove(move)
+    assert gameState.getValidMoves() == [] and gameState.checkMate
+    assert score == -tablebase.probeScore(gameState)
+
+
+def test_search_plays_table_moves(tablebase, monkeypatch):
+    monkeypatch.setattr(MoveFinder, 'tablebase', tablebase)
+    gameState = GameState.fromFEN('k7/8/1K6/8/8/8/8/2Q5 w - - 0 1')
+    move = MoveFinder.findBestMove(gameState, gameState.getValidMoves(), maxDepth=3)
+    assert move.getChessNotation() == 'c1c8'
+    assert MoveFinder.searchStats.source == 'tablebase'
+
+
+@pytest.mark.parametrize('key', ['KvKQ', 'KQ', 'KPvKP'])
+def test_generate_rejects(tmp_path, key):
+    # Weaker side first, a missing king, and pawns on both sides (en passant isn't covered)
+    with pytest.raises(ValueError):
+        generate(key, str(tmp_path), log=lambda line: None)
+
+
+def test_tables_with_pawns_on_both_sides_are_skipped(tmp_path):
+    (tmp_path / 'KPvKP.tb').write_bytes(b'CTB1\x01\x00\x00')
+    tablebase = Tablebase(str(tmp_path))
+    assert tablebase.tables == {}
+    tablebase.close()
@@ -0,0 +1,86 @@
+import pytest
+
+from Chess import MoveFinder
+from Chess.ChessEngine import GameState
+from Chess.TranspositionTable import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+# A score no real search of the test position produces, so returning it means a cutoff
+STORED_SCORE = 7.77
+
+
+def bucketKeys(table, count):
+    # Keys that all land in bucket 0
+    return [table.numBuckets * i for i in range(1, count + 1)]
+
+
+def test_probe_finds_what_was_stored():
+    table = TranspositionTable(1)
+    assert table.probe(12345) is None
+    table.store(12345, 3, 0.5, EXACT, 1234)
+    assert table.probe(12345) == (12345, 3, 0.5, EXACT, 1234, 0)
+    assert (table.probes, table.hits) == (2, 1)
+
+
+def test_deepest_entry_stays_and_the_other_slot_is_always_replaced():
+    table = TranspositionTable(1)
+    deep, shallow, newer = bucketKeys(table, 3)
+    table.store(deep, 6, 1.0, EXACT, 1)
+    table.store(shallow, 2, 2.0, EXACT, 2)
+    assert table.probe(deep)[1] == 6 and table.probe(shallow)[1] == 2
+    # A second shallow entry takes the always-replace slot
+    table.store(newer, 1, 3.0, EXACT, 3)
+    assert table.probe(shallow) is None
+    assert table.probe(deep)[1] == 6 and table.probe(newer)[1] == 1
+    # Deeper (or equally deep) results take the depth-preferred slot
+    table.store(shallow, 6, 4.0, LOWER_BOUND, 4)
+    assert table.probe(deep) is None
+    assert table.probe(shallow) == (shallow, 6, 4.0, LOWER_BOUND, 4, 0)
+
+
+def test_same_position_is_overwritten_even_by_a_shallower_result():
+    table = TranspositionTable(1)
+    key = bucketKeys(table, 1)[0]
+    table.store(key, 6, 1.0, LOWER_BOUND, 1)
+    table.store(key, 2, 2.0, EXACT, 2)
+    assert table.probe(key) == (key, 2, 2.0, EXACT, 2, 0)
+
+
+def test_entries_from_older_searches_give_up_the_deep_slot():
+    table = TranspositionTable(1)
+    old, new = bucketKeys(table, 2)
+    table.store(old, 8, 1.0, EXACT, 1)
+    table.newSearch()
+    table.store(new, 1, 2.0, EXACT, 2)
+    assert table.probe(new) == (new, 1, 2.0, EXACT, 2, 1)
+    assert table.probe(old) is None
+
+
+def test_resize_and_clear():
+    table = TranspositionTable(1)
+    table.store(5, 1, 0.0, EXACT, 1)
+    table.newSearch()
+    table.resize(2)
+    assert table.numBuckets == 2 * TranspositionTable(1).numBuckets
+    assert table.probe(5) is None
+    assert table.generation == 0 and (table.probes, table.hits) == (1, 0)
+
+
+@pytest.mark.parametrize('entryDepth, bound, alpha, beta, cutoff', [
+    (2, EXACT, -1, 1, True),
+    # A lower bound at or above beta fails high; below it only raises alpha
+    (2, LOWER_BOUND, -1, 1, True),
+    (2, LOWER_BOUND, -1, 10, False),
+    # An upper bound at or below alpha fails low
+    (2, UPPER_BOUND, 10, 20, True),
+    (2, UPPER_BOUND, -1, 1, False),
+    # Results from shallower searches are only used for move ordering
+    (0, EXACT, -1, 1, False),
+])
+def test_stored_bounds_cut_the_search_off(monkeypatch, entryDepth, bound, alpha, beta, cutoff):
+    monkeypatch.setattr(MoveFinder, 'transpositionTable', TranspositionTable(1))
+    gameState = GameState()
+    MoveFinder.transpositionTable.store(gameState.zobristKey, entryDepth, STORED_SCORE, bound, None)
+    # ply 1: the root never takes a cutoff, since it has to return a move
+    score = MoveFinder.findMoveNegamaxAlphaBeta(gameState, None, 1, alpha, beta, 1, ply=1)
+    assert (score == STORED_SCORE) == cutoff
+    assert gameState.moveLog == []
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from Chess import MoveFinder
+from Chess.ChessEngine import GameState
+from Chess.Pgn import parseSAN
+from Chess.Tuner import (TABLE_OFFSET, PositionMatrix, encodeFeatures, extractPositions, loadPositions, meanError,
+                         recenter, savePositions, tune, vectorWeights, weightVector)
+
+PGN = '''[Event "Decided"]
+[Result "1-0"]
+
+1. e4 d5 2. exd5 Qxd5 3. Nc3 1-0
+
+[Event "Unfinished"]
+[Result "*"]
+
+1. d4 d5 *
+
+[Event "Drawn"]
+[FEN "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"]
+[Result "1/2-1/2"]
+
+1. Kd2 Kd7 1/2-1/2
+'''
+
+
+@pytest.fixture
+def pgnPath(tmp_path):
+    path = tmp_path / 'games.pgn'
+    path.write_text(PGN)
+    return str(path)
+
+
+def positionsBefore(fen, sanMoves):
+    # The position before each move of a game
+    gameState = GameState.fromFEN(fen)
+    positions = []
+    for san in sanMoves:
+        positions.append(gameState.toFEN())
+        gameState.makeMove(parseSAN(gameState, san, gameState.getValidMoves()))
+    return positions
+
+
+def test_extract(pgnPath):
+    indptr, features, counts, results = extractPositions([pgnPath], skipPlies=0)
+    # Every position before a move, except the one with black about to take back on d5; none
+    # from the unfinished game
+    decided = positionsBefore(GameState().toFEN(), ['e4', 'd5', 'exd5', 'Qxd5', 'Nc3'])
+    drawn = positionsBefore('4k3/8/8/8/8/8/4P3/4K3 w - - 0 1', ['Kd2', 'Kd7'])
+    expected = [decided[0], decided[1], decided[2], decided[4]] + drawn
+    assert list(results) == [1.0] * 4 + [0.5] * 2
+    assert len(indptr) == len(expected) + 1
+    matrix = PositionMatrix(indptr, features, counts)
+    scores = matrix.scores(weightVector())
+    for i, fen in enumerate(expected):
+        gameState = GameState.fromFEN(fen)
+        assert sorted(zip(*encodeFeatures(gameState.board))) == \
+            sorted(zip(features[indptr[i]:indptr[i + 1]], counts[indptr[i]:indptr[i + 1]]))
+        # The features with the current weights give back the static evaluation
+        assert scores[i] == pytest.approx(MoveFinder.scoreBoard(gameState))
+    # The opening plies are skipped, which leaves nothing of the drawn game
+    assert list(extractPositions([pgnPath], skipPlies=2)[3]) == [1.0, 1.0]
+    assert len(extractPositions([pgnPath])[3]) == 0
+
+
+def test_save_and_load(pgnPath, tmp_path):
+    data = extractPositions([pgnPath], skipPlies=0)
+    path = str(tmp_path / 'positions.npz')
+    savePositions(path, *data)
+    for saved, loaded in zip(data, loadPositions(path)):
+        assert np.array_equal(saved, loaded)
+
+
+def test_weights_round_trip():
+    vector = weightVector()
+    assert np.allclose(weightVector(vectorWeights(vector)), vector)
+
+
+def test_tune_lowers_the_error_and_recenter_keeps_scores(pgnPath):
+    indptr, features, counts, results = extractPositions([pgnPath], skipPlies=0)
+    matrix = PositionMatrix(indptr, features, counts)
+    start = weightVector()
+    tuned = tune(matrix, results, start, 1.0, iterations=20)
+    assert meanError(matrix, results, tuned, 1.0) < meanError(matrix, results, start, 1.0)
+    # Each table gets its starting average over the squares used back, and the material value
+    # takes the difference, which scores every position the same
+    used = np.zeros(len(start), dtype=bool)
+    used[features] = True
+    recentered = recenter(tuned, start, used)
+    assert np.allclose(matrix.scores(recentered), matrix.scores(tuned))
+    pawnSquares = slice(TABLE_OFFSET, TABLE_OFFSET + 64)
+    assert recentered[pawnSquares][used[pawnSquares]].mean() == \
+        pytest.approx(start[pawnSquares][used[pawnSquares]].mean())
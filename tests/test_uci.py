@@ -0,0 +1,86 @@
+import io
+
+from Chess.ChessEngine import START_FEN
+from Chess.Uci import UciEngine, parseGoLimits
+
+
+def run(engine, *lines):
+    # Send the commands, wait for any search they started and return the new output lines
+    start = engine.output.tell()
+    for line in lines:
+        assert engine.handle(line)
+    if engine.searchThread is not None:
+        engine.searchThread.join()
+    engine.output.seek(start)
+    output = engine.output.read().splitlines()
+    engine.output.seek(0, io.SEEK_END)
+    return output
+
+
+def test_handshake():
+    engine = UciEngine(io.StringIO())
+    output = run(engine, 'uci', 'isready')
+    assert output[0].startswith('id name ')
+    assert output[-2:] == ['uciok', 'readyok']
+    assert any(line.startswith('option name Threads ') for line in output)
+    assert not engine.handle('quit')
+
+
+def test_position_with_moves():
+    engine = UciEngine(io.StringIO())
+    assert run(engine, 'position startpos moves e2e4 e7e5 g1f3') == []
+    assert engine.gameState.toFEN() == 'rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2'
+    run(engine, 'position fen %s moves e2e4' % START_FEN)
+    assert engine.gameState.toFEN() == 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1'
+
+
+def test_go_depth_answers_with_a_legal_move():
+    engine = UciEngine(io.StringIO())
+    output = run(engine, 'position fen 6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1', 'go depth 3')
+    assert [line for line in output if line.startswith('info depth ')]
+    assert output[-1] == 'bestmove a1a8'
+
+
+def test_illegal_move_keeps_the_moves_before_it():
+    engine = UciEngine(io.StringIO())
+    output = run(engine, 'position startpos moves e2e4 e2e4')
+    assert output == ['info string illegal move e2e4']
+    assert len(engine.gameState.moveLog) == 1
+
+
+def test_invalid_fen_keeps_the_previous_position():
+    engine = UciEngine(io.StringIO())
+    run(engine, 'position startpos moves d2d4')
+    fen = engine.gameState.toFEN()
+    for line in ('position fen 8/8/8 w', 'position fen', 'position fen 8/8/8/8/8/8/8/8 w - - 0 1',
+                 'position fen rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+                 'position fen rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq z9 0 1'):
+        output = run(engine, line)
+        assert len(output) == 1 and output[0].startswith('info string invalid position')
+        assert engine.gameState.toFEN() == fen
+    # The engine still answers afterwards
+    assert run(engine, 'isready') == ['readyok']
+
+
+def test_invalid_go_limit_is_skipped():
+    engine = UciEngine(io.StringIO())
+    output = run(engine, 'position startpos', 'go depth x wtime abc nodes 200')
+    assert 'info string invalid value for depth: x' in output
+    assert 'info string invalid value for wtime: abc' in output
+    assert output[-1].startswith('bestmove ')
+
+
+def test_invalid_option_value():
+    engine = UciEngine(io.StringIO())
+    output = run(engine, 'setoption name Threads value many', 'isready')
+    assert output[0].startswith('info string invalid value for option Threads')
+    assert output[-1] == 'readyok'
+    assert engine.workers == 1
+
+
+def test_parse_go_limits():
+    invalid = []
+    limits = parseGoLimits('wtime 1000 btime x winc 10 movestogo 5 infinite'.split(),
+                           lambda name, text: invalid.append((name, text)))
+    assert limits == {'wtime': 1000, 'winc': 10, 'movestogo': 5, 'infinite': True}
+    assert invalid == [('btime', 'x')]